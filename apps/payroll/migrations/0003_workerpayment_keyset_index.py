@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0002_alter_workerpayment_worker'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workerpayment',
+            index=models.Index(fields=['-payment_date', '-created_at', '-id'], name='workerpayment_date_id_idx'),
+        ),
+    ]
@@ -33,6 +33,9 @@ class WorkerPayment(models.Model):
 
     class Meta:
         ordering = ['-payment_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-payment_date', '-created_at', '-id'], name='workerpayment_date_id_idx'),
+        ]
         verbose_name = 'Worker Payment'
         verbose_name_plural = 'Worker Payments'
 
@@ -13,6 +13,7 @@ from .serializers import (
     WorkerSerializer, PaymentStatsSerializer
 )
 from apps.products.permissions import IsStaff, IsOwnerOrWorker
+from apps.products.pagination import KeysetPagination
 
 User = get_user_model()
 
@@ -31,6 +32,7 @@ class WorkerListView(generics.ListAPIView):
 
 class WorkerPaymentListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsStaff]
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -38,7 +40,7 @@ class WorkerPaymentListCreateView(generics.ListCreateAPIView):
         return WorkerPaymentSerializer
 
     def get_queryset(self):
-        queryset = WorkerPayment.objects.all()
+        queryset = WorkerPayment.objects.select_related('worker', 'paid_by')
         
         # Filter by worker
         worker_id = self.request.query_params.get('worker')
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Category, Product, Review, Cart, CartItem, Order, OrderItem, ActivityLog
+from .rollups import apply_order_stats, order_stats_state
 
 
 @admin.register(Category)
@@ -49,6 +50,15 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['order_number', 'customer_name', 'customer_phone']
     readonly_fields = ['order_number', 'created_at', 'updated_at']
     inlines = [OrderItemInline]
+    
+    def save_model(self, request, obj, form, change):
+        # Daily stats are moved once the inline items are saved too
+        obj._old_stats = order_stats_state(Order.objects.get(pk=obj.pk)) if change else None
+        super().save_model(request, obj, form, change)
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        apply_order_stats(form.instance._old_stats, order_stats_state(form.instance))
 
 
 @admin.register(ActivityLog)
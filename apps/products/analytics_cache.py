@@ -0,0 +1,84 @@
+# apps/products/analytics_cache.py
+"""
+Owner analytics snapshots cached per (days window, section)
+- A section younger than ANALYTICS_CACHE_TTL is served as is
+- An older one is still served while a single background task recomputes it,
+  so owners refreshing during service don't add load on the database
+- Entries are dropped after ANALYTICS_CACHE_MAX_AGE, a missing section is computed inline
+- A section whose query failed is served once but never cached
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .tasks import run_in_background
+
+
+def get_analytics_cache():
+    return caches[getattr(settings, 'ANALYTICS_CACHE_ALIAS', 'default')]
+
+
+def section_key(days, section):
+    return f'analytics:{days}:{section}'
+
+
+def refresh_lock_key(days):
+    return f'analytics:refresh:{days}'
+
+
+def store_sections(days, computed):
+    """Cache freshly computed (data, failed) sections, returns entries for all of them by section"""
+    data, failed = computed
+    computed_at = timezone.now()
+    entries = {section: {'data': value, 'computed_at': computed_at} for section, value in data.items()}
+    get_analytics_cache().set_many(
+        {section_key(days, section): entry for section, entry in entries.items() if section not in failed},
+        getattr(settings, 'ANALYTICS_CACHE_MAX_AGE', 3600)
+    )
+    return entries
+
+
+def refresh_sections(days, sections, compute):
+    try:
+        store_sections(days, compute(days, sections))
+    finally:
+        get_analytics_cache().delete(refresh_lock_key(days))
+
+
+def schedule_refresh(days, sections, compute):
+    """Recompute sections in the background, one refresh per window at a time across workers"""
+    timeout = getattr(settings, 'ANALYTICS_REFRESH_LOCK_TIMEOUT', 300)
+    if get_analytics_cache().add(refresh_lock_key(days), True, timeout):
+        run_in_background(refresh_sections, days, list(sections), compute)
+
+
+def get_analytics_snapshot(days, sections, compute):
+    """
+    (data, meta) for a days window
+    - compute(days, sections) returns ({section: data}, failed section names) for the given sections
+    - meta holds when each section was computed and whether a refresh was queued
+    """
+    cached = get_analytics_cache().get_many([section_key(days, section) for section in sections])
+    entries = {
+        section: cached[section_key(days, section)]
+        for section in sections if section_key(days, section) in cached
+    }
+
+    missing = [section for section in sections if section not in entries]
+    if missing:
+        entries.update(store_sections(days, compute(days, missing)))
+
+    fresh_after = timezone.now() - timedelta(seconds=getattr(settings, 'ANALYTICS_CACHE_TTL', 60))
+    stale = [section for section in sections if entries[section]['computed_at'] < fresh_after]
+    if stale:
+        schedule_refresh(days, stale, compute)
+
+    data = {section: entries[section]['data'] for section in sections}
+    meta = {
+        'computed_at': min(entry['computed_at'] for entry in entries.values()),
+        'stale': bool(stale),
+        'sections': {section: entries[section]['computed_at'] for section in sections},
+    }
+    return data, meta
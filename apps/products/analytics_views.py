@@ -2,77 +2,137 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
 from .permissions import IsOwner
-from django.db.models import Count, Sum, Avg, Q
+from .analytics_cache import get_analytics_snapshot
+from django.db.models import Count, Sum, Avg, F, Q
 from django.utils import timezone
 from datetime import timedelta, datetime
 from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
-from .models import Order, OrderItem, Product, Category
+from .models import Order, OrderDailyStats, Product, ProductDailySales, Category
 from apps.user_management.models import User
 import json
 
+# Order.final_total in SQL
+FINAL_TOTAL = F('total_amount') + F('delivery_fee')
+COMPLETED = Q(status='completed')
+
+
+ANALYTICS_SECTIONS = (
+    'summary',
+    'revenue_analytics',
+    'order_analytics',
+    'product_analytics',
+    'customer_analytics',
+    'time_based_analytics',
+)
+
+
+# Longest window served, also bounds the analytics cache and lock keys
+ANALYTICS_MAX_DAYS = 365
+
+
+def get_requested_days(request):
+    """?days= clamped to 1..ANALYTICS_MAX_DAYS (default 30), anything but a whole number is a 400"""
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        raise ValidationError({'days': 'days must be a whole number.'})
+    return max(1, min(days, ANALYTICS_MAX_DAYS))
+
+
+def compute_analytics_sections(days, sections):
+    """({section: data}, failed sections) for analytics_cache, failed sections are not cached"""
+    view = OwnerAnalyticsView()
+    data = view.compute_sections(days, sections)
+    return data, view.failed_sections
+
+
+def get_analytics_snapshot_data(days):
+    """Analytics response body served from the snapshot cache, see analytics_cache.py"""
+    sections, meta = get_analytics_snapshot(days, ANALYTICS_SECTIONS, compute_analytics_sections)
+    return {'time_period': f'last_{days}_days', **sections, 'meta': meta}
+
+
 class OwnerAnalyticsView(APIView):
     permission_classes = [IsAuthenticated, IsOwner]
     
     def get(self, request):
+        # Get time period from query params (default: 30 days)
+        days = get_requested_days(request)
         try:
-            # Get time period from query params (default: 30 days)
-            days = int(request.GET.get('days', 30))
-            start_date = timezone.now() - timedelta(days=days)
-            
-            # print(f"Analytics request: {days} days from {start_date}")
-            
-            analytics_data = {
-                'time_period': f'last_{days}_days',
-                'summary': self.get_summary_stats(start_date),
-                'revenue_analytics': self.get_revenue_analytics(start_date),
-                'order_analytics': self.get_order_analytics(start_date),
-                'product_analytics': self.get_product_analytics(start_date),
-                'customer_analytics': self.get_customer_analytics(start_date),
-                'time_based_analytics': self.get_time_based_analytics(days)
-            }
-            
-            # print(f"Analytics data prepared: {analytics_data['summary']}")
-            
+            analytics_data = get_analytics_snapshot_data(days)
             return Response(analytics_data)
             
         except Exception as e:
-            # print(f"Analytics error: {str(e)}")
             return Response(
                 {'error': f'Failed to generate analytics: {str(e)}'}, 
                 status=500
             )
     
+    def compute_sections(self, days, sections):
+        """Freshly computed analytics sections for the last `days` days"""
+        start_date = timezone.now() - timedelta(days=days)
+        # Sections that fell back to zeroed data, and the period aggregates shared by sections
+        self.failed_sections = set()
+        self.period_totals = {}
+        section_methods = {
+            'summary': self.get_summary_stats,
+            'revenue_analytics': self.get_revenue_analytics,
+            'order_analytics': self.get_order_analytics,
+            'product_analytics': self.get_product_analytics,
+            'customer_analytics': self.get_customer_analytics,
+        }
+        return {
+            section: self.get_time_based_analytics(days) if section == 'time_based_analytics'
+            else section_methods[section](start_date)
+            for section in sections
+        }
+    
+    def mark_failed(self, section):
+        """Record a section that fell back to its zeroed data"""
+        self.failed_sections.add(section)
+    
+    def get_orders(self, start_date):
+        """Base queryset shared by the analytics sections"""
+        return Order.objects.filter(created_at__gte=start_date)
+    
+    def get_period_totals(self, start_date):
+        """Every summary and revenue figure for the period from one aggregate query"""
+        if start_date not in self.period_totals:
+            self.period_totals[start_date] = self.get_orders(start_date).aggregate(
+                total_orders=Count('id'),
+                completed_orders=Count('id', filter=COMPLETED),
+                online_orders=Count('id', filter=Q(order_type='online')),
+                offline_orders=Count('id', filter=Q(order_type='offline')),
+                average_order_value=Avg('total_amount', filter=COMPLETED),
+                total_revenue=Sum(FINAL_TOTAL, filter=COMPLETED),
+                online_revenue=Sum(FINAL_TOTAL, filter=COMPLETED & Q(order_type='online')),
+                offline_revenue=Sum(FINAL_TOTAL, filter=COMPLETED & Q(order_type='offline')),
+                pickup_revenue=Sum(FINAL_TOTAL, filter=COMPLETED & Q(fulfillment_method='pickup')),
+                delivery_revenue=Sum(FINAL_TOTAL, filter=COMPLETED & Q(fulfillment_method='delivery')),
+            )
+        return self.period_totals[start_date]
+    
     def get_summary_stats(self, start_date):
         """Get overall summary statistics"""
         try:
-            total_orders = Order.objects.filter(created_at__gte=start_date)
-            completed_orders = total_orders.filter(status='completed')
-            
-            # Use total_amount + delivery_fee for final total
-            total_revenue = sum(
-                order.total_amount + order.delivery_fee 
-                for order in completed_orders
-            )
-            
-            # print(f"Summary stats - Total orders: {total_orders.count()}, Revenue: {total_revenue}")
+            totals = self.get_period_totals(start_date)
             
             return {
-                'total_revenue': float(total_revenue),
-                'total_orders': total_orders.count(),
-                'completed_orders': completed_orders.count(),
-                'average_order_value': float(completed_orders.aggregate(
-                    avg=Avg('total_amount')
-                )['avg'] or 0),
-                'online_orders': total_orders.filter(order_type='online').count(),
-                'offline_orders': total_orders.filter(order_type='offline').count(),
+                'total_revenue': float(totals['total_revenue'] or 0),
+                'total_orders': totals['total_orders'],
+                'completed_orders': totals['completed_orders'],
+                'average_order_value': float(totals['average_order_value'] or 0),
+                'online_orders': totals['online_orders'],
+                'offline_orders': totals['offline_orders'],
                 'new_customers': User.objects.filter(
                     date_joined__gte=start_date,
                     is_staff=False
                 ).count()
             }
         except Exception as e:
-            # print(f" Summary stats error: {str(e)}")
+            self.mark_failed('summary')
             return {
                 'total_revenue': 0,
                 'total_orders': 0,
@@ -86,34 +146,9 @@ class OwnerAnalyticsView(APIView):
     def get_revenue_analytics(self, start_date):
         """Get revenue breakdown and trends"""
         try:
-            orders = Order.objects.filter(
-                created_at__gte=start_date,
-                status='completed'
-            )
-            
-            # Calculate revenue for each order type
-            online_revenue = sum(
-                order.total_amount + order.delivery_fee 
-                for order in orders.filter(order_type='online')
-            )
-            
-            offline_revenue = sum(
-                order.total_amount + order.delivery_fee 
-                for order in orders.filter(order_type='offline')
-            )
-            
-            # Calculate revenue by fulfillment method
-            pickup_revenue = sum(
-                order.total_amount + order.delivery_fee 
-                for order in orders.filter(fulfillment_method='pickup')
-            )
-            
-            delivery_revenue = sum(
-                order.total_amount + order.delivery_fee 
-                for order in orders.filter(fulfillment_method='delivery')
-            )
-            
-            total_revenue = online_revenue + offline_revenue
+            totals = self.get_period_totals(start_date)
+            online_revenue = totals['online_revenue'] or 0
+            offline_revenue = totals['offline_revenue'] or 0
             
             return {
                 'by_order_type': {
@@ -121,13 +156,13 @@ class OwnerAnalyticsView(APIView):
                     'offline': float(offline_revenue)
                 },
                 'by_fulfillment': {
-                    'pickup': float(pickup_revenue),
-                    'delivery': float(delivery_revenue)
+                    'pickup': float(totals['pickup_revenue'] or 0),
+                    'delivery': float(totals['delivery_revenue'] or 0)
                 },
-                'total_revenue': float(total_revenue)
+                'total_revenue': float(online_revenue + offline_revenue)
             }
         except Exception as e:
-            # print(f" Revenue analytics error: {str(e)}")
+            self.mark_failed('revenue_analytics')
             return {
                 'by_order_type': {'online': 0, 'offline': 0},
                 'by_fulfillment': {'pickup': 0, 'delivery': 0},
@@ -168,7 +203,7 @@ class OwnerAnalyticsView(APIView):
                 'completion_rate': completion_rate
             }
         except Exception as e:
-            # print(f"Order analytics error: {str(e)}")
+            self.mark_failed('order_analytics')
             return {
                 'status_distribution': [],
                 'type_distribution': [],
@@ -179,40 +214,34 @@ class OwnerAnalyticsView(APIView):
     def get_product_analytics(self, start_date):
         """Get product performance analytics"""
         try:
+            # Completed sales from the per-product daily rollup
+            sales = ProductDailySales.objects.filter(
+                date__gte=timezone.localdate(start_date),
+                status='completed'
+            )
+            
             # Top selling products
-            top_products = list(OrderItem.objects.filter(
-                order__created_at__gte=start_date,
-                order__status='completed'
-            ).values(
+            top_products = list(sales.values(
                 'product__name', 'product__category__name'
             ).annotate(
-                total_quantity=Sum('quantity'),
-                total_revenue=Sum('unit_price') * Sum('quantity')  # Calculate revenue manually
-            ).order_by('-total_quantity')[:10])
+                total_quantity=Sum('units'),
+                total_weight_kg=Sum('weight_kg'),
+                total_revenue=Sum('revenue')
+            ).filter(total_quantity__gt=0).order_by('-total_quantity')[:10])
             
-            # Fix the total_revenue calculation for each product
             for product in top_products:
+                product['total_weight_kg'] = float(product['total_weight_kg'] or 0)
                 product['total_revenue'] = float(product['total_revenue'] or 0)
             
-            # Category performance
-            category_performance = list(OrderItem.objects.filter(
-                order__created_at__gte=start_date,
-                order__status='completed'
-            ).values('product__category__name').annotate(
-                total_orders=Count('order', distinct=True),
-                total_quantity=Sum('quantity')
-            ).order_by('-total_quantity'))
+            # Category performance, total_orders counts orders per product in the category
+            category_performance = list(sales.values('product__category__name').annotate(
+                total_orders=Sum('order_count'),
+                total_quantity=Sum('units'),
+                total_revenue=Sum('revenue')
+            ).filter(total_quantity__gt=0).order_by('-total_quantity'))
             
-            # Calculate revenue for each category
             for category in category_performance:
-                category_revenue = OrderItem.objects.filter(
-                    order__created_at__gte=start_date,
-                    order__status='completed',
-                    product__category__name=category['product__category__name']
-                ).aggregate(
-                    revenue=Sum('unit_price') * Sum('quantity')
-                )['revenue'] or 0
-                category['total_revenue'] = float(category_revenue)
+                category['total_revenue'] = float(category['total_revenue'] or 0)
             
             # Low stock alerts
             low_stock_products = list(Product.objects.filter(
@@ -220,10 +249,7 @@ class OwnerAnalyticsView(APIView):
                 is_active=True
             ).values('name', 'stock_quantity', 'category__name').order_by('stock_quantity')[:10])
             
-            total_products_sold = OrderItem.objects.filter(
-                order__created_at__gte=start_date,
-                order__status='completed'
-            ).aggregate(total=Sum('quantity'))['total'] or 0
+            total_products_sold = sales.aggregate(total=Sum('units'))['total'] or 0
             
             return {
                 'top_products': top_products,
@@ -232,7 +258,7 @@ class OwnerAnalyticsView(APIView):
                 'total_products_sold': total_products_sold
             }
         except Exception as e:
-            # print(f"Product analytics error: {str(e)}")
+            self.mark_failed('product_analytics')
             return {
                 'top_products': [],
                 'category_performance': [],
@@ -243,46 +269,30 @@ class OwnerAnalyticsView(APIView):
     def get_customer_analytics(self, start_date):
         """Get customer behavior analytics"""
         try:
-            # Customer loyalty - top customers by order count
-            loyal_customers = User.objects.filter(
-                orders__created_at__gte=start_date,
-                orders__status='completed',
-                is_staff=False
-            ).annotate(
-                order_count=Count('orders')
-            ).filter(order_count__gte=1).order_by('-order_count')[:10]
-            
-            # Calculate total spent for each customer
-            top_customers_data = []
-            for customer in loyal_customers:
-                customer_orders = Order.objects.filter(
-                    user=customer,
-                    created_at__gte=start_date,
-                    status='completed'
-                )
-                total_spent = sum(
-                    order.total_amount + order.delivery_fee 
-                    for order in customer_orders
-                )
-                
-                top_customers_data.append({
-                    'name': f"{customer.first_name} {customer.last_name}",
-                    'email': customer.email,
-                    'order_count': customer.order_count,
-                    'total_spent': float(total_spent),
-                    'loyalty_points': customer.loyalty_points
-                })
-            
-            # New vs returning customers
-            total_customers = User.objects.filter(
-                orders__created_at__gte=start_date,
-                orders__status='completed',
-                is_staff=False
-            ).distinct().count()
+            # Completed orders of the period, grouped per customer in SQL
+            orders = self.get_period_customer_orders(start_date)
+            loyal_customers = list(orders.values('user_id').annotate(
+                order_count=Count('id'),
+                total_spent=Sum(FINAL_TOTAL)
+            ).order_by('-order_count', '-total_spent')[:10])
+            users = User.objects.in_bulk([row['user_id'] for row in loyal_customers])
+            
+            top_customers_data = [
+                {
+                    'name': f"{users[row['user_id']].first_name} {users[row['user_id']].last_name}",
+                    'email': users[row['user_id']].email,
+                    'order_count': row['order_count'],
+                    'total_spent': float(row['total_spent'] or 0),
+                    'loyalty_points': users[row['user_id']].loyalty_points
+                }
+                for row in loyal_customers
+            ]
             
-            # For simplicity, consider all as new customers in this period
-            new_customers = total_customers
-            returning_customers = 0
+            # New customers placed their first order in this period
+            breakdown = self.get_period_customer_totals(start_date)
+            total_customers = breakdown['total']
+            new_customers = breakdown['new']
+            returning_customers = total_customers - new_customers
             
             return {
                 'top_customers': top_customers_data,
@@ -294,7 +304,7 @@ class OwnerAnalyticsView(APIView):
                 'average_customer_value': self.get_average_customer_value(start_date)
             }
         except Exception as e:
-            # print(f" Customer analytics error: {str(e)}")
+            self.mark_failed('customer_analytics')
             return {
                 'top_customers': [],
                 'customer_breakdown': {
@@ -305,29 +315,27 @@ class OwnerAnalyticsView(APIView):
                 'average_customer_value': 0
             }
     
+    def get_period_customer_orders(self, start_date):
+        """Completed orders of non-staff customers placed since start_date"""
+        return self.get_orders(start_date).filter(COMPLETED, user__isnull=False, user__is_staff=False)
+    
+    def get_period_customer_totals(self, start_date):
+        """Customers, new customers (first order per CustomerStats) and spend of the period, one query"""
+        if ('customers', start_date) not in self.period_totals:
+            self.period_totals[('customers', start_date)] = self.get_period_customer_orders(start_date).aggregate(
+                total=Count('user', distinct=True),
+                new=Count('user', distinct=True, filter=Q(user__customer_stats__first_order_at__gte=start_date)),
+                spend=Sum(FINAL_TOTAL)
+            )
+        return self.period_totals[('customers', start_date)]
+    
     def get_average_customer_value(self, start_date):
-        """Calculate average customer lifetime value"""
+        """Average spend per customer over the period's completed orders"""
         try:
-            customers = User.objects.filter(
-                orders__created_at__gte=start_date,
-                orders__status='completed',
-                is_staff=False
-            ).distinct()
-            
-            total_revenue = 0
-            for customer in customers:
-                customer_orders = Order.objects.filter(
-                    user=customer,
-                    created_at__gte=start_date,
-                    status='completed'
-                )
-                total_revenue += sum(
-                    order.total_amount + order.delivery_fee 
-                    for order in customer_orders
-                )
-            
-            return float(total_revenue / customers.count()) if customers.count() > 0 else 0
+            totals = self.get_period_customer_totals(start_date)
+            return float(totals['spend'] / totals['total']) if totals['total'] else 0
         except:
+            self.mark_failed('customer_analytics')
             return 0
     
     def get_time_based_analytics(self, days):
@@ -340,48 +348,35 @@ class OwnerAnalyticsView(APIView):
             else:
                 return self.get_monthly_analytics(days)
         except Exception as e:
-            # print(f" Time-based analytics error: {str(e)}")
+            self.mark_failed('time_based_analytics')
             return {
                 'period': 'daily',
                 'data': []
             }
     
+    def get_period_series(self, days, trunc=None):
+        """Completed-order revenue and count per day (or trunc period), read from the daily rollup"""
+        start_date = timezone.localdate() - timedelta(days=days)
+        return list(
+            OrderDailyStats.objects.filter(date__gte=start_date, status='completed')
+            .annotate(period=trunc('date') if trunc else F('date'))
+            .values('period')
+            .annotate(revenue=Sum(F('revenue') + F('delivery_fees')), orders=Sum('order_count'))
+            .filter(orders__gt=0)
+            .order_by('period')
+        )
+    
     def get_daily_analytics(self, days):
         """Get daily revenue and order data"""
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        daily_orders = Order.objects.filter(
-            created_at__gte=start_date,
-            status='completed'
-        )
-        
-        # Group by date manually
-        dates = {}
-        for order in daily_orders:
-            date_str = order.created_at.strftime('%Y-%m-%d')
-            if date_str not in dates:
-                dates[date_str] = {
-                    'revenue': 0,
-                    'orders': 0,
-                    'order_values': []
-                }
-            
-            order_total = order.total_amount + order.delivery_fee
-            dates[date_str]['revenue'] += float(order_total)
-            dates[date_str]['orders'] += 1
-            dates[date_str]['order_values'].append(float(order_total))
-        
-        # Convert to list format
-        daily_data = []
-        for date_str, data in sorted(dates.items()):
-            avg_order_value = sum(data['order_values']) / len(data['order_values']) if data['order_values'] else 0
-            daily_data.append({
-                'date': date_str,
-                'revenue': data['revenue'],
-                'orders': data['orders'],
-                'avg_order_value': avg_order_value
-            })
+        daily_data = [
+            {
+                'date': row['period'].strftime('%Y-%m-%d'),
+                'revenue': float(row['revenue'] or 0),
+                'orders': row['orders'],
+                'avg_order_value': float(row['revenue'] or 0) / row['orders']
+            }
+            for row in self.get_period_series(days)
+        ]
         
         return {
             'period': 'daily',
@@ -390,37 +385,22 @@ class OwnerAnalyticsView(APIView):
     
     def get_weekly_analytics(self, days):
         """Get weekly revenue and order data"""
-        weekly_orders = Order.objects.filter(
-            created_at__gte=timezone.now() - timedelta(days=days),
-            status='completed'
-        )
-        
-        # Group by week manually
+        # Days come from SQL, folding them into %Y-%W weeks keeps the existing week labels
         weeks = {}
-        for order in weekly_orders:
-            week_str = order.created_at.strftime('%Y-%W')  # Year-Week number
-            if week_str not in weeks:
-                weeks[week_str] = {
-                    'revenue': 0,
-                    'orders': 0,
-                    'order_values': []
-                }
-            
-            order_total = order.total_amount + order.delivery_fee
-            weeks[week_str]['revenue'] += float(order_total)
-            weeks[week_str]['orders'] += 1
-            weeks[week_str]['order_values'].append(float(order_total))
+        for row in self.get_period_series(days):
+            week = weeks.setdefault(row['period'].strftime('%Y-%W'), {'revenue': 0, 'orders': 0})
+            week['revenue'] += float(row['revenue'] or 0)
+            week['orders'] += row['orders']
         
-        # Convert to list format
-        weekly_data = []
-        for week_str, data in sorted(weeks.items()):
-            avg_order_value = sum(data['order_values']) / len(data['order_values']) if data['order_values'] else 0
-            weekly_data.append({
+        weekly_data = [
+            {
                 'week': week_str,
                 'revenue': data['revenue'],
                 'orders': data['orders'],
-                'avg_order_value': avg_order_value
-            })
+                'avg_order_value': data['revenue'] / data['orders']
+            }
+            for week_str, data in sorted(weeks.items())
+        ]
         
         return {
             'period': 'weekly',
@@ -429,37 +409,15 @@ class OwnerAnalyticsView(APIView):
     
     def get_monthly_analytics(self, days):
         """Get monthly revenue and order data"""
-        monthly_orders = Order.objects.filter(
-            created_at__gte=timezone.now() - timedelta(days=days),
-            status='completed'
-        )
-        
-        # Group by month manually
-        months = {}
-        for order in monthly_orders:
-            month_str = order.created_at.strftime('%Y-%m')
-            if month_str not in months:
-                months[month_str] = {
-                    'revenue': 0,
-                    'orders': 0,
-                    'order_values': []
-                }
-            
-            order_total = order.total_amount + order.delivery_fee
-            months[month_str]['revenue'] += float(order_total)
-            months[month_str]['orders'] += 1
-            months[month_str]['order_values'].append(float(order_total))
-        
-        # Convert to list format
-        monthly_data = []
-        for month_str, data in sorted(months.items()):
-            avg_order_value = sum(data['order_values']) / len(data['order_values']) if data['order_values'] else 0
-            monthly_data.append({
-                'month': month_str,
-                'revenue': data['revenue'],
-                'orders': data['orders'],
-                'avg_order_value': avg_order_value
-            })
+        monthly_data = [
+            {
+                'month': row['period'].strftime('%Y-%m'),
+                'revenue': float(row['revenue'] or 0),
+                'orders': row['orders'],
+                'avg_order_value': float(row['revenue'] or 0) / row['orders']
+            }
+            for row in self.get_period_series(days, TruncMonth)
+        ]
         
         return {
             'period': 'monthly',
@@ -472,20 +430,9 @@ class ExportAnalyticsView(APIView):
     
     def get(self, request):
         """Export analytics data as JSON"""
+        days = get_requested_days(request)
         try:
-            days = int(request.GET.get('days', 30))
-            start_date = timezone.now() - timedelta(days=days)
-            
-            analytics_view = OwnerAnalyticsView()
-            analytics_data = {
-                'time_period': f'last_{days}_days',
-                'summary': analytics_view.get_summary_stats(start_date),
-                'revenue_analytics': analytics_view.get_revenue_analytics(start_date),
-                'order_analytics': analytics_view.get_order_analytics(start_date),
-                'product_analytics': analytics_view.get_product_analytics(start_date),
-                'customer_analytics': analytics_view.get_customer_analytics(start_date),
-                'time_based_analytics': analytics_view.get_time_based_analytics(days)
-            }
+            analytics_data = get_analytics_snapshot_data(days)
             
             response = Response(analytics_data)
             response['Content-Disposition'] = f'attachment; filename="analytics_{days}_days.json"'
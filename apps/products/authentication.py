@@ -0,0 +1,39 @@
+# apps/products/authentication.py
+from django.conf import settings
+from django.core import signing
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
+
+from apps.user_management.models import User
+
+ORDER_FEED_TOKEN_SALT = 'products.order-feed'
+
+
+def issue_order_feed_token(user):
+    """Short-lived token that only opens the order event stream, see OrderFeedTokenAuthentication"""
+    return signing.dumps({'user_id': user.pk}, salt=ORDER_FEED_TOKEN_SALT)
+
+
+class OrderFeedTokenAuthentication(BaseAuthentication):
+    """
+    ?token= from issue_order_feed_token, EventSource can't send an Authorization header
+    - The token ends up in access logs, so it is scoped to the feed and expires after
+      ORDER_FEED_TOKEN_TTL seconds, the access JWT never goes in the URL
+    - Reconnects get no longer window, on a 401 the client fetches a new token from
+      OrderFeedTokenView and reopens the stream with ?after=<last event id>
+    """
+
+    def authenticate(self, request):
+        token = request.query_params.get('token')
+        if not token:
+            return None
+        try:
+            data = signing.loads(
+                token, salt=ORDER_FEED_TOKEN_SALT, max_age=getattr(settings, 'ORDER_FEED_TOKEN_TTL', 300)
+            )
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed('Invalid or expired feed token.')
+        user = User.objects.filter(pk=data.get('user_id'), is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid or expired feed token.')
+        return user, None
@@ -0,0 +1,103 @@
+# apps/products/cache.py
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def new_catalog_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_catalog_version():
+    """Current catalog version, a fresh one is set the first time it is read"""
+    cache = get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, new_catalog_version(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cached catalog response by moving to a new version
+    - A random version set in one write instead of cache.incr, which is a
+      read-modify-write on the file cache; concurrent bumps still each leave a new value
+    """
+    version = new_catalog_version()
+    get_catalog_cache().set(CATALOG_VERSION_KEY, version, None)
+    return version
+
+
+def notify_catalog_changed():
+    """
+    Call whenever Product or Category rows change, stock moves included
+    - Cached responses carry stock_quantity while the ETag is built from the
+      live rows, a stale body must never be served under a fresh ETag
+    - The version is bumped after commit so a concurrent reader can't cache
+      the old rows under the new version
+    - The static menu is re-published in the background
+    """
+    from .menu import schedule_menu_publish
+
+    transaction.on_commit(bump_catalog_version)
+    transaction.on_commit(schedule_menu_publish)
+
+
+def catalog_cache_key(name, request, params, url_kwargs=None):
+    """Build a cache key from the normalized query parameters of a catalog request"""
+    query = []
+    for param in sorted(params):
+        value = request.query_params.get(param)
+        if value is None:
+            continue
+        value = value.strip()
+        if param != 'search':
+            value = value.lower()
+        if value:
+            query.append(f'{param}={value}')
+
+    # Image URLs are absolute, so the host is part of the response
+    parts = [request.scheme, request.get_host(), name]
+    parts += [f'{key}={value}' for key, value in sorted((url_kwargs or {}).items())]
+    parts += query
+    digest = hashlib.md5('&'.join(parts).encode('utf-8')).hexdigest()
+    return f'catalog:v{get_catalog_version()}:{name}:{digest}'
+
+
+class CatalogCacheMixin:
+    """
+    Cache the serialized GET response of a public catalog view
+    - Keyed on the normalized query string (catalog_cache_params)
+    - Entries are invalidated by notify_catalog_changed()
+    """
+    catalog_cache_name = None
+    catalog_cache_params = ()
+
+    def get(self, request, *args, **kwargs):
+        cache = get_catalog_cache()
+        key = catalog_cache_key(
+            self.catalog_cache_name or self.__class__.__name__,
+            request,
+            self.catalog_cache_params,
+            kwargs
+        )
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return response
@@ -0,0 +1,345 @@
+# apps/products/cart_store.py
+"""
+Optional cache-backed working cart (CART_STORE = 'cache')
+- Quantity / instruction changes and removals only touch the cache, the Cart/CartItem
+  tables are written behind them by a background flush
+- A new line is inserted right away so its id is the CartItem pk, ids held by clients
+  stay valid across flushes, evictions and reloads
+- Checkout flushes synchronously before the order is built from the tables
+- With the default CART_STORE = 'database' none of this is used
+"""
+import fcntl
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import APIException
+
+from .models import Cart, CartItem, Product
+from .tasks import run_after_commit
+
+
+_pending_lock = threading.Lock()
+_pending_flushes = set()
+
+
+def is_cart_store_enabled():
+    return getattr(settings, 'CART_STORE', 'database') == 'cache'
+
+
+def get_cart_cache_alias():
+    return getattr(settings, 'CART_CACHE_ALIAS', 'carts')
+
+
+def get_cart_cache():
+    return caches[get_cart_cache_alias()]
+
+
+def cart_key(user_id):
+    # v2: line ids are CartItem pks
+    return f'cart:v2:user:{user_id}'
+
+
+class CartBusy(APIException):
+    """The cart lock wasn't acquired in time, nothing was changed"""
+    status_code = 409
+    default_detail = 'The cart is being updated by another request, please retry.'
+    default_code = 'cart_busy'
+
+
+@contextmanager
+def file_lock(path, wait):
+    """flock on path, shared by every process on the host"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as handle:
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    raise CartBusy()
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+@contextmanager
+def cache_lock(cache, key, timeout, wait):
+    """
+    cache.add based lock, atomic on locmem / memcached / redis
+    - The value is a token of this holder, the lock is only released by the holder that set it
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not cache.add(key, token, timeout):
+        if time.monotonic() > deadline:
+            # The holder still has it, a crashed one lets it expire after `timeout`
+            raise CartBusy()
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        # Past `timeout` another request may hold the key, leave its lock alone
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def cart_lock(user_id, timeout=5, wait=2.0):
+    """
+    Serialize read-modify-write of one user's cart across workers
+    - Raises CartBusy (409) when the lock isn't free within `wait` seconds
+    - FileBasedCache.add is a check-then-write, so that backend locks a file next to the cache
+    """
+    cache = get_cart_cache()
+    if isinstance(cache, FileBasedCache):
+        location = settings.CACHES[get_cart_cache_alias()]['LOCATION']
+        return file_lock(os.path.join(location, 'locks', f'cart-{user_id}.lock'), wait)
+    return cache_lock(cache, f'{cart_key(user_id)}:lock', timeout, wait)
+
+
+def normalize_weight(weight_kg):
+    if weight_kg in (None, ''):
+        return None
+    return str(Decimal(str(weight_kg)).quantize(Decimal('0.001')))
+
+
+def state_from_database(user_id):
+    """Working cart built from the tables, used on a cache miss"""
+    cart = Cart.objects.with_contents().filter(user_id=user_id).first()
+    now = timezone.now().isoformat()
+    if cart is None:
+        return {'cart_id': None, 'created_at': now, 'updated_at': now, 'dirty': False, 'items': []}
+
+    items = [
+        {
+            'id': item.id,
+            'product': item.product_id,
+            'product_name': item.product.name,
+            'quantity': item.quantity,
+            'weight_kg': normalize_weight(item.weight_kg),
+            'special_instructions': item.special_instructions,
+            'created_at': item.created_at.isoformat(),
+        }
+        for item in cart.items.all()
+    ]
+    return {
+        'cart_id': cart.id,
+        'created_at': cart.created_at.isoformat(),
+        'updated_at': cart.updated_at.isoformat(),
+        'dirty': False,
+        'items': items,
+    }
+
+
+def load(user_id):
+    state = get_cart_cache().get(cart_key(user_id))
+    if state is None:
+        state = state_from_database(user_id)
+        get_cart_cache().add(cart_key(user_id), state, getattr(settings, 'CART_CACHE_TIMEOUT', 604800))
+    return state
+
+
+def _save(user_id, state):
+    # Callers schedule the flush once the lock is released
+    state['dirty'] = True
+    state['updated_at'] = timezone.now().isoformat()
+    get_cart_cache().set(cart_key(user_id), state, getattr(settings, 'CART_CACHE_TIMEOUT', 604800))
+
+
+def find_item(state, item_id):
+    for item in state['items']:
+        if item['id'] == item_id:
+            return item
+    return None
+
+
+def insert_line(state, user_id, product, quantity, weight, special_instructions):
+    """
+    Write a new line to CartItem now, its pk is the id clients use from then on
+    - A row of the same product and weight whose removal wasn't flushed yet is
+      revived instead, a second row would break unique_together
+    """
+    if state['cart_id'] is None:
+        cart, created = Cart.objects.get_or_create(user_id=user_id)
+        state['cart_id'] = cart.pk
+    weight_kg = Decimal(weight) if weight else None
+    row = CartItem.objects.filter(cart_id=state['cart_id'], product=product, weight_kg=weight_kg).first()
+    if row is None:
+        row = CartItem.objects.create(
+            cart_id=state['cart_id'],
+            product=product,
+            quantity=quantity,
+            weight_kg=weight_kg,
+            special_instructions=special_instructions,
+        )
+    else:
+        row.quantity = quantity
+        row.special_instructions = special_instructions
+        row.save(update_fields=['quantity', 'special_instructions', 'updated_at'])
+    return {
+        'id': row.pk,
+        'product': product.id,
+        'product_name': product.name,
+        'quantity': quantity,
+        'weight_kg': weight,
+        'special_instructions': special_instructions,
+        'created_at': row.created_at.isoformat(),
+    }
+
+
+def add_item(user_id, product, quantity, weight_kg=None, special_instructions=''):
+    """Add a line, or raise the quantity of the line with the same product and weight"""
+    weight = normalize_weight(weight_kg) if product.is_weight_based else None
+    with cart_lock(user_id):
+        state = load(user_id)
+        item = next(
+            (line for line in state['items'] if line['product'] == product.id and line['weight_kg'] == weight),
+            None
+        )
+        if item is None:
+            item = insert_line(state, user_id, product, quantity, weight, special_instructions or '')
+            state['items'].append(item)
+        else:
+            item['quantity'] += quantity
+            if special_instructions:
+                item['special_instructions'] = special_instructions
+        _save(user_id, state)
+    schedule_flush(user_id)
+    return item
+
+
+def update_item(user_id, item_id, **changes):
+    with cart_lock(user_id):
+        state = load(user_id)
+        item = find_item(state, item_id)
+        if item is None:
+            return None
+        item.update(changes)
+        _save(user_id, state)
+    schedule_flush(user_id)
+    return item
+
+
+def remove_item(user_id, item_id):
+    with cart_lock(user_id):
+        state = load(user_id)
+        item = find_item(state, item_id)
+        if item is None:
+            return None
+        state['items'].remove(item)
+        _save(user_id, state)
+    schedule_flush(user_id)
+    return item
+
+
+def clear(user_id):
+    with cart_lock(user_id):
+        state = load(user_id)
+        state['items'] = []
+        _save(user_id, state)
+    schedule_flush(user_id)
+
+
+def discard(user_id):
+    """Forget the working cart, the next read reloads it from the tables"""
+    get_cart_cache().delete(cart_key(user_id))
+
+
+class CartSnapshot:
+    """Cart-shaped object CartSerializer can render straight from the cache"""
+
+    def __init__(self, user, state, products):
+        self.id = state['cart_id']
+        self.user = user
+        self.created_at = parse_datetime(state['created_at'])
+        self.updated_at = parse_datetime(state['updated_at'])
+        self.items = []
+        for line in state['items']:
+            product = products.get(line['product'])
+            if product is None:
+                continue
+            self.items.append(CartItem(
+                id=line['id'],
+                product=product,
+                quantity=line['quantity'],
+                weight_kg=Decimal(line['weight_kg']) if line['weight_kg'] else None,
+                special_instructions=line['special_instructions'],
+                created_at=parse_datetime(line['created_at']),
+            ))
+        self.total_price = sum((item.total_price for item in self.items), 0)
+        self.total_quantity = sum(item.quantity for item in self.items)
+
+
+def snapshot(user):
+    state = load(user.id)
+    products = Product.objects.in_bulk({line['product'] for line in state['items']})
+    return CartSnapshot(user, state, products)
+
+
+def flush(user_id):
+    """Write the working cart to Cart/CartItem, lines are matched on their CartItem pk"""
+    # Held for the whole write so a late background flush can't race checkout
+    with cart_lock(user_id):
+        state = get_cart_cache().get(cart_key(user_id))
+        if state is None or not state['dirty']:
+            return False
+        
+        wanted = {line['id']: line for line in state['items']}
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(user_id=user_id)
+            existing = {item.pk: item for item in cart.items.all()}
+            stale = [pk for pk in existing if pk not in wanted]
+            if stale:
+                CartItem.objects.filter(pk__in=stale).delete()
+            
+            changed = []
+            now = timezone.now()
+            for pk, line in wanted.items():
+                item = existing.get(pk)
+                if item is None:
+                    # The row went away under the cache (e.g. deleted in the admin), drop the line
+                    state['items'].remove(line)
+                elif (item.quantity, item.special_instructions) != (line['quantity'], line['special_instructions']):
+                    item.quantity = line['quantity']
+                    item.special_instructions = line['special_instructions']
+                    item.updated_at = now
+                    changed.append(item)
+            CartItem.objects.bulk_update(changed, ['quantity', 'special_instructions', 'updated_at'])
+            Cart.objects.filter(pk=cart.pk).update(updated_at=now)
+        
+        state['dirty'] = False
+        state['cart_id'] = cart.pk
+        get_cart_cache().set(cart_key(user_id), state, getattr(settings, 'CART_CACHE_TIMEOUT', 604800))
+    return True
+
+
+def _flush_pending(user_id):
+    with _pending_lock:
+        _pending_flushes.discard(user_id)
+    try:
+        flush(user_id)
+    except CartBusy:
+        # A request holds the cart, try again once it's done
+        schedule_flush(user_id)
+
+
+def schedule_flush(user_id):
+    """Queue a background flush, mutations arriving before it runs share it"""
+    with _pending_lock:
+        if user_id in _pending_flushes:
+            return
+        _pending_flushes.add(user_id)
+    run_after_commit(_flush_pending, user_id)
@@ -0,0 +1,54 @@
+# apps/products/conditional.py
+import calendar
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    """
+    Answer If-None-Match / If-Modified-Since on read-only list and detail views
+    - Validators come from max(updated_at) and row counts of the underlying querysets
+    - A matching request gets a 304 before anything is serialized
+    """
+
+    def get_validator_querysets(self):
+        """Return (queryset, timestamp fields) pairs that the response depends on"""
+        return [(self.filter_queryset(self.get_queryset()), ('updated_at',))]
+
+    def get_validators(self, request, url_kwargs):
+        values = [request.get_host(), request.get_full_path()]
+        last_modified = None
+
+        for queryset, fields in self.get_validator_querysets():
+            aggregates = {f'latest_{index}': Max(field) for index, field in enumerate(fields)}
+            row = queryset.order_by().aggregate(row_count=Count('pk'), **aggregates)
+            values.append(row['row_count'])
+
+            for index in range(len(fields)):
+                timestamp = row[f'latest_{index}']
+                values.append(timestamp.isoformat() if timestamp else '')
+                if timestamp and (last_modified is None or timestamp > last_modified):
+                    last_modified = timestamp
+
+        digest = hashlib.md5('|'.join(str(value) for value in values).encode('utf-8')).hexdigest()
+        etag = f'"{digest}"'
+        if last_modified is not None:
+            last_modified = calendar.timegm(last_modified.utctimetuple())
+        return etag, last_modified
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, kwargs)
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
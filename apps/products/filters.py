@@ -0,0 +1,24 @@
+# apps/products/filters.py
+from rest_framework.filters import OrderingFilter
+
+
+class CatalogOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that maps public ordering names onto stored columns
+    - average_rating -> rating_average (ties broken by rating_count)
+    - review_count -> rating_count
+    - popularity -> sales_count
+    """
+    ordering_aliases = {
+        'average_rating': ('rating_average', 'rating_count'),
+        'review_count': ('rating_count',),
+        'popularity': ('sales_count',),
+    }
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        ordering = []
+        for term in super().remove_invalid_fields(queryset, fields, view, request):
+            prefix = '-' if term.startswith('-') else ''
+            name = term.lstrip('-')
+            ordering += [prefix + column for column in self.ordering_aliases.get(name, (name,))]
+        return ordering
@@ -0,0 +1,168 @@
+# apps/products/idempotency.py
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def hash_request_data(request):
+    """Stable hash of the parsed payload, uploaded files count by name and size"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        payload = {key: values if len(values) != 1 else values[0] for key, values in data.lists()}
+    else:
+        payload = data
+    files = sorted((name, upload.name, upload.size) for name, upload in request.FILES.items())
+    body = json.dumps(
+        {'path': request.path, 'data': payload, 'files': files},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def get_lease_expiry():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+
+def in_flight_response():
+    return Response(
+        {'error': f'A request with this {IDEMPOTENCY_HEADER} is still being processed'},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+class IdempotentCreateMixin:
+    """
+    Idempotency-Key support for POST endpoints
+    - The first request with a key runs normally, a successful (< 400) response is stored
+    - A retry with the same key and payload gets the stored bytes back without
+      running validation, stock updates or logging again
+    - Client and server errors are not stored, e.g. "insufficient stock" can be retried
+    - The same key with another payload is rejected, a key still in flight gets a 409
+      until its IDEMPOTENCY_LOCK_TIMEOUT lease lapses, then a retry takes it over
+    """
+    idempotency_scope = None
+
+    def get_idempotency_scope(self):
+        return self.idempotency_scope or self.__class__.__name__
+
+    def post(self, request, *args, **kwargs):
+        self.idempotency_record = None
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return super().post(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user = request.user if request.user.is_authenticated else None
+        request_hash = hash_request_data(request)
+        record, replay = self.claim_idempotency_key(key, user, request_hash)
+        if replay is not None:
+            return replay
+
+        self.idempotency_record = record
+        return super().post(request, *args, **kwargs)
+
+    def claim_idempotency_key(self, key, user, request_hash):
+        """Insert the key, or return (None, response) when it already exists"""
+        scope = self.get_idempotency_scope()
+        ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    return IdempotencyKey.objects.create(
+                        scope=scope,
+                        key=key,
+                        user=user,
+                        request_hash=request_hash,
+                        locked_until=get_lease_expiry(),
+                        expires_at=timezone.now() + timedelta(seconds=ttl)
+                    ), None
+            except IntegrityError:
+                existing = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+                if existing is None or existing.is_expired:
+                    IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__lte=timezone.now()).delete()
+                    continue
+                return self.replay_response(existing, user, request_hash)
+        return None, in_flight_response()
+
+    def replay_response(self, record, user, request_hash):
+        """(record, None) when a lapsed in-flight key was taken over, else (None, response)"""
+        if record.user_id != (user.pk if user else None) or record.request_hash != request_hash:
+            return None, Response(
+                {'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record.status_code is None:
+            return self.take_over_lapsed_key(record)
+        response = HttpResponse(
+            bytes(record.response_body),
+            status=record.status_code,
+            content_type=record.content_type or None
+        )
+        response['Idempotent-Replayed'] = 'true'
+        return None, response
+
+    def take_over_lapsed_key(self, record):
+        """Renew the lease of a key whose request died mid-flight, one retry wins the UPDATE"""
+        now = timezone.now()
+        if record.locked_until is not None and record.locked_until > now:
+            return None, in_flight_response()
+        locked_until = get_lease_expiry()
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, status_code__isnull=True, locked_until=record.locked_until
+        ).update(locked_until=locked_until)
+        if not taken:
+            return None, in_flight_response()
+        record.locked_until = locked_until
+        return record, None
+
+    def held_idempotency_key(self, record):
+        """The key row, as long as no retry took it over after our lease lapsed"""
+        return IdempotencyKey.objects.filter(pk=record.pk, locked_until=record.locked_until)
+
+    def handle_exception(self, exc):
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Unhandled errors leave nothing to replay, let the client retry
+            record = getattr(self, 'idempotency_record', None)
+            if record is not None:
+                self.held_idempotency_key(record).delete()
+                self.idempotency_record = None
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record = getattr(self, 'idempotency_record', None)
+        if record is None:
+            return response
+
+        self.idempotency_record = None
+        if response.status_code >= 400:
+            self.held_idempotency_key(record).delete()
+            return response
+
+        if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+            response.render()
+        self.held_idempotency_key(record).update(
+            status_code=response.status_code,
+            content_type=response.get('Content-Type', ''),
+            response_body=response.content,
+            locked_until=None
+        )
+        return response
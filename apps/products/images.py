@@ -0,0 +1,125 @@
+# apps/products/images.py
+import hashlib
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import notify_catalog_changed
+
+
+DEFAULT_IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+
+# (extension, Pillow format, quality)
+IMAGE_FORMATS = (
+    ('webp', 'WEBP', 80),
+    ('jpeg', 'JPEG', 82),
+)
+
+
+def get_variant_widths():
+    return getattr(settings, 'IMAGE_VARIANT_WIDTHS', DEFAULT_IMAGE_VARIANTS)
+
+
+def needs_variants(image, variants):
+    """True when the stored variants were not generated from the current image"""
+    return bool(image) and (variants or {}).get('source') != image.name
+
+
+def open_rgb_image(data):
+    image = Image.open(BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Flatten transparency onto white, JPEG has no alpha channel
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_variants(field_file):
+    """
+    Resize an uploaded image into WebP and JPEG variants
+    - Files are content-addressed: <upload dir>/derivatives/<sha256 prefix>/<variant>.<ext>
+    - Existing files are reused, so regenerating the same upload writes nothing
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        data = source.read()
+
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    directory = os.path.join(os.path.dirname(field_file.name), 'derivatives', digest)
+    image = open_rgb_image(data)
+
+    variants = {'source': field_file.name, 'hash': digest, 'sizes': {}}
+    for name, width in sorted(get_variant_widths().items(), key=lambda item: item[1]):
+        resized = image
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+
+        files = {'width': resized.width, 'height': resized.height}
+        for extension, image_format, quality in IMAGE_FORMATS:
+            path = os.path.join(directory, f'{name}.{extension}').replace(os.sep, '/')
+            if not storage.exists(path):
+                buffer = BytesIO()
+                resized.save(buffer, format=image_format, quality=quality, optimize=True)
+                path = storage.save(path, ContentFile(buffer.getvalue()))
+            files[extension] = path
+        variants['sizes'][name] = files
+
+    return variants
+
+
+def generate_image_variants(model_label, pk, force=False):
+    """Background task: build the variants of one Product/Category image and store them"""
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only('pk', 'image', 'image_variants').first()
+    if instance is None or not instance.image:
+        return None
+    if not force and not needs_variants(instance.image, instance.image_variants):
+        return instance.image_variants
+
+    variants = generate_variants(instance.image)
+
+    # Only store the result if the image wasn't replaced in the meantime
+    updated = model.objects.filter(pk=pk, image=instance.image.name).update(
+        image_variants=variants,
+        updated_at=timezone.now()
+    )
+    if updated:
+        notify_catalog_changed()
+    return variants
+
+
+def build_image_srcset(variants, request=None):
+    """srcset strings per format, e.g. {'webp': '/media/...thumbnail.webp 160w, ...'}"""
+    sizes = (variants or {}).get('sizes')
+    if not sizes:
+        return None
+
+    from django.core.files.storage import default_storage
+
+    def url(path):
+        location = default_storage.url(path)
+        return request.build_absolute_uri(location) if request is not None else location
+
+    ordered = sorted(sizes.items(), key=lambda item: item[1]['width'])
+    srcset = {
+        extension: ', '.join(f"{url(files[extension])} {files['width']}w" for _, files in ordered)
+        for extension, _, _ in IMAGE_FORMATS
+    }
+    srcset['variants'] = {
+        name: {extension: url(files[extension]) for extension, _, _ in IMAGE_FORMATS}
+        for name, files in ordered
+    }
+    return srcset
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.images import generate_image_variants, needs_variants
+from apps.products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for product and category images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate variants even when they are up to date'
+        )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        for model in (Category, Product):
+            generated = 0
+            for instance in model.objects.exclude(image='').exclude(image__isnull=True).iterator():
+                if not force and not needs_variants(instance.image, instance.image_variants):
+                    continue
+                try:
+                    generate_image_variants(model._meta.label, instance.pk, force=force)
+                    generated += 1
+                except Exception as exc:
+                    self.stderr.write(f'{model.__name__} {instance.pk}: {exc}')
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural.capitalize()}: {generated} image(s) processed'
+            ))
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.products.outbox import process_batch
+
+
+class Command(BaseCommand):
+    help = 'Process pending order outbox events (activity logs, loyalty points)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the pending events and exit')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'OUTBOX_BATCH_SIZE', 100))
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the outbox is empty')
+
+    def handle(self, *args, **options):
+        total_processed = total_failed = 0
+        while True:
+            processed, failed = process_batch(options['batch_size'])
+            total_processed += processed
+            total_failed += failed
+            if processed or failed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {total_processed} outbox event(s), {total_failed} failed'
+        ))
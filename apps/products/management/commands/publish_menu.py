@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.menu import get_menu_root, publish_menu
+
+
+class Command(BaseCommand):
+    help = 'Publish the public menu as precompressed static JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Write the files even when the menu did not change'
+        )
+
+    def handle(self, *args, **options):
+        manifest = publish_menu(force=options['force'])
+        if manifest is None:
+            self.stdout.write('Menu unchanged, nothing published')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {manifest['file']} ({manifest['size']} bytes) to {get_menu_root()}"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.outbox import purge_done_events
+
+
+class Command(BaseCommand):
+    help = 'Delete processed outbox events older than OUTBOX_RETENTION_DAYS'
+
+    def handle(self, *args, **options):
+        deleted = purge_done_events()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} processed outbox event(s)'))
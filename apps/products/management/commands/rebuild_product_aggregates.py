@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.services import ProductAggregateService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized rating aggregates and sales counts stored on products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        updated = ProductAggregateService.rebuild_rating_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rating aggregates rebuilt ({updated} products updated)'))
+
+        updated = ProductAggregateService.rebuild_sales_counts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Sales counts rebuilt ({updated} products updated)'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt ({indexed} products indexed)'))
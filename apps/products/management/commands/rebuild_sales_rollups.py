@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.products.rollups import (
+    rebuild_customer_stats, rebuild_order_daily_stats, rebuild_product_daily_sales
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the sales rollup tables and customer stats from the orders (backfill / repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only rebuild the last N days (default: everything)')
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options['days']:
+            start_date = timezone.localdate() - timedelta(days=options['days'] - 1)
+
+        rows = rebuild_order_daily_stats(start_date)
+        self.stdout.write(self.style.SUCCESS(f'Order daily stats rebuilt ({rows} rows)'))
+
+        rows = rebuild_product_daily_sales(start_date)
+        self.stdout.write(self.style.SUCCESS(f'Product daily sales rebuilt ({rows} rows)'))
+
+        # Lifetime figures, --days doesn't apply
+        rows = rebuild_customer_stats()
+        self.stdout.write(self.style.SUCCESS(f'Customer stats rebuilt ({rows} customers)'))
@@ -0,0 +1,158 @@
+# apps/products/menu.py
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from urllib.parse import urljoin
+
+import brotli
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .tasks import run_in_background
+
+
+MANIFEST_NAME = 'manifest.json'
+
+_state_lock = threading.Lock()
+_publish_lock = threading.Lock()
+_publish_queued = False
+
+
+class MediaURLBuilder:
+    """Stand-in for the request so serializers render absolute media URLs outside a request"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def build_absolute_uri(self, location):
+        return urljoin(self.base_url, location) if self.base_url else location
+
+
+def get_menu_root():
+    return getattr(settings, 'MENU_PUBLISH_ROOT', None) or os.path.join(settings.STATIC_ROOT, 'menu')
+
+
+def is_menu_publishing_enabled():
+    return getattr(settings, 'MENU_PUBLISH_ENABLED', True) and bool(settings.STATIC_ROOT)
+
+
+def build_menu():
+    """Public menu in the same shapes as the category and product list endpoints"""
+    from .models import Category, Product
+    from .serializers import CategorySerializer, ProductListSerializer
+
+    context = {'request': MediaURLBuilder(getattr(settings, 'MENU_MEDIA_BASE_URL', ''))}
+    categories = Category.objects.filter(is_active=True).annotate(
+        product_count=Count('products')
+    ).order_by('name', 'pk')
+    products = Product.objects.filter(
+        is_active=True, show=True, stock_quantity__gt=0
+    ).select_related('category').order_by('name', 'pk')
+
+    return {
+        'categories': CategorySerializer(categories, many=True, context=context).data,
+        'products': ProductListSerializer(products, many=True, context=context).data,
+    }
+
+
+def _write_atomic(path, content):
+    # A temp file of its own per writer, concurrent publishes can't interleave
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.menu-', delete=False) as handle:
+        handle.write(content)
+    try:
+        os.chmod(handle.name, 0o644)
+        os.replace(handle.name, path)
+    except OSError:
+        os.remove(handle.name)
+        raise
+
+
+def _prune(root, keep):
+    """Drop all but the newest `keep` menu versions"""
+    versions = sorted(
+        (name for name in os.listdir(root) if name.startswith('menu.') and name.endswith('.json')),
+        key=lambda name: os.path.getmtime(os.path.join(root, name)),
+        reverse=True
+    )
+    for name in versions[keep:]:
+        for suffix in ('', '.gz', '.br'):
+            try:
+                os.remove(os.path.join(root, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def publish_menu(force=False):
+    """
+    Render the menu to <MENU_PUBLISH_ROOT>/menu.<hash>.json (+ .gz / .br)
+    - The file name is the content hash, so it can be cached forever
+    - manifest.json points at the current version
+    - Nothing is written when the content hash didn't change
+    """
+    root = get_menu_root()
+    os.makedirs(root, exist_ok=True)
+
+    body = JSONRenderer().render(build_menu())
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    name = f'menu.{digest}.json'
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+
+    if not force and os.path.exists(os.path.join(root, name)):
+        try:
+            with open(manifest_path, 'rb') as handle:
+                if json.load(handle).get('version') == digest:
+                    return None
+        except (OSError, ValueError):
+            pass
+
+    path = os.path.join(root, name)
+    _write_atomic(path, body)
+    _write_atomic(f'{path}.gz', gzip.compress(body, compresslevel=9, mtime=0))
+    _write_atomic(f'{path}.br', brotli.compress(body))
+
+    manifest = {
+        'version': digest,
+        'file': name,
+        'size': len(body),
+        'encodings': ['gzip', 'br'],
+        'published_at': timezone.now().isoformat(),
+    }
+    _write_atomic(manifest_path, json.dumps(manifest).encode('utf-8'))
+    _prune(root, getattr(settings, 'MENU_KEEP_VERSIONS', 3))
+    return manifest
+
+
+def _publish_queued_menu():
+    global _publish_queued
+    # Clear the flag first, changes committed while publishing queue another run
+    with _state_lock:
+        _publish_queued = False
+    with _publish_lock:
+        publish_menu()
+
+
+def schedule_menu_publish():
+    """
+    Queue a background re-publish MENU_PUBLISH_DELAY seconds from now
+    - Runs on every catalog change, stock moves included, as the menu carries stock_quantity
+    - A burst of catalog changes inside the delay shares one publish
+    """
+    global _publish_queued
+    if not is_menu_publishing_enabled():
+        return
+    with _state_lock:
+        if _publish_queued:
+            return
+        _publish_queued = True
+    delay = getattr(settings, 'MENU_PUBLISH_DELAY', 10)
+    if delay and not getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        timer = threading.Timer(delay, run_in_background, args=(_publish_queued_menu,))
+        timer.daemon = True
+        timer.start()
+    else:
+        run_in_background(_publish_queued_menu)
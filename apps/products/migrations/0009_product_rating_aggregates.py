@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:36
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+    totals = Review.objects.filter(is_active=True).values('product_id').annotate(
+        rating_sum=Sum('rating'),
+        rating_count=Count('id')
+    ).order_by()
+    for row in totals:
+        Product.objects.filter(pk=row['product_id']).update(
+            rating_sum=row['rating_sum'],
+            rating_count=row['rating_count'],
+            rating_average=round(row['rating_sum'] / row['rating_count'], 1)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_alter_product_options_alter_cartitem_weight_kg_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 shadow table only exists on SQLite, other databases use the icontains fallback
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5("
+        "name, description, category_name, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO products_product_fts (rowid, name, description, category_name) "
+        "SELECT p.id, p.name, p.description, c.name FROM products_product p "
+        "JOIN products_category c ON c.id = p.category_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS products_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:40
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_sales_counts(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    OrderItem = apps.get_model('products', 'OrderItem')
+    totals = OrderItem.objects.values('product_id').annotate(units=Sum('quantity')).order_by()
+    for row in totals:
+        Product.objects.filter(pk=row['product_id']).update(sales_count=row['units'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sales_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_sales_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-rating_average', '-rating_count'], name='product_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-rating_average'], name='product_category_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-sales_count'], name='product_sales_count_idx'),
+        ),
+    ]
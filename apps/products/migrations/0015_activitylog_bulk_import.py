@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activitylog',
+            name='action',
+            field=models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('stock_add', 'Stock Add'), ('stock_reduce', 'Stock Reduce'), ('order_status', 'Order Status Change'), ('physical_sale', 'Physical Sale'), ('bulk_import', 'Bulk Import'), ('user_login', 'User Login'), ('user_logout', 'User Logout')], max_length=20),
+        ),
+    ]
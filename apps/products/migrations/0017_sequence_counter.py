@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
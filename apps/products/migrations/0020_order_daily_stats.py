@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:02
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_order_daily_stats(apps, schema_editor):
+    # Same figures as rollups.rebuild_order_daily_stats, on the historical models
+    Order = apps.get_model('products', 'Order')
+    OrderItem = apps.get_model('products', 'OrderItem')
+    OrderDailyStats = apps.get_model('products', 'OrderDailyStats')
+    group = ('date', 'order_type', 'fulfillment_method', 'status')
+    rows = Order.objects.annotate(date=TruncDate('created_at')).values(*group).annotate(
+        order_count=Count('id'), revenue=Sum('total_amount'), delivery_fees=Sum('delivery_fee')
+    ).order_by()
+    item_counts = {
+        (row['date'], row['order__order_type'], row['order__fulfillment_method'], row['order__status']):
+            row['item_count']
+        for row in OrderItem.objects.annotate(date=TruncDate('order__created_at')).values(
+            'date', 'order__order_type', 'order__fulfillment_method', 'order__status'
+        ).annotate(item_count=Sum('quantity')).order_by()
+    }
+    OrderDailyStats.objects.bulk_create([
+        OrderDailyStats(
+            order_count=row['order_count'],
+            item_count=item_counts.get(tuple(row[field] for field in group)) or 0,
+            revenue=row['revenue'] or 0,
+            delivery_fees=row['delivery_fees'] or 0,
+            **{field: row[field] for field in group}
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_sync_tombstones_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('order_type', models.CharField(choices=[('online', 'Online'), ('offline', 'Offline')], max_length=10)),
+                ('fulfillment_method', models.CharField(choices=[('pickup', 'Pick Up'), ('delivery', 'Delivery')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('preparing', 'Preparing'), ('ready', 'Ready'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('order_count', models.IntegerField(default=0)),
+                ('item_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Sum of total_amount', max_digits=14)),
+                ('delivery_fees', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'verbose_name_plural': 'Order daily stats',
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'order_type', 'fulfillment_method', 'status'), name='order_daily_stats_key')],
+            },
+        ),
+        migrations.RunPython(backfill_order_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, When
+from django.db.models.functions import TruncDate
+
+
+def backfill_product_daily_sales(apps, schema_editor):
+    # Same figures as rollups.rebuild_product_daily_sales, on the historical models
+    OrderItem = apps.get_model('products', 'OrderItem')
+    ProductDailySales = apps.get_model('products', 'ProductDailySales')
+    weight_based = Q(weight_kg__isnull=False, product__pricing_type='per_kg', product__product_type='food')
+    line_revenue = Case(
+        When(weight_based, then=F('weight_kg') * F('unit_price')),
+        default=F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+    rows = OrderItem.objects.annotate(date=TruncDate('order__created_at')).values(
+        'date', 'product_id', 'order__status'
+    ).annotate(
+        order_count=Count('order', distinct=True),
+        units=Sum('quantity'),
+        weight=Sum('weight_kg', filter=weight_based),
+        revenue=Sum(line_revenue),
+    ).order_by()
+    ProductDailySales.objects.bulk_create([
+        ProductDailySales(
+            date=row['date'],
+            product_id=row['product_id'],
+            status=row['order__status'],
+            order_count=row['order_count'],
+            units=row['units'] or 0,
+            weight_kg=row['weight'] or 0,
+            revenue=row['revenue'] or 0,
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_order_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('preparing', 'Preparing'), ('ready', 'Ready'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], help_text='Status of the orders', max_length=10)),
+                ('order_count', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0, help_text='Sum of item quantities')),
+                ('weight_kg', models.DecimalField(decimal_places=3, default=0, help_text='Weight sold by the kg', max_digits=12)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Sum of line totals', max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Product daily sales',
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['status', 'date'], name='product_sales_status_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'product', 'status'), name='product_daily_sales_key')],
+            },
+        ),
+        migrations.RunPython(backfill_product_daily_sales, migrations.RunPython.noop),
+    ]
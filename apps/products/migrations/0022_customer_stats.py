@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+
+def backfill_customer_stats(apps, schema_editor):
+    # Same figures as rollups.rebuild_customer_stats, on the historical models
+    Order = apps.get_model('products', 'Order')
+    CustomerStats = apps.get_model('products', 'CustomerStats')
+    completed = Q(status='completed')
+    qualifying = completed & Q(order_type='online', total_amount__gte=700)
+    rows = Order.objects.filter(user__isnull=False).values('user_id').annotate(
+        order_count=Count('id'),
+        completed_order_count=Count('id', filter=completed),
+        completed_spend=Sum(F('total_amount') + F('delivery_fee'), filter=completed),
+        qualifying_order_count=Count('id', filter=qualifying),
+        first_order_at=Min('created_at'),
+        last_order_at=Max('created_at'),
+    ).order_by()
+    now = timezone.now()
+    CustomerStats.objects.bulk_create([
+        CustomerStats(
+            user_id=row['user_id'],
+            order_count=row['order_count'],
+            completed_order_count=row['completed_order_count'],
+            completed_spend=row['completed_spend'] or 0,
+            qualifying_order_count=row['qualifying_order_count'],
+            first_order_at=row['first_order_at'],
+            last_order_at=row['last_order_at'],
+            updated_at=now,
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_product_daily_sales'),
+        ('user_management', '0003_user_loyalty_points_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='customer_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('order_count', models.IntegerField(default=0)),
+                ('completed_order_count', models.IntegerField(default=0)),
+                ('completed_spend', models.DecimalField(decimal_places=2, default=0, help_text='Sum of final totals of completed orders', max_digits=14)),
+                ('qualifying_order_count', models.IntegerField(default=0, help_text='Completed orders that earn loyalty points')),
+                ('first_order_at', models.DateTimeField(blank=True, null=True)),
+                ('last_order_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Customer stats',
+                'indexes': [models.Index(fields=['-completed_order_count', '-completed_spend'], name='customer_stats_top_idx'), models.Index(fields=['last_order_at'], name='customer_stats_last_order_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_customer_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(max_length=32, unique=True),
+        ),
+    ]
@@ -1,18 +1,28 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Prefetch, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
 import json
 
+from .cache import notify_catalog_changed
+from .images import generate_image_variants, needs_variants
+from .search import get_search_backend
+from .tasks import run_after_commit
+
 User = get_user_model()
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', null=True, blank=True)
+    # Resized WebP/JPEG copies of image, filled in by the background worker
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -20,6 +30,25 @@ class Category(models.Model):
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        if not self.image:
+            self.image_variants = {}
+        old_name = Category.objects.filter(pk=self.pk).values_list('name', flat=True).first() if self.pk else None
+        super().save(*args, **kwargs)
+        if old_name is not None and old_name != self.name:
+            # category_name is part of the synced product rows
+            self.products.update(updated_at=timezone.now())
+        if needs_variants(self.image, self.image_variants):
+            run_after_commit(generate_image_variants, 'products.Category', self.pk)
+        get_search_backend().index_category(self.pk)
+        notify_catalog_changed()
+    
+    def delete(self, *args, **kwargs):
+        get_search_backend().remove_category(self.pk)
+        result = super().delete(*args, **kwargs)
+        notify_catalog_changed()
+        return result
 
 class Product(models.Model):
     FOOD = 'food'
@@ -63,9 +92,20 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     product_type = models.CharField(max_length=10, choices=PRODUCT_TYPE_CHOICES, default=FOOD)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
+    # Resized WebP/JPEG copies of image, filled in by the background worker
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     show = models.BooleanField(default=True)
     is_spicy = models.BooleanField(default=False)
+
+    # Denormalized rating aggregates, refreshed by Review.save() and the Review post_delete receiver in signals.py
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0, editable=False)
+    
+    # Units ordered across all orders, used for popularity ordering
+    sales_count = models.PositiveIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -84,25 +124,73 @@ class Product(models.Model):
         else:
             return self.price * quantity
     
-    def save(self, *args, **kwargs):
-        # Set default available weights for food items with per_kg pricing
+    def apply_default_weights(self):
+        """Set default available weights for food items with per_kg pricing"""
         if self.is_weight_based and not self.available_weights:
             self.available_weights = [0.25, 0.5, 0.75, 1.0, 1.5, 2.0]
+    
+    def save(self, *args, **kwargs):
+        self.apply_default_weights()
+        if not self.image:
+            self.image_variants = {}
         super().save(*args, **kwargs)
+        if needs_variants(self.image, self.image_variants):
+            run_after_commit(generate_image_variants, 'products.Product', self.pk)
+        get_search_backend().index_products([self.pk])
+        notify_catalog_changed()
+    
+    def delete(self, *args, **kwargs):
+        # Sync tombstones for the product and its cascaded order items come from signals.py
+        get_search_backend().remove_products([self.pk])
+        result = super().delete(*args, **kwargs)
+        notify_catalog_changed()
+        return result
     
     @property
     def average_rating(self):
-        reviews = self.reviews.filter(is_active=True)
-        if reviews.exists():
-            return round(sum(review.rating for review in reviews) / reviews.count(), 1)
-        return 0
+        return self.rating_average
     
     @property
     def review_count(self):
-        return self.reviews.filter(is_active=True).count()
+        return self.rating_count
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-rating_average', '-rating_count'], name='product_rating_idx'),
+            models.Index(fields=['category', '-rating_average'], name='product_category_rating_idx'),
+            models.Index(fields=['-sales_count'], name='product_sales_count_idx'),
+            models.Index(fields=['updated_at'], name='product_updated_at_idx'),
+        ]
+    
+    @staticmethod
+    def compute_rating_average(rating_sum, rating_count):
+        """Average rating rounded to one decimal, 0 when there are no reviews"""
+        if not rating_count:
+            return 0
+        return round(rating_sum / rating_count, 1)
+    
+    @classmethod
+    def refresh_rating_aggregates(cls, product_id):
+        """Recompute the stored rating columns of one product from its active reviews"""
+        with transaction.atomic():
+            # Lock the product row so concurrent review writes recompute one after another
+            locked = list(cls.objects.select_for_update().filter(pk=product_id).values_list('pk', flat=True))
+            if not locked:
+                return
+            totals = Review.objects.filter(product_id=product_id, is_active=True).aggregate(
+                rating_sum=Sum('rating'),
+                rating_count=Count('id')
+            )
+            rating_sum = totals['rating_sum'] or 0
+            rating_count = totals['rating_count']
+            cls.objects.filter(pk=product_id).update(
+                rating_sum=rating_sum,
+                rating_count=rating_count,
+                rating_average=cls.compute_rating_average(rating_sum, rating_count),
+                updated_at=timezone.now()
+            )
+            notify_catalog_changed()
 
 
 class Review(models.Model):
@@ -117,9 +205,51 @@ class Review(models.Model):
     class Meta:
         unique_together = ['product', 'user']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.product.name} - {self.rating}"
+    
+    def save(self, *args, **kwargs):
+        # Deletes refresh the product from signals.py, so cascades are covered too
+        with transaction.atomic():
+            previous_product_id = None
+            if self.pk:
+                previous_product_id = Review.objects.filter(pk=self.pk).values_list('product_id', flat=True).first()
+            super().save(*args, **kwargs)
+            Product.refresh_rating_aggregates(self.product_id)
+            if previous_product_id not in (None, self.product_id):
+                Product.refresh_rating_aggregates(previous_product_id)
+
+
+class CartQuerySet(models.QuerySet):
+    def with_contents(self):
+        """
+        Everything a cart response needs in two queries
+        - Items and their products in one prefetch
+        - items_total_price / items_total_quantity computed by the database,
+          weight-based lines are priced by weight like CartItem.total_price
+        """
+        weight_based = Q(
+            items__product__pricing_type='per_kg',
+            items__product__product_type=Product.FOOD,
+            items__weight_kg__isnull=False
+        )
+        line_total = Case(
+            When(weight_based, then=F('items__weight_kg') * F('items__product__price')),
+            default=F('items__quantity') * F('items__product__price'),
+            output_field=DecimalField(max_digits=16, decimal_places=5)
+        )
+        return self.prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.select_related('product').order_by('created_at', 'id'))
+        ).annotate(
+            items_total_price=Coalesce(
+                Sum(line_total), Value(0), output_field=DecimalField(max_digits=16, decimal_places=5)
+            ),
+            items_total_quantity=Coalesce(Sum('items__quantity'), Value(0), output_field=IntegerField())
+        )
 
 
 class Cart(models.Model):
@@ -127,12 +257,19 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CartQuerySet.as_manager()
+    
     @property
     def total_price(self):
+        # Annotated by Cart.objects.with_contents()
+        if hasattr(self, 'items_total_price'):
+            return self.items_total_price
         return sum(item.total_price for item in self.items.all())
     
     @property
     def total_quantity(self):
+        if hasattr(self, 'items_total_quantity'):
+            return self.items_total_quantity
         return sum(item.quantity for item in self.items.all())
     
     def __str__(self):
@@ -193,6 +330,16 @@ class Order(models.Model):
         (CANCELLED, 'Cancelled'),
     ]
     
+    # Allowed status moves, applied by OrderStatusService.transition
+    STATUS_TRANSITIONS = {
+        PENDING: (CONFIRMED, CANCELLED),
+        CONFIRMED: (PREPARING, CANCELLED),
+        PREPARING: (READY, CANCELLED),
+        READY: (COMPLETED, CANCELLED),
+        COMPLETED: (),
+        CANCELLED: (),
+    }
+    
     ONLINE = 'online'
     OFFLINE = 'offline'
     
@@ -209,7 +356,7 @@ class Order(models.Model):
         (DELIVERY, 'Delivery'),
     ]
     
-    order_number = models.CharField(max_length=20, unique=True)
+    order_number = models.CharField(max_length=32, unique=True)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     customer_name = models.CharField(max_length=200)
     customer_phone = models.CharField(max_length=15)
@@ -265,16 +412,20 @@ class Order(models.Model):
         if not self.order_number:
             self.order_number = self.generate_order_number()
         
-        # Calculate delivery fee
-        if self.fulfillment_method == self.DELIVERY:
-            self.delivery_fee = Decimal('59.99')  # Fixed delivery fee
-        else:
-            self.delivery_fee = Decimal('0.00')
-            
+        self.delivery_fee = self.calculate_delivery_fee()
         super().save(*args, **kwargs)
     
+    def calculate_delivery_fee(self):
+        if self.fulfillment_method == self.DELIVERY:
+            return Decimal('59.99')  # Fixed delivery fee
+        return Decimal('0.00')
+    
     def generate_order_number(self):
-        return f"ORD{timezone.now().strftime('%Y%m%d%H%M%S')}{self.id or ''}"
+        from .sequences import allocate_order_number
+        return allocate_order_number()
+    
+    def can_transition_to(self, status):
+        return status == self.status or status in self.STATUS_TRANSITIONS.get(self.status, ())
     
     @property
     def final_total(self):
@@ -282,6 +433,10 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['updated_at'], name='order_updated_at_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -301,6 +456,12 @@ class OrderItem(models.Model):
     
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     special_instructions = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='orderitem_updated_at_idx'),
+        ]
     
     def __str__(self):
         if self.product.is_weight_based and self.weight_kg:
@@ -326,6 +487,7 @@ class ActivityLog(models.Model):
         ('stock_reduce', 'Stock Reduce'),
         ('order_status', 'Order Status Change'),
         ('physical_sale', 'Physical Sale'),
+        ('bulk_import', 'Bulk Import'),
         ('user_login', 'User Login'),
         ('user_logout', 'User Logout'),
     ]
@@ -346,3 +508,177 @@ class ActivityLog(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='activitylog_timestamp_id_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Stored result of a POST sent with an Idempotency-Key header, replayed on retries"""
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    request_hash = models.CharField(max_length=64)
+    
+    # Empty until the first request finishes
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Lease of the request running under the key, a retry may take the key over once it lapses
+    locked_until = models.DateTimeField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    response_body = models.BinaryField(blank=True, default=b'')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_scope_key_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+    
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+
+class SequenceCounter(models.Model):
+    """Named counter handing out blocks of numbers, see apps.products.sequences"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class OutboxEvent(models.Model):
+    """Side effect recorded in the same transaction as the change, handled by process_outbox"""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at', 'id'], name='outbox_pending_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} #{self.pk} ({self.status})"
+
+
+class Tombstone(models.Model):
+    """Id of a deleted row, kept so the sync endpoints can tell clients to drop it"""
+    model_name = models.CharField(max_length=50)
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['model_name', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.model_name} #{self.object_id} deleted"
+    
+    @classmethod
+    def record(cls, model_name, object_ids):
+        now = timezone.now()
+        cls.objects.bulk_create([
+            cls(model_name=model_name, object_id=object_id, deleted_at=now)
+            for object_id in object_ids
+        ])
+
+
+class OrderDailyStats(models.Model):
+    """Per-day order totals kept in step with Order writes, see rollups.py"""
+    date = models.DateField()
+    order_type = models.CharField(max_length=10, choices=Order.ORDER_TYPE_CHOICES)
+    fulfillment_method = models.CharField(max_length=10, choices=Order.FULFILLMENT_CHOICES)
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    item_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Sum of total_amount")
+    delivery_fees = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name_plural = "Order daily stats"
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'order_type', 'fulfillment_method', 'status'],
+                name='order_daily_stats_key'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.order_type}/{self.fulfillment_method}/{self.status}: {self.order_count}"
+
+
+class ProductDailySales(models.Model):
+    """Per-product, per-day sales kept in step with order items, see rollups.py"""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES, help_text="Status of the orders")
+    order_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0, help_text="Sum of item quantities")
+    weight_kg = models.DecimalField(max_digits=12, decimal_places=3, default=0, help_text="Weight sold by the kg")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Sum of line totals")
+    
+    class Meta:
+        verbose_name_plural = "Product daily sales"
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product', 'status'], name='product_daily_sales_key'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'date'], name='product_sales_status_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.product_id}/{self.status}: {self.units}"
+
+
+class CustomerStats(models.Model):
+    """Per-customer order totals kept in step with the customer's orders, see rollups.py"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='customer_stats')
+    order_count = models.IntegerField(default=0)
+    completed_order_count = models.IntegerField(default=0)
+    completed_spend = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, help_text="Sum of final totals of completed orders"
+    )
+    qualifying_order_count = models.IntegerField(default=0, help_text="Completed orders that earn loyalty points")
+    first_order_at = models.DateTimeField(null=True, blank=True)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Customer stats"
+        indexes = [
+            models.Index(fields=['-completed_order_count', '-completed_spend'], name='customer_stats_top_idx'),
+            models.Index(fields=['last_order_at'], name='customer_stats_last_order_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.completed_order_count} completed orders"
@@ -0,0 +1,316 @@
+# apps/products/order_feed.py
+"""
+Live order board feed (SSE with a long-poll fallback)
+- The order.* outbox events are the source, so changes made by any process show up
+- One poller thread per process tails the outbox and fans new events out to every
+  connected screen, an idle screen costs no queries of its own
+- Events are filtered per screen by station, stations are limited by role
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from rest_framework.renderers import BaseRenderer
+
+from .models import Order, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENT_TYPES = (
+    'order.created',
+    'order.status_changed',
+    'order.payment_verification_changed',
+)
+
+# Payload fields that stay server side
+PRIVATE_FIELDS = ('actor_id', 'ip_address')
+
+KITCHEN_STATUSES = {Order.PENDING, Order.CONFIRMED, Order.PREPARING, Order.READY}
+CLOSED_STATUSES = {Order.COMPLETED, Order.CANCELLED}
+
+
+def touched_statuses(event):
+    payload = event['payload']
+    statuses = {payload.get('old_status'), payload.get('new_status'), payload.get('status')}
+    if event['order']:
+        statuses.add(event['order']['status'])
+    return statuses - {None}
+
+
+def is_kitchen_event(event):
+    if event['type'] == 'order.payment_verification_changed':
+        return False
+    return bool(touched_statuses(event) & KITCHEN_STATUSES)
+
+
+def is_floor_event(event):
+    order = event['order'] or {}
+    return order.get('order_type') == Order.OFFLINE or Order.READY in touched_statuses(event)
+
+
+def is_cashier_event(event):
+    if event['type'] != 'order.status_changed':
+        return True
+    return bool(touched_statuses(event) & CLOSED_STATUSES)
+
+
+STATIONS = {
+    'all': lambda event: True,
+    'kitchen': is_kitchen_event,
+    'floor': is_floor_event,
+    'cashier': is_cashier_event,
+}
+
+# Stations each role may watch, the first one is the default
+ROLE_STATIONS = {
+    'owner': ('all', 'kitchen', 'floor', 'cashier'),
+    'worker': ('all', 'kitchen', 'floor', 'cashier'),
+    'chef': ('kitchen',),
+    'butcher': ('kitchen',),
+    'waiter': ('floor', 'kitchen'),
+    'cashier': ('cashier', 'floor'),
+}
+
+
+def latest_event_id():
+    return OutboxEvent.objects.filter(
+        event_type__in=ORDER_EVENT_TYPES
+    ).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def fetch_events(after_id, limit=None):
+    """Order events after after_id, each with the current state of its order"""
+    from .menu import MediaURLBuilder
+    from .serializers import OrderSerializer
+
+    limit = limit or getattr(settings, 'ORDER_FEED_BATCH_SIZE', 200)
+    rows = list(
+        OutboxEvent.objects.filter(event_type__in=ORDER_EVENT_TYPES, id__gt=after_id)
+        .order_by('id').values('id', 'event_type', 'payload', 'created_at')[:limit]
+    )
+    if not rows:
+        return []
+
+    orders = Order.objects.filter(
+        pk__in={row['payload'].get('order_id') for row in rows}
+    ).select_related('user', 'payment_verified_by').prefetch_related('items__product')
+    context = {'request': MediaURLBuilder(getattr(settings, 'MENU_MEDIA_BASE_URL', ''))}
+    snapshots = {
+        data['id']: data
+        for data in json.loads(json.dumps(
+            OrderSerializer(orders, many=True, context=context).data, cls=DjangoJSONEncoder
+        ))
+    }
+
+    return [
+        {
+            'id': row['id'],
+            'type': row['event_type'],
+            'created_at': row['created_at'].isoformat(),
+            'payload': {key: value for key, value in row['payload'].items() if key not in PRIVATE_FIELDS},
+            'order': snapshots.get(row['payload'].get('order_id')),
+        }
+        for row in rows
+    ]
+
+
+class OrderFeedBroker:
+    """Per-process buffer of recent order events plus the screens waiting for the next one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._events = deque()
+        self._floor = 0
+        self._last_id = 0
+        self._waiters = []
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._events = deque(maxlen=getattr(settings, 'ORDER_FEED_BUFFER', 1000))
+            self._floor = self._last_id = latest_event_id()
+            self._thread = threading.Thread(target=self._run, name='order-feed', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Poll now instead of at the next interval, e.g. right after an order commit"""
+        self._wakeup.set()
+
+    def _run(self):
+        interval = getattr(settings, 'ORDER_FEED_POLL_INTERVAL', 0.5)
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._waiters:
+                    continue
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Order feed poll failed')
+            finally:
+                close_old_connections()
+
+    def poll(self):
+        events = fetch_events(self._last_id)
+        if not events:
+            return
+        with self._lock:
+            for event in events:
+                if len(self._events) == self._events.maxlen:
+                    self._floor = self._events[0]['id']
+                self._events.append(event)
+            self._last_id = events[-1]['id']
+            waiters, self._waiters = self._waiters, []
+        for notify in waiters:
+            notify()
+
+    def _events_after(self, cursor):
+        """(covered, events), covered is False when the buffer no longer reaches back to cursor"""
+        if cursor < self._floor:
+            return False, []
+        return True, [event for event in self._events if event['id'] > cursor]
+
+    def _subscribe(self, cursor, notify):
+        with self._lock:
+            covered, events = self._events_after(cursor)
+            if covered and not events:
+                self._waiters.append(notify)
+                return True, None
+            return covered, events
+
+    def _unsubscribe(self, notify):
+        with self._lock:
+            if notify in self._waiters:
+                self._waiters.remove(notify)
+
+    def _collect(self, cursor):
+        with self._lock:
+            covered, events = self._events_after(cursor)
+        return events if covered else fetch_events(cursor)
+
+    def wait(self, cursor, timeout):
+        """Events after cursor, blocking up to timeout for the next one (WSGI)"""
+        self.start()
+        ready = threading.Event()
+        covered, events = self._subscribe(cursor, ready.set)
+        if not covered:
+            return fetch_events(cursor)
+        if events is None:
+            ready.wait(timeout)
+            self._unsubscribe(ready.set)
+            return self._collect(cursor)
+        return events
+
+    async def wait_async(self, cursor, timeout):
+        """Events after cursor, awaiting up to timeout for the next one (ASGI)"""
+        await sync_to_async(self.start, thread_sensitive=False)()
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def notify():
+            try:
+                loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+            except RuntimeError:  # The waiting loop is already closed
+                pass
+
+        covered, events = self._subscribe(cursor, notify)
+        if not covered:
+            return await sync_to_async(fetch_events, thread_sensitive=False)(cursor)
+        if events is None:
+            try:
+                await asyncio.wait_for(ready, timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._unsubscribe(notify)
+            return await sync_to_async(self._collect, thread_sensitive=False)(cursor)
+        return events
+
+
+broker = OrderFeedBroker()
+
+
+def notify_order_feed():
+    broker.wake()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF negotiate Accept: text/event-stream, only error bodies go through it"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def format_sse(event):
+    data = json.dumps(event, cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+def sse_preamble(cursor):
+    """
+    Reconnect delay plus the starting cursor as the last event id
+    - An id without data dispatches nothing, but it sets EventSource.lastEventId, so even
+      an idle screen has a cursor to resume from with a new token
+    """
+    return f"retry: {getattr(settings, 'ORDER_FEED_RETRY_MS', 2000)}\nid: {cursor}\n\n"
+
+
+def sse_stream(cursor, station):
+    """
+    text/event-stream body for WSGI, the client reconnects when it ends
+    - Each open stream holds a worker thread, so it ends after ORDER_FEED_WSGI_STREAM_TIMEOUT,
+      about a long-poll, and order-taking requests get the thread back in between
+    """
+    matches = STATIONS[station]
+    heartbeat = getattr(settings, 'ORDER_FEED_HEARTBEAT', 15)
+    deadline = time.monotonic() + getattr(settings, 'ORDER_FEED_WSGI_STREAM_TIMEOUT', 25)
+    yield sse_preamble(cursor)
+    while (remaining := deadline - time.monotonic()) > 0:
+        events = broker.wait(cursor, min(heartbeat, remaining))
+        if not events:
+            yield ': keepalive\n\n'
+            continue
+        cursor = events[-1]['id']
+        for event in events:
+            if matches(event):
+                yield format_sse(event)
+
+
+async def sse_stream_async(cursor, station):
+    """Same stream as sse_stream without a thread per screen (ASGI), ends after ORDER_FEED_STREAM_TIMEOUT"""
+    matches = STATIONS[station]
+    heartbeat = getattr(settings, 'ORDER_FEED_HEARTBEAT', 15)
+    deadline = time.monotonic() + getattr(settings, 'ORDER_FEED_STREAM_TIMEOUT', 300)
+    yield sse_preamble(cursor)
+    while (remaining := deadline - time.monotonic()) > 0:
+        events = await broker.wait_async(cursor, min(heartbeat, remaining))
+        if not events:
+            yield ': keepalive\n\n'
+            continue
+        cursor = events[-1]['id']
+        for event in events:
+            if matches(event):
+                yield format_sse(event)
+
+
+def poll_body(cursor, station, events):
+    matched = [event for event in events if STATIONS[station](event)]
+    return {'cursor': events[-1]['id'] if events else cursor, 'events': matched}
+
+
+async def long_poll_async(cursor, station, timeout):
+    """Single-chunk body for the ASGI long-poll, the wait doesn't tie up a thread"""
+    events = await broker.wait_async(cursor, timeout)
+    yield json.dumps(poll_body(cursor, station, events), cls=DjangoJSONEncoder)
@@ -0,0 +1,209 @@
+# apps/products/outbox.py
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ActivityLog, Order, OutboxEvent
+from .order_feed import notify_order_feed
+from .services import LoyaltyService
+from apps.user_management.models import User
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = 'order.created'
+ORDER_STATUS_CHANGED = 'order.status_changed'
+ORDER_PAYMENT_VERIFICATION_CHANGED = 'order.payment_verification_changed'
+
+HANDLERS = {}
+
+
+def register(event_type):
+    """Decorator registering the handler of an event type"""
+    def decorator(func):
+        HANDLERS[event_type] = func
+        return func
+    return decorator
+
+
+def emit(event_type, payload):
+    """Record an event, call inside the transaction that makes the change"""
+    event = OutboxEvent.objects.create(event_type=event_type, payload=payload)
+    # Order boards connected to this process see the event without waiting for the next poll
+    transaction.on_commit(notify_order_feed)
+    return event
+
+
+def request_actor(request):
+    """actor_id / ip_address payload fields for the user behind a request"""
+    if request is None:
+        return {'actor_id': None, 'ip_address': None}
+    user = request.user if request.user.is_authenticated else None
+    return {
+        'actor_id': user.pk if user else None,
+        'ip_address': request.META.get('REMOTE_ADDR'),
+    }
+
+
+def retry_delay(attempts):
+    """Exponential backoff: 2, 4, 8 ... seconds, capped at 10 minutes"""
+    return timedelta(seconds=min(2 ** attempts, 600))
+
+
+def claim_batch(batch_size):
+    """
+    Mark up to batch_size due events as processing for this worker
+    - Events left processing by a crashed worker are picked up again after OUTBOX_LOCK_TIMEOUT
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'OUTBOX_LOCK_TIMEOUT', 300))
+    due = (
+        Q(status=OutboxEvent.PENDING, available_at__lte=now) |
+        Q(status=OutboxEvent.PROCESSING, locked_at__lt=stale)
+    )
+    ids = list(OutboxEvent.objects.filter(due).order_by('id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    # Re-checking the condition makes a concurrent worker's claim win cleanly
+    OutboxEvent.objects.filter(due, pk__in=ids).update(
+        status=OutboxEvent.PROCESSING, locked_at=now, locked_by=token
+    )
+    return list(OutboxEvent.objects.filter(locked_by=token, status=OutboxEvent.PROCESSING).order_by('id'))
+
+
+class ClaimLost(Exception):
+    """The event was reclaimed by another worker after our lock went stale"""
+
+
+def process_event(event):
+    """
+    Run one event's handler; the handler's writes and the done mark commit together
+    - Both marks only apply while the event is still claimed by this worker, if another
+      worker took it over the handler's writes are rolled back and it is left to that worker
+    """
+    handler = HANDLERS.get(event.event_type)
+    claimed = OutboxEvent.objects.filter(pk=event.pk, locked_by=event.locked_by)
+    try:
+        with transaction.atomic():
+            if handler is None:
+                logger.warning('No outbox handler for %s', event.event_type)
+            else:
+                handler(event.payload)
+            done = claimed.update(
+                status=OutboxEvent.DONE,
+                attempts=event.attempts + 1,
+                processed_at=timezone.now(),
+                locked_by='',
+                last_error=''
+            )
+            if not done:
+                raise ClaimLost()
+        return True
+    except ClaimLost:
+        logger.warning('Outbox event %s was reclaimed by another worker', event.pk)
+        return False
+    except Exception as exc:
+        logger.exception('Outbox event %s failed', event.pk)
+        attempts = event.attempts + 1
+        failed = attempts >= getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+        claimed.update(
+            status=OutboxEvent.FAILED if failed else OutboxEvent.PENDING,
+            attempts=attempts,
+            available_at=timezone.now() + retry_delay(attempts),
+            locked_by='',
+            last_error=f'{exc.__class__.__name__}: {exc}'
+        )
+        return False
+
+
+def process_batch(batch_size=None):
+    """Handle one batch of due events, returns (processed, failed)"""
+    events = claim_batch(batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 100))
+    processed = failed = 0
+    for event in events:
+        if process_event(event):
+            processed += 1
+        else:
+            failed += 1
+    return processed, failed
+
+
+def purge_done_events():
+    """Delete handled events older than OUTBOX_RETENTION_DAYS, failed ones are kept for inspection"""
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'OUTBOX_RETENTION_DAYS', 7))
+    deleted, _ = OutboxEvent.objects.filter(status=OutboxEvent.DONE, processed_at__lt=cutoff).delete()
+    return deleted
+
+
+def write_activity(payload, action, description, old_value='', new_value=''):
+    ActivityLog.objects.create(
+        user_id=payload.get('actor_id'),
+        action=action,
+        model_name='Order',
+        object_id=str(payload['order_id']),
+        description=description,
+        old_value=old_value,
+        new_value=new_value,
+        ip_address=payload.get('ip_address')
+    )
+
+
+############ Handlers ############
+
+@register(ORDER_CREATED)
+def handle_order_created(payload):
+    if payload.get('order_type') == Order.OFFLINE:
+        actor = User.objects.filter(pk=payload.get('actor_id')).first()
+        worker_name = actor.get_full_name() if actor else ''
+        write_activity(
+            payload,
+            action='physical_sale',
+            description=f"Physical sale created: {payload['order_number']} for Table {payload.get('table_number')}",
+            new_value=(
+                f"Status: {payload['status']}, Total: ${payload['final_total']}, "
+                f"Table: {payload.get('table_number')}, Worker: {worker_name}"
+            )
+        )
+    else:
+        write_activity(
+            payload,
+            action='create',
+            description=f"Online order created: {payload['order_number']}",
+            new_value=(
+                f"Status: {payload['status']}, Total: ${payload['final_total']}, "
+                f"Type: {payload['order_type']}, Method: {payload['fulfillment_method']}"
+            )
+        )
+
+
+@register(ORDER_STATUS_CHANGED)
+def handle_order_status_changed(payload):
+    write_activity(
+        payload,
+        action='order_status',
+        description=f"Order status changed: {payload['order_number']}",
+        old_value=payload['old_status'],
+        new_value=payload['new_status']
+    )
+    if payload['new_status'] == Order.COMPLETED:
+        order = Order.objects.select_related('user').filter(pk=payload['order_id']).first()
+        if order is not None and order.status == Order.COMPLETED:
+            LoyaltyService.process_order_loyalty_points(order)
+
+
+@register(ORDER_PAYMENT_VERIFICATION_CHANGED)
+def handle_payment_verification_changed(payload):
+    verified = payload['verified']
+    write_activity(
+        payload,
+        action='update',
+        description=f"Payment {'verified' if verified else 'unverified'} for order: {payload['order_number']}",
+        old_value=str(not verified),
+        new_value=str(verified)
+    )
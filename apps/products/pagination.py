@@ -0,0 +1,196 @@
+# apps/products/pagination.py
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on the queryset ordering plus the primary key
+    - The cursor holds the key values of the last row, the next page is a
+      plain WHERE (key) < (cursor) range scan, so deep pages cost the same as the first
+    - No COUNT(*) is issued
+    - Works with OrderingFilter, the active ordering is part of the cursor
+    - NULLs of nullable key fields sort as the largest value (last ascending,
+      first descending) on every backend, the keyset filter has IS NULL branches for them
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Used when the queryset has no ordering of its own
+    ordering = ('-created_at',)
+
+    @property
+    def page_size(self):
+        return getattr(settings, 'API_PAGE_SIZE', 50)
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        self.key_fields = self.get_key_fields(queryset)
+        self.nullable_fields = {
+            field.lstrip('-') for field in self.key_fields if self.is_nullable(queryset.model, field.lstrip('-'))
+        }
+        queryset = queryset.order_by(*self.get_order_by())
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.build_keyset_filter(cursor))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_key_fields(self, queryset):
+        """Queryset ordering with a primary key tie-breaker appended"""
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering) or list(self.ordering)
+        ordering = [field for field in ordering if isinstance(field, str)] or list(self.ordering)
+
+        pk_name = queryset.model._meta.pk.name
+        ordering = [
+            ('-' if field.startswith('-') else '') + pk_name if field.lstrip('-') == 'pk' else field
+            for field in ordering
+        ]
+        if pk_name not in [field.lstrip('-') for field in ordering]:
+            descending = ordering[0].startswith('-')
+            ordering.append(('-' if descending else '') + pk_name)
+        return ordering
+
+    @staticmethod
+    def is_nullable(model, path):
+        """Whether a (possibly related) ordering field can be NULL, unknown names count as nullable"""
+        for part in path.split('__'):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return True
+            if field.null:
+                return True
+            if field.is_relation:
+                model = field.related_model
+        return False
+
+    def get_order_by(self):
+        order_by = []
+        for field in self.key_fields:
+            name = field.lstrip('-')
+            if name not in self.nullable_fields:
+                order_by.append(field)
+            elif field.startswith('-'):
+                order_by.append(F(name).desc(nulls_first=True))
+            else:
+                order_by.append(F(name).asc(nulls_last=True))
+        return order_by
+
+    def after(self, field, value):
+        """Rows sorting after `value` on one key field, None when nothing can"""
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+        if name not in self.nullable_fields:
+            return Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+        if value is None:
+            # NULL is the largest value, only a descending field has rows after it
+            return Q(**{f'{name}__isnull': False}) if descending else None
+        if descending:
+            return Q(**{f'{name}__lt': value})
+        return Q(**{f'{name}__gt': value}) | Q(**{f'{name}__isnull': True})
+
+    def equal(self, field, value):
+        name = field.lstrip('-')
+        if value is None:
+            return Q(**{f'{name}__isnull': True})
+        return Q(**{name: value})
+
+    def build_keyset_filter(self, values):
+        """(a, b, pk) after (x, y, z) => a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z)"""
+        condition = Q()
+        for index, field in enumerate(self.key_fields):
+            branch = self.after(field, values[index])
+            if branch is None:
+                continue
+            for previous_index, previous in enumerate(self.key_fields[:index]):
+                branch &= self.equal(previous, values[previous_index])
+            condition |= branch
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            ordering, values = payload['o'], payload['v']
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # A cursor taken under another ordering can't be applied
+        if ordering != self.key_fields or len(values) != len(self.key_fields):
+            raise NotFound(self.invalid_cursor_message)
+        if any(value is None and field.lstrip('-') not in self.nullable_fields
+               for field, value in zip(self.key_fields, values)):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.key_fields:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, (datetime.datetime, datetime.date)):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            values.append(value)
+        payload = json.dumps({'o': self.key_fields, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_first_link(self):
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -103,3 +103,20 @@ class CanProcessPhysicalSales(permissions.BasePermission):
             return False
         allowed_groups = ['Owner', 'Waiter', 'Cashier']
         return request.user.groups.filter(name__in=allowed_groups).exists()
+
+
+def get_user_role(user):
+    """Determine user's specific role"""
+    if user.is_superuser or user.groups.filter(name='Owner').exists():
+        return 'owner'
+    elif user.groups.filter(name='Chef').exists():
+        return 'chef'
+    elif user.groups.filter(name='Waiter').exists():
+        return 'waiter'
+    elif user.groups.filter(name='Cashier').exists():
+        return 'cashier'
+    elif user.groups.filter(name='Butcher').exists():
+        return 'butcher'
+    elif user.groups.filter(name='Worker').exists():
+        return 'worker'
+    return 'customer'
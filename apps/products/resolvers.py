@@ -0,0 +1,52 @@
+# apps/products/resolvers.py
+from .models import Product
+
+
+class ProductResolver:
+    """
+    Request-scoped Product lookup shared through the serializer context
+    - prime() loads every referenced id with one in_bulk query
+    - Nested serializers and create() reuse the same instances
+    """
+    context_key = 'product_resolver'
+
+    def __init__(self, queryset=None):
+        self.queryset = queryset if queryset is not None else Product.objects.all()
+        self._products = {}
+        self._missing = set()
+
+    @classmethod
+    def from_context(cls, context):
+        """Resolver stored in the serializer context, created on first use"""
+        resolver = context.get(cls.context_key)
+        if resolver is None:
+            resolver = context[cls.context_key] = cls()
+        return resolver
+
+    @staticmethod
+    def clean_id(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def add(self, products):
+        """Register already loaded products, e.g. from a select_related cart"""
+        for product in products:
+            self._products[product.pk] = product
+            self._missing.discard(product.pk)
+
+    def prime(self, ids):
+        ids = {self.clean_id(pk) for pk in ids} - {None}
+        unknown = ids - self._products.keys() - self._missing
+        if unknown:
+            found = self.queryset.in_bulk(unknown)
+            self._products.update(found)
+            self._missing.update(unknown - found.keys())
+
+    def get(self, pk):
+        pk = self.clean_id(pk)
+        if pk is None:
+            return None
+        self.prime([pk])
+        return self._products.get(pk)
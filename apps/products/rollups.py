@@ -0,0 +1,314 @@
+# apps/products/rollups.py
+"""
+Rollup tables kept in step with order writes
+- Writers take the order's state before and after the change and call
+  apply_order_stats(old, new) in the same transaction
+- OrderDailyStats is keyed on the order, ProductDailySales on each product in it,
+  CustomerStats rows are recomputed from the customer's own orders
+- Deletes are handled in signals.py, so cascades and queryset deletes are covered:
+  a deleted order takes its whole contribution out, a deleted product its items'
+  units out of OrderDailyStats.item_count (its ProductDailySales rows cascade)
+- Rows an order moved out of are dropped once their order_count is back to 0
+- The rebuild_* functions recompute them from the orders (backfill / repair)
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Min, Q, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CustomerStats, Order, OrderDailyStats, OrderItem, Product, ProductDailySales
+
+ORDER_STATS_KEY = ('order_type', 'fulfillment_method', 'status')
+
+COMPLETED = Q(status=Order.COMPLETED)
+# Same rule as LoyaltyService.process_order_loyalty_points
+QUALIFYING_ORDER = COMPLETED & Q(order_type=Order.ONLINE, total_amount__gte=700)
+
+
+def sales_lines(items):
+    """{product id: units, weight_kg, revenue} of order items that have their product loaded"""
+    lines = {}
+    for item in items:
+        line = lines.setdefault(item.product_id, {'units': 0, 'weight_kg': Decimal('0'), 'revenue': Decimal('0')})
+        line['units'] += item.quantity
+        if item.product.is_weight_based and item.weight_kg:
+            line['weight_kg'] += item.weight_kg
+        line['revenue'] += item.total_price
+    return lines
+
+
+def order_sales_lines(order_id):
+    return sales_lines(OrderItem.objects.filter(order_id=order_id).select_related('product'))
+
+
+def with_sales_lines(state, lines):
+    return {**state, 'lines': lines, 'item_count': sum(line['units'] for line in lines.values())}
+
+
+def order_stats_state(order, lines=None):
+    """What an order contributes to the rollups, lines are queried when not given"""
+    state = {
+        'user_id': order.user_id,
+        'date': timezone.localdate(order.created_at),
+        'order_type': order.order_type,
+        'fulfillment_method': order.fulfillment_method,
+        'status': order.status,
+        'total_amount': order.total_amount,
+        'delivery_fee': order.delivery_fee,
+    }
+    return with_sales_lines(state, order_sales_lines(order.pk) if lines is None else lines)
+
+
+def upsert_increment(model, key, changes):
+    rows = model.objects.filter(**key)
+    if not rows.update(**changes):
+        model.objects.get_or_create(**key)
+        rows.update(**changes)
+
+
+def order_stats_key(state):
+    return {field: state[field] for field in ('date',) + ORDER_STATS_KEY}
+
+
+def bump_order_stats(state, sign):
+    upsert_increment(
+        OrderDailyStats,
+        order_stats_key(state),
+        {
+            'order_count': F('order_count') + sign,
+            'item_count': F('item_count') + sign * state['item_count'],
+            'revenue': F('revenue') + sign * state['total_amount'],
+            'delivery_fees': F('delivery_fees') + sign * state['delivery_fee'],
+        }
+    )
+
+
+def bump_product_sales(state, sign):
+    for product_id, line in state['lines'].items():
+        upsert_increment(
+            ProductDailySales,
+            {'date': state['date'], 'product_id': product_id, 'status': state['status']},
+            {
+                'order_count': F('order_count') + sign,
+                'units': F('units') + sign * line['units'],
+                'weight_kg': F('weight_kg') + sign * line['weight_kg'],
+                'revenue': F('revenue') + sign * line['revenue'],
+            }
+        )
+
+
+def product_sales_key(state):
+    return state and (state['date'], state['status'], state['lines'])
+
+
+def customer_stats_key(state):
+    if state is None:
+        return None
+    completed = state['status'] == Order.COMPLETED
+    return (
+        state['user_id'], completed,
+        completed and (state['order_type'], state['total_amount'], state['delivery_fee'])
+    )
+
+
+def apply_order_stats(old_state, new_state):
+    """Move one order's contribution from old_state to new_state, either can be None"""
+    if old_state == new_state:
+        return
+    with transaction.atomic():
+        if old_state is not None:
+            bump_order_stats(old_state, -1)
+        if new_state is not None:
+            bump_order_stats(new_state, 1)
+        if old_state is not None:
+            OrderDailyStats.objects.filter(order_count=0, **order_stats_key(old_state)).delete()
+
+        # Product rows only depend on the day, the status and the lines
+        if product_sales_key(old_state) != product_sales_key(new_state):
+            if old_state is not None:
+                bump_product_sales(old_state, -1)
+            if new_state is not None:
+                bump_product_sales(new_state, 1)
+            if old_state is not None and old_state['lines']:
+                ProductDailySales.objects.filter(
+                    order_count=0, date=old_state['date'], status=old_state['status'],
+                    product_id__in=old_state['lines']
+                ).delete()
+
+        # Customer rows only move on a new / deleted order or a change around completion
+        if customer_stats_key(old_state) != customer_stats_key(new_state):
+            user_ids = {state['user_id'] for state in (old_state, new_state) if state is not None}
+            refresh_customer_stats(user_ids - {None})
+
+
+def remove_product_items(product_id):
+    """Take a product's order items out of OrderDailyStats.item_count, before the product is deleted"""
+    rows = OrderItem.objects.filter(product_id=product_id).annotate(
+        date=TruncDate('order__created_at')
+    ).values('date', 'order__order_type', 'order__fulfillment_method', 'order__status').annotate(
+        item_count=Sum('quantity')
+    ).order_by()
+    for row in rows:
+        OrderDailyStats.objects.filter(
+            date=row['date'],
+            order_type=row['order__order_type'],
+            fulfillment_method=row['order__fulfillment_method'],
+            status=row['order__status'],
+        ).update(item_count=F('item_count') - row['item_count'])
+
+
+def customer_totals(orders):
+    """CustomerStats figures per user_id of the given orders, one grouped query"""
+    return orders.filter(user__isnull=False).values('user_id').annotate(
+        order_count=Count('id'),
+        completed_order_count=Count('id', filter=COMPLETED),
+        completed_spend=Sum(F('total_amount') + F('delivery_fee'), filter=COMPLETED),
+        qualifying_order_count=Count('id', filter=QUALIFYING_ORDER),
+        first_order_at=Min('created_at'),
+        last_order_at=Max('created_at'),
+    ).order_by()
+
+
+def customer_stats_from_row(row):
+    return CustomerStats(
+        user_id=row['user_id'],
+        order_count=row['order_count'],
+        completed_order_count=row['completed_order_count'],
+        completed_spend=row['completed_spend'] or 0,
+        qualifying_order_count=row['qualifying_order_count'],
+        first_order_at=row['first_order_at'],
+        last_order_at=row['last_order_at'],
+        updated_at=timezone.now(),
+    )
+
+
+def refresh_customer_stats(user_ids):
+    """Recompute the CustomerStats rows of a few customers, an index lookup on their orders"""
+    if not user_ids:
+        return
+    stats = [customer_stats_from_row(row) for row in customer_totals(Order.objects.filter(user_id__in=user_ids))]
+    with transaction.atomic():
+        CustomerStats.objects.filter(user_id__in=user_ids).delete()
+        CustomerStats.objects.bulk_create(stats)
+
+
+def rebuild_order_daily_stats(start_date=None):
+    """Recompute OrderDailyStats from the orders, for every day or from start_date on"""
+    orders = Order.objects.all()
+    items = OrderItem.objects.all()
+    existing = OrderDailyStats.objects.all()
+    if start_date is not None:
+        orders = orders.filter(created_at__date__gte=start_date)
+        items = items.filter(order__created_at__date__gte=start_date)
+        existing = existing.filter(date__gte=start_date)
+
+    group = ('date',) + ORDER_STATS_KEY
+    with transaction.atomic():
+        rows = orders.annotate(date=TruncDate('created_at')).values(*group).annotate(
+            order_count=Count('id'), revenue=Sum('total_amount'), delivery_fees=Sum('delivery_fee')
+        )
+        # Summed separately, joining items into the order totals would repeat them per item
+        item_counts = {
+            (row['date'], row['order__order_type'], row['order__fulfillment_method'], row['order__status']):
+                row['item_count']
+            for row in items.annotate(date=TruncDate('order__created_at')).values(
+                'date', 'order__order_type', 'order__fulfillment_method', 'order__status'
+            ).annotate(item_count=Sum('quantity'))
+        }
+        stats = [
+            OrderDailyStats(
+                order_count=row['order_count'],
+                item_count=item_counts.get(tuple(row[field] for field in group)) or 0,
+                revenue=row['revenue'] or 0,
+                delivery_fees=row['delivery_fees'] or 0,
+                **{field: row[field] for field in group}
+            )
+            for row in rows
+        ]
+        existing.delete()
+        OrderDailyStats.objects.bulk_create(stats, batch_size=500)
+    return len(stats)
+
+
+def line_revenue():
+    """OrderItem.total_price in SQL"""
+    return Case(
+        When(
+            weight_kg__isnull=False,
+            product__pricing_type='per_kg',
+            product__product_type=Product.FOOD,
+            then=F('weight_kg') * F('unit_price')
+        ),
+        default=F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def rebuild_product_daily_sales(start_date=None):
+    """Recompute ProductDailySales from the order items, for every day or from start_date on"""
+    items = OrderItem.objects.all()
+    existing = ProductDailySales.objects.all()
+    if start_date is not None:
+        items = items.filter(order__created_at__date__gte=start_date)
+        existing = existing.filter(date__gte=start_date)
+
+    weight_based = Q(weight_kg__isnull=False, product__pricing_type='per_kg', product__product_type=Product.FOOD)
+    with transaction.atomic():
+        rows = items.annotate(date=TruncDate('order__created_at')).values(
+            'date', 'product_id', 'order__status'
+        ).annotate(
+            order_count=Count('order', distinct=True),
+            units=Sum('quantity'),
+            weight=Sum('weight_kg', filter=weight_based),
+            revenue=Sum(line_revenue()),
+        )
+        sales = [
+            ProductDailySales(
+                date=row['date'],
+                product_id=row['product_id'],
+                status=row['order__status'],
+                order_count=row['order_count'],
+                units=row['units'] or 0,
+                weight_kg=row['weight'] or 0,
+                revenue=row['revenue'] or 0,
+            )
+            for row in rows
+        ]
+        existing.delete()
+        ProductDailySales.objects.bulk_create(sales, batch_size=500)
+    return len(sales)
+
+
+def rebuild_customer_stats():
+    """Recompute every CustomerStats row from the orders"""
+    with transaction.atomic():
+        stats = [customer_stats_from_row(row) for row in customer_totals(Order.objects.all())]
+        CustomerStats.objects.all().delete()
+        CustomerStats.objects.bulk_create(stats, batch_size=500)
+    return len(stats)
+
+
+def order_dashboard_totals(today=None):
+    """Today's / yesterday's figures and per-status counts for the dashboards, one query on the rollup"""
+    today = today or timezone.localdate()
+    yesterday = today - timedelta(days=1)
+    final_total = F('revenue') + F('delivery_fees')
+
+    aggregates = {
+        'orders_today': Sum('order_count', filter=Q(date=today)),
+        'completed_today': Sum('order_count', filter=Q(date=today, status=Order.COMPLETED)),
+        'pickup_today': Sum('order_count', filter=Q(date=today, fulfillment_method=Order.PICKUP)),
+        'delivery_today': Sum('order_count', filter=Q(date=today, fulfillment_method=Order.DELIVERY)),
+        'offline_today': Sum('order_count', filter=Q(date=today, order_type=Order.OFFLINE)),
+        'revenue_today': Sum(final_total, filter=Q(date=today)),
+        'revenue_yesterday': Sum(final_total, filter=Q(date=yesterday)),
+    }
+    for status, _ in Order.STATUS_CHOICES:
+        aggregates[f'status_{status}'] = Sum('order_count', filter=Q(status=status))
+
+    totals = {key: value or 0 for key, value in OrderDailyStats.objects.aggregate(**aggregates).items()}
+    totals['by_status'] = {status: totals.pop(f'status_{status}') for status, _ in Order.STATUS_CHOICES}
+    return totals
@@ -0,0 +1,219 @@
+# apps/products/search.py
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+
+FTS_TABLE = 'products_product_fts'
+
+# Column weights for bm25(): name, description, category name
+FTS_WEIGHTS = (10.0, 1.0, 4.0)
+
+
+def tokenize(query):
+    """Split a user query into lowercase word tokens"""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+class DatabaseSearchBackend:
+    """Fallback backend, plain icontains matching ranked by name"""
+
+    def search(self, query, limit=None, queryset=None):
+        """
+        Ranked ids of the products matching query
+        - queryset restricts the candidates (visibility, category ...) before the limit is applied
+        """
+        from .models import Product
+
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        condition = Q()
+        for token in tokens:
+            condition &= (
+                Q(name__icontains=token) |
+                Q(description__icontains=token) |
+                Q(category__name__icontains=token)
+            )
+        products = Product.objects.all() if queryset is None else queryset
+        ids = products.filter(condition).order_by('name').values_list('pk', flat=True)
+        return list(ids[:limit] if limit else ids)
+
+    def index_products(self, product_ids):
+        pass
+
+    def index_category(self, category_id):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def remove_category(self, category_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class SQLiteFTSSearchBackend(DatabaseSearchBackend):
+    """
+    SQLite FTS5 shadow table over product name, description and category name
+    - Prefix matching on every token ("dor wa" finds "Doro Wat")
+    - Results ranked with bm25()
+    """
+
+    def __init__(self):
+        self._available = False
+
+    def is_available(self):
+        # Only a positive answer is remembered, the table may be created by a later migration
+        if not self._available:
+            self._available = (
+                connection.vendor == 'sqlite' and
+                FTS_TABLE in connection.introspection.table_names()
+            )
+        return self._available
+
+    def build_match_expression(self, query):
+        # Quote every token so FTS operators in user input are treated as text
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, query, limit=None, queryset=None):
+        if not self.is_available():
+            return super().search(query, limit, queryset)
+
+        expression = self.build_match_expression(query)
+        if not expression:
+            return []
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [expression]
+        if queryset is not None:
+            # Filtered inside the FTS query so hidden rows don't use up the limit
+            subquery, subquery_params = queryset.order_by().values('pk').query.sql_with_params()
+            sql += f' AND rowid IN ({subquery})'
+            params.extend(subquery_params)
+        sql += f' ORDER BY bm25({FTS_TABLE}, {weights})'
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _reindex(self, where, params):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM products_product p WHERE {where})',
+                params
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category_name) '
+                f'SELECT p.id, p.name, p.description, c.name FROM products_product p '
+                f'JOIN products_category c ON c.id = p.category_id WHERE {where}',
+                params
+            )
+
+    def index_products(self, product_ids):
+        product_ids = [int(pk) for pk in product_ids]
+        if not product_ids or not self.is_available():
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        self._reindex(f'p.id IN ({placeholders})', product_ids)
+
+    def index_category(self, category_id):
+        if self.is_available():
+            self._reindex('p.category_id = %s', [category_id])
+
+    def remove_products(self, product_ids):
+        product_ids = [int(pk) for pk in product_ids]
+        if not product_ids or not self.is_available():
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+
+    def remove_category(self, category_id):
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+                f'(SELECT id FROM products_product WHERE category_id = %s)',
+                [category_id]
+            )
+
+    def rebuild(self):
+        if not self.is_available():
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category_name) '
+                f'SELECT p.id, p.name, p.description, c.name FROM products_product p '
+                f'JOIN products_category c ON c.id = p.category_id'
+            )
+            return cursor.rowcount
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Backend from the PRODUCT_SEARCH_BACKEND setting (dotted path)"""
+    global _backend
+    if _backend is None:
+        path = getattr(
+            settings, 'PRODUCT_SEARCH_BACKEND', 'apps.products.search.SQLiteFTSSearchBackend'
+        )
+        _backend = import_string(path)()
+    return _backend
+
+
+def order_by_rank(queryset, ranked_ids):
+    """Keep the ranking returned by the search backend"""
+    if not ranked_ids:
+        return queryset
+    rank = Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ranked_ids)],
+        output_field=IntegerField()
+    )
+    return queryset.annotate(search_rank=rank).order_by('search_rank')
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    ?search= backed by the product search index
+    - Results keep the search ranking unless a valid ?ordering= is given,
+      so list this backend after OrderingFilter
+    - Ranked results are the best PRODUCT_SEARCH_LIMIT matches among the view's rows,
+      with an explicit ordering every match is returned
+    """
+    search_param = 'search'
+
+    def get_requested_ordering(self, request, queryset, view):
+        """Ordering fields the view's OrderingFilter accepted from the query string"""
+        for backend in getattr(view, 'filter_backends', ()):
+            if issubclass(backend, OrderingFilter):
+                params = request.query_params.get(backend.ordering_param)
+                if params:
+                    fields = [param.strip() for param in params.split(',')]
+                    return backend().remove_invalid_fields(queryset, fields, view, request)
+        return []
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+
+        ordered = bool(self.get_requested_ordering(request, queryset, view))
+        limit = None if ordered else getattr(settings, 'PRODUCT_SEARCH_LIMIT', 200)
+        ranked_ids = get_search_backend().search(query, limit=limit, queryset=queryset)
+        queryset = queryset.filter(pk__in=ranked_ids)
+        if not ordered:
+            queryset = order_by_rank(queryset, ranked_ids)
+        return queryset
@@ -0,0 +1,71 @@
+# apps/products/sequences.py
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+class SequenceAllocator:
+    """
+    Numbers from a SequenceCounter row, reserved in blocks per process
+    - One UPDATE ... value = value + n reserves a whole block, the numbers are
+      then handed out from memory, so most allocations need no query and no
+      lock on the counter row is held by the order transaction
+    - Numbers are unique and increase within a process; blocks of different
+      processes interleave, so across workers they are not issued in order
+    - Unused numbers of a block are lost when the process exits (gaps, no duplicates)
+    - Inside an open transaction only a single number is reserved, a rollback
+      then gives it back instead of handing the same block to two processes
+    """
+
+    def __init__(self, name, block_size=None):
+        self.name = name
+        self._block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._pid = None
+
+    @property
+    def block_size(self):
+        return self._block_size or getattr(settings, 'SEQUENCE_BLOCK_SIZE', 20)
+
+    def reserve(self, count):
+        """Reserve count numbers in the counter table, returns the first one"""
+        from .models import SequenceCounter
+
+        with transaction.atomic():
+            counter = SequenceCounter.objects.filter(name=self.name)
+            if not counter.update(value=F('value') + count):
+                SequenceCounter.objects.get_or_create(name=self.name)
+                counter.update(value=F('value') + count)
+            end = counter.values_list('value', flat=True).get()
+        return end - count + 1
+
+    @staticmethod
+    def in_transaction():
+        return transaction.get_connection().in_atomic_block
+
+    def allocate(self):
+        if self.in_transaction():
+            return self.reserve(1)
+
+        with self._lock:
+            # Blocks don't survive a fork, the parent may still be using them
+            if self._pid != os.getpid() or self._next > self._end:
+                self._next = self.reserve(self.block_size)
+                self._end = self._next + self.block_size - 1
+                self._pid = os.getpid()
+            number = self._next
+            self._next += 1
+        return number
+
+
+order_number_sequence = SequenceAllocator('order_number')
+
+
+def allocate_order_number():
+    """Order number in the ORD<YYYYmmddHHMMSS><n> format, n from the order_number counter"""
+    return f"ORD{timezone.now().strftime('%Y%m%d%H%M%S')}{order_number_sequence.allocate()}"
@@ -1,8 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User, Group
 from .models import Category, Product, Review, Cart, CartItem, Order, OrderItem, ActivityLog
+from .images import build_image_srcset
+from .services import StockService, StockShortageError
+from .resolvers import ProductResolver
+from .sequences import allocate_order_number
+from . import outbox
+from .rollups import apply_order_stats, order_stats_state, sales_lines
+from django.db import transaction
 from django.utils import timezone
 from decimal import Decimal
+import math
 
 
 
@@ -25,10 +33,14 @@ class UserSerializer(serializers.ModelSerializer):
 
 class CategorySerializer(serializers.ModelSerializer):
     product_count = serializers.IntegerField(source='products.count', read_only=True)
+    image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ['image_variants']
+    
+    def get_image_srcset(self, obj):
+        return build_image_srcset(obj.image_variants, self.context.get('request'))
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -51,14 +63,18 @@ class ProductListSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     average_rating = serializers.ReadOnlyField()
     is_weight_based = serializers.ReadOnlyField()
+    image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'description', 'price', 'pricing_type', 'available_weights',
-            'category_name', 'product_type', 'image', 'stock_quantity', 'average_rating',
-            'is_spicy', 'is_weight_based'
+            'category_name', 'product_type', 'image', 'image_srcset', 'stock_quantity',
+            'average_rating', 'is_spicy', 'is_weight_based'
         ]
+    
+    def get_image_srcset(self, obj):
+        return build_image_srcset(obj.image_variants, self.context.get('request'))
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -126,10 +142,10 @@ class AddToCartSerializer(serializers.Serializer):
         product_id = attrs.get('product_id')
         weight_kg = attrs.get('weight_kg')
         
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+        product = ProductResolver.from_context(self.context).get(product_id)
+        if product is None:
             raise serializers.ValidationError("Product not found")
+        attrs['product'] = product
         
         # Validate weight for weight-based products
         if product.is_weight_based:
@@ -209,47 +225,30 @@ class OrderItemCreateSerializer(serializers.Serializer):
     special_instructions = serializers.CharField(required=False, allow_blank=True, default='')
     
     def validate_product(self, value):
-        try:
-            product = Product.objects.get(id=value)
-            return value
-        except Product.DoesNotExist:
+        if ProductResolver.from_context(self.context).get(value) is None:
             raise serializers.ValidationError(f"Product with ID {value} does not exist.")
+        return value
     
     def validate(self, attrs):
         product_id = attrs.get('product')
         weight_kg = attrs.get('weight_kg')
         
-        # print(f" DEBUG OrderItemCreateSerializer.validate()")
-        # print(f"   product_id: {product_id}, weight_kg: {weight_kg}, type: {type(weight_kg)}")
-        
-        try:
-            product = Product.objects.get(id=product_id)
-            # print(f"  Product found: {product.name}")
-            # print(f"  Product is_weight_based: {product.is_weight_based}")
-        except Product.DoesNotExist:
+        product = ProductResolver.from_context(self.context).get(product_id)
+        if product is None:
             raise serializers.ValidationError("Product not found")
         
         # Validate weight for weight-based products
         if product.is_weight_based:
-            print(f"  Checking weight for weight-based product")
             if weight_kg is None:
-                # print(f"  Weight is None for weight-based product")
                 raise serializers.ValidationError({
                     'weight_kg': 'Weight is required for weight-based products'
                 })
-            else:
-                print(f"  Weight provided: {weight_kg}")
         else:
-            # print(f"   Checking weight for NON-weight-based product")
             if weight_kg is not None:
-                # print(f"   Weight should be None but got: {weight_kg}")
                 raise serializers.ValidationError({
                     'weight_kg': 'Weight should not be provided for non-weight-based products'
                 })
-            else:
-                print(f"  No weight for non-weight-based product (correct)")
         
-        # print(f"  Validation passed")
         return attrs
 
 
@@ -277,6 +276,19 @@ class OrderSerializer(serializers.ModelSerializer):
                           'created_at', 'updated_at']
 
 
+class OrderSyncSerializer(OrderSerializer):
+    """Order without nested items, the sync endpoint sends changed items on their own"""
+    items = None
+    
+    class Meta(OrderSerializer.Meta):
+        fields = [field for field in OrderSerializer.Meta.fields if field != 'items']
+
+
+class OrderItemSyncSerializer(OrderItemSerializer):
+    class Meta(OrderItemSerializer.Meta):
+        fields = OrderItemSerializer.Meta.fields + ['order', 'updated_at']
+
+
 class OrderCreateSerializer(serializers.ModelSerializer):
     items = OrderItemCreateSerializer(many=True, write_only=True, required=False)
     pickup_time = serializers.DateTimeField(required=False, allow_null=True)
@@ -293,6 +305,15 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             'table_number', 'items'
         ]
     
+    def to_internal_value(self, data):
+        # Load every product of the order at once, the item serializers read from the resolver
+        items = data.get('items') if hasattr(data, 'get') else None
+        if isinstance(items, (list, tuple)):
+            ProductResolver.from_context(self.context).prime(
+                item.get('product') for item in items if isinstance(item, dict)
+            )
+        return super().to_internal_value(data)
+    
     def validate(self, data):
         # ... (keep your existing validation logic) ...
         return data
@@ -326,86 +347,93 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             if not validated_data.get('customer_phone'):
                 validated_data['customer_phone'] = 'N/A'
         
-        # Create order
-        order = Order.objects.create(**validated_data)
-        total_amount = 0
+        lines = [
+            item_data for item_data in items_data
+            if item_data.get('product') and item_data.get('quantity')
+        ]
+        resolver = ProductResolver.from_context(self.context)
+        resolver.prime(item_data['product'] for item_data in lines)
         
-        for item_data in items_data:
-            product_id = item_data.get('product')
-            quantity = item_data.get('quantity')
-            weight_kg = item_data.get('weight_kg')
-            
-            if not product_id or not quantity:
-                continue
-                
-            try:
-                product = Product.objects.get(id=product_id)
-            except Product.DoesNotExist:
+        # Units to take per product: weight-based stock is whole units, a started kg counts
+        quantities = {}
+        sales = {}
+        order_items = []
+        total_amount = 0
+        for item_data in lines:
+            product = resolver.get(item_data['product'])
+            if product is None:
                 continue
+            quantity = item_data['quantity']
+            weight_kg = item_data.get('weight_kg')
             
-            # FIXED: Check stock for BOTH product types
-            if product.is_weight_based and weight_kg:
-                # For weight-based products: check weight availability
-                if product.stock_quantity < weight_kg:
-                    raise serializers.ValidationError({
-                        'error': f'Insufficient stock for {product.name}. Available: {product.stock_quantity}kg, Requested: {weight_kg}kg'
-                    })
-            else:
-                # For fixed-price products: check quantity availability
-                if product.stock_quantity < quantity:
-                    raise serializers.ValidationError({
-                        'error': f'Insufficient stock for {product.name}. Available: {product.stock_quantity}'
-                    })
-            
-            # FIXED: Store the base product price in unit_price, not the calculated price
+            # Store the base product price in unit_price, not the calculated price
+            unit_price = product.price
             if product.is_weight_based and weight_kg:
-                # For weight-based: unit_price = product.price (base price per kg)
-                unit_price = product.price
-                # For weight-based: total_price = weight_kg × unit_price
+                units = math.ceil(weight_kg)
                 total_price = weight_kg * unit_price
             else:
-                # For fixed-price: unit_price = product.price
-                unit_price = product.price
-                # For fixed-price: total_price = quantity × unit_price
+                units = quantity
                 total_price = unit_price * quantity
             
-            # Create order item
-            order_item = OrderItem.objects.create(
-                order=order,
+            quantities[product.id] = quantities.get(product.id, 0) + units
+            sales[product.id] = sales.get(product.id, 0) + quantity
+            total_amount += total_price
+            order_items.append(OrderItem(
                 product=product,
                 quantity=quantity,
                 weight_kg=weight_kg,
-                unit_price=unit_price,  # Now storing base price
+                unit_price=unit_price,
                 special_instructions=item_data.get('special_instructions', '')
-            )
-            
-            # FIXED: Update product stock for BOTH product types
-            if product.is_weight_based and weight_kg:
-                # For weight-based: subtract the weight from stock
-                product.stock_quantity -= weight_kg
-            else:
-                # For fixed-price: subtract the quantity from stock
-                product.stock_quantity -= quantity
-            
-            product.save()
-            
-            total_amount += total_price
-        
-        # Handle file upload for payment confirmation
-        payment_confirmation = validated_data.get('payment_confirmation')
-        if payment_confirmation:
-            order.payment_confirmation = payment_confirmation
-        
-        # Update order total
-        order.total_amount = total_amount
+            ))
         
         # Auto-verify payment for physical sales
         if validated_data.get('order_type') == 'offline':
-            order.payment_verified = False
+            validated_data['payment_verified'] = False
+        
+        # Allocated outside the transaction so it comes from the per-process block
+        validated_data['order_number'] = allocate_order_number()
         
-        order.save()
+        try:
+            with transaction.atomic():
+                StockService.reserve(quantities, sales)
+                order = Order.objects.create(total_amount=total_amount, **validated_data)
+                for order_item in order_items:
+                    order_item.order = order
+                OrderItem.objects.bulk_create(order_items)
+                apply_order_stats(None, order_stats_state(order, lines=sales_lines(order_items)))
+                
+                # Activity log and the rest run in process_outbox, not in the request
+                outbox.emit(outbox.ORDER_CREATED, {
+                    'order_id': order.id,
+                    'order_number': order.order_number,
+                    'order_type': order.order_type,
+                    'fulfillment_method': order.fulfillment_method,
+                    'status': order.status,
+                    'final_total': str(order.final_total),
+                    'table_number': order.table_number,
+                    **outbox.request_actor(request),
+                })
+        except StockShortageError as exc:
+            raise serializers.ValidationError({'error': self.shortage_message(exc, resolver, order_items)})
         
         return order
+    
+    def shortage_message(self, exc, resolver, order_items):
+        if not exc.short:
+            # Stock was refilled after the UPDATE missed, nothing was taken either way
+            return 'Stock changed while placing the order, please try again'
+        product = resolver.get(exc.short[0])
+        available = exc.levels.get(product.id, 0)
+        if product.is_weight_based:
+            requested = sum(
+                item.weight_kg or 0 for item in order_items if item.product_id == product.id
+            )
+            return (
+                f'Insufficient stock for {product.name}. '
+                f'Available: {available}kg, Requested: {requested}kg'
+            )
+        return f'Insufficient stock for {product.name}. Available: {available}'
+
 
 class StockUpdateSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=1)
@@ -413,6 +441,47 @@ class StockUpdateSerializer(serializers.Serializer):
     reason = serializers.CharField(max_length=200, required=False)
 
 
+class StockAdjustmentSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    delta = serializers.IntegerField()
+    reason = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    
+    def validate_delta(self, value):
+        if value == 0:
+            raise serializers.ValidationError('Delta must not be zero')
+        return value
+
+
+class BulkStockUpdateSerializer(serializers.Serializer):
+    adjustments = serializers.ListField(
+        child=StockAdjustmentSerializer(), allow_empty=False, max_length=1000
+    )
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """One row of a bulk product import, fields left out keep their current value"""
+    id = serializers.IntegerField(required=False)
+    name = serializers.CharField(max_length=200)
+    description = serializers.CharField(required=False, allow_blank=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    pricing_type = serializers.ChoiceField(choices=Product.PRICING_TYPE_CHOICES, required=False)
+    available_weights = serializers.ListField(
+        child=serializers.FloatField(min_value=0.01), required=False
+    )
+    stock_quantity = serializers.IntegerField(min_value=0, required=False)
+    category = serializers.IntegerField(required=False)
+    category_name = serializers.CharField(max_length=100, required=False)
+    product_type = serializers.ChoiceField(choices=Product.PRODUCT_TYPE_CHOICES, required=False)
+    is_active = serializers.BooleanField(required=False)
+    show = serializers.BooleanField(required=False)
+    is_spicy = serializers.BooleanField(required=False)
+    
+    def validate(self, data):
+        if 'category' not in data and 'category_name' not in data:
+            raise serializers.ValidationError('Either category or category_name is required')
+        return data
+
+
 class ActivityLogSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     user_email = serializers.CharField(source='user.email', read_only=True)
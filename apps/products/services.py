@@ -1,7 +1,18 @@
 # apps/products/services.py
+import codecs
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.lookups import GreaterThanOrEqual
+from django.db.models.functions import Lower
 from django.utils import timezone
-from .models import Order, ActivityLog
+from .models import Order, OrderItem, ActivityLog, Product, Review, Category, CustomerStats
+from .cache import notify_catalog_changed
+from .search import get_search_backend
+from .rollups import apply_order_stats, order_sales_lines, order_stats_state, with_sales_lines
 from apps.user_management.models import User
 
 class LoyaltyService:
@@ -73,13 +84,10 @@ class LoyaltyService:
     @staticmethod
     def get_user_loyalty_summary(user):
         """Get loyalty summary for a user"""
-        # Count qualifying orders for this user
-        qualifying_orders = Order.objects.filter(
-            user=user,
-            order_type='online',
-            total_amount__gte=700,
-            status='completed'
-        ).count()
+        # Qualifying orders are counted in CustomerStats as they complete
+        qualifying_orders = CustomerStats.objects.filter(user=user).values_list(
+            'qualifying_order_count', flat=True
+        ).first() or 0
         
         return {
             'points': user.loyalty_points,
@@ -111,3 +119,555 @@ class LoyaltyService:
         else:
             return {'tier': 'Bronze', 'points_needed': 35 - current_points}
 
+
+
+
+class ProductAggregateService:
+    @staticmethod
+    def rebuild_rating_aggregates(batch_size=500):
+        """
+        Rebuild the stored rating columns of every product
+        - One grouped query over active reviews
+        - Products are rewritten with bulk_update in batches
+        """
+        totals = {
+            row['product_id']: (row['rating_sum'], row['rating_count'])
+            for row in Review.objects.filter(is_active=True).values('product_id').annotate(
+                rating_sum=Sum('rating'),
+                rating_count=Count('id')
+            ).order_by()
+        }
+        
+        updated = 0
+        now = timezone.now()
+        with transaction.atomic():
+            batch = []
+            for product in Product.objects.only(
+                'id', 'rating_sum', 'rating_count', 'rating_average'
+            ).order_by('id').iterator(chunk_size=batch_size):
+                rating_sum, rating_count = totals.get(product.id, (0, 0))
+                rating_average = Product.compute_rating_average(rating_sum, rating_count)
+                if (product.rating_sum, product.rating_count, product.rating_average) == (
+                        rating_sum, rating_count, rating_average):
+                    continue
+                
+                product.rating_sum = rating_sum
+                product.rating_count = rating_count
+                product.rating_average = rating_average
+                product.updated_at = now
+                batch.append(product)
+                
+                if len(batch) >= batch_size:
+                    Product.objects.bulk_update(
+                        batch, ['rating_sum', 'rating_count', 'rating_average', 'updated_at']
+                    )
+                    updated += len(batch)
+                    batch = []
+            
+            if batch:
+                Product.objects.bulk_update(
+                    batch, ['rating_sum', 'rating_count', 'rating_average', 'updated_at']
+                )
+                updated += len(batch)
+            
+            if updated:
+                notify_catalog_changed()
+        
+        return updated
+    
+    @staticmethod
+    def rebuild_sales_counts(batch_size=500):
+        """Rebuild Product.sales_count from order lines with one grouped query"""
+        totals = dict(
+            OrderItem.objects.values('product_id').annotate(
+                units=Sum('quantity')
+            ).order_by().values_list('product_id', 'units')
+        )
+        
+        with transaction.atomic():
+            batch = []
+            for product in Product.objects.only('id', 'sales_count').order_by('id').iterator(chunk_size=batch_size):
+                units = totals.get(product.id) or 0
+                if product.sales_count != units:
+                    product.sales_count = units
+                    batch.append(product)
+            
+            Product.objects.bulk_update(batch, ['sales_count'], batch_size=batch_size)
+            if batch:
+                notify_catalog_changed()
+        
+        return len(batch)
+
+
+class ProductImportService:
+    """
+    Bulk product upsert from CSV or JSON Lines
+    - The upload is read row by row, never loaded whole
+    - Rows are validated and written in batches with bulk_create/bulk_update
+    - Everything runs in one transaction, any invalid row rolls the import back
+    """
+    FILE_TYPES = ('csv', 'jsonl')
+    UPDATE_FIELDS = [
+        'name', 'description', 'price', 'pricing_type', 'available_weights',
+        'stock_quantity', 'category', 'product_type', 'is_active', 'show',
+        'is_spicy', 'updated_at'
+    ]
+    MAX_REPORTED_ERRORS = 100
+    
+    @staticmethod
+    def detect_file_type(uploaded_file, requested=None):
+        """csv/jsonl from the explicit file_type, else from the file name"""
+        if requested:
+            requested = requested.lower()
+            return requested if requested in ProductImportService.FILE_TYPES else None
+        name = (uploaded_file.name or '').lower()
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+        return None
+    
+    @staticmethod
+    def clean_csv_row(row):
+        """Empty cells mean "keep the current value", weights may be JSON or ; separated"""
+        cleaned = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        weights = cleaned.get('available_weights')
+        if weights is not None:
+            if weights.startswith('['):
+                try:
+                    cleaned['available_weights'] = json.loads(weights)
+                except ValueError:
+                    pass
+            else:
+                cleaned['available_weights'] = [weight for weight in weights.split(';') if weight.strip()]
+        return cleaned
+    
+    @staticmethod
+    def iter_rows(uploaded_file, file_type):
+        """Yield (line number, row dict, parse error) from the upload, a non UTF-8 file ends on an error row"""
+        uploaded_file.seek(0)
+        lines = codecs.iterdecode(uploaded_file, 'utf-8-sig')
+        reader = csv.DictReader(lines) if file_type == 'csv' else None
+        line_number = 0
+        
+        try:
+            if reader is not None:
+                for row in reader:
+                    yield reader.line_num, ProductImportService.clean_csv_row(row), None
+                return
+            
+            for line_number, line in enumerate(lines, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield line_number, None, 'Invalid JSON'
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None, 'Each line must be a JSON object'
+                    continue
+                yield line_number, {key: value for key, value in row.items() if value is not None}, None
+        except UnicodeDecodeError:
+            failed_line = (reader.line_num if reader is not None else line_number) + 1
+            yield failed_line, None, 'File is not UTF-8 encoded text'
+    
+    @staticmethod
+    def import_rows(rows, batch_size=200, dry_run=False):
+        """Upsert products from iter_rows() output and return a summary"""
+        from .serializers import ProductImportRowSerializer
+        
+        result = {'rows': 0, 'created': 0, 'updated': 0, 'error_count': 0, 'errors': []}
+        touched_ids = []
+        
+        def add_error(line_number, errors):
+            result['error_count'] += 1
+            if len(result['errors']) < ProductImportService.MAX_REPORTED_ERRORS:
+                result['errors'].append({'row': line_number, 'errors': errors})
+        
+        def flush(batch):
+            validated = []
+            for line_number, data in batch:
+                serializer = ProductImportRowSerializer(data=data)
+                if serializer.is_valid():
+                    validated.append((line_number, serializer.validated_data))
+                else:
+                    add_error(line_number, serializer.errors)
+            
+            # Once a row failed nothing is written, later batches are only validated
+            if result['error_count']:
+                return
+            created, updated = ProductImportService._write_batch(validated, add_error)
+            result['created'] += len(created)
+            result['updated'] += len(updated)
+            touched_ids.extend(product.pk for product in created + updated)
+        
+        with transaction.atomic():
+            batch = []
+            for line_number, data, error in rows:
+                result['rows'] += 1
+                if error:
+                    add_error(line_number, {'non_field_errors': [error]})
+                    continue
+                batch.append((line_number, data))
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+            
+            if result['error_count'] or dry_run:
+                transaction.set_rollback(True)
+            elif touched_ids:
+                get_search_backend().index_products(touched_ids)
+                notify_catalog_changed()
+        
+        return result
+    
+    @staticmethod
+    def _write_batch(validated, add_error):
+        """Resolve categories and existing products for a batch in a few queries, then upsert"""
+        category_ids = {data['category'] for _, data in validated if 'category' in data}
+        category_names = {data['category_name'].lower() for _, data in validated if 'category' not in data}
+        categories_by_id = Category.objects.in_bulk(category_ids)
+        categories_by_name = {
+            category.name.lower(): category
+            for category in Category.objects.annotate(
+                lower_name=Lower('name')
+            ).filter(lower_name__in=category_names).order_by('-pk')
+        }
+        
+        product_ids = {data['id'] for _, data in validated if 'id' in data}
+        products_by_id = Product.objects.in_bulk(product_ids)
+        names = {data['name'].lower() for _, data in validated if 'id' not in data}
+        products_by_key = {
+            (product.category_id, product.name.lower()): product
+            for product in Product.objects.annotate(
+                lower_name=Lower('name')
+            ).filter(lower_name__in=names).order_by('-pk')
+        }
+        
+        now = timezone.now()
+        errors = []
+        pending_create = {}
+        pending_update = {}
+        for line_number, data in validated:
+            data = dict(data)
+            if 'category' in data:
+                category = categories_by_id.get(data.pop('category'))
+                data.pop('category_name', None)
+            else:
+                category = categories_by_name.get(data.pop('category_name').lower())
+            if category is None:
+                errors.append(line_number)
+                add_error(line_number, {'category': ['Unknown category']})
+                continue
+            
+            product_id = data.pop('id', None)
+            key = (category.pk, data['name'].lower())
+            if product_id is not None:
+                product = products_by_id.get(product_id)
+                if product is None:
+                    errors.append(line_number)
+                    add_error(line_number, {'id': ['Unknown product id']})
+                    continue
+            else:
+                # Rows without an id match an existing product by name within the category
+                product = products_by_key.get(key) or pending_create.get(key)
+            
+            if product is None:
+                product = Product(category=category, **data)
+                pending_create[key] = product
+            else:
+                product.category = category
+                for field, value in data.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+                if product.pk:
+                    pending_update[product.pk] = product
+            product.apply_default_weights()
+        
+        if errors:
+            return [], []
+        
+        created = Product.objects.bulk_create(list(pending_create.values()))
+        updated = list(pending_update.values())
+        if updated:
+            Product.objects.bulk_update(updated, ProductImportService.UPDATE_FIELDS)
+        return created, updated
+
+
+class ProductExportService:
+    """Stream the catalog as CSV or JSON Lines in the import format"""
+    FIELDS = [
+        'id', 'name', 'description', 'price', 'pricing_type', 'available_weights',
+        'stock_quantity', 'category', 'category_name', 'product_type', 'is_active',
+        'show', 'is_spicy'
+    ]
+    CHUNK_SIZE = 500
+    
+    class Echo:
+        """File-like object for csv.writer that hands each line back instead of buffering"""
+        def write(self, value):
+            return value
+    
+    @staticmethod
+    def iter_products():
+        columns = [
+            'category_id' if field == 'category' else
+            'category__name' if field == 'category_name' else field
+            for field in ProductExportService.FIELDS
+        ]
+        rows = Product.objects.order_by('pk').values_list(*columns).iterator(
+            chunk_size=ProductExportService.CHUNK_SIZE
+        )
+        for row in rows:
+            yield dict(zip(ProductExportService.FIELDS, row))
+    
+    @staticmethod
+    def stream_csv():
+        writer = csv.writer(ProductExportService.Echo())
+        yield writer.writerow(ProductExportService.FIELDS)
+        for product in ProductExportService.iter_products():
+            product['available_weights'] = json.dumps(product['available_weights'])
+            for field in ('is_active', 'show', 'is_spicy'):
+                product[field] = 'true' if product[field] else 'false'
+            yield writer.writerow([product[field] for field in ProductExportService.FIELDS])
+    
+    @staticmethod
+    def stream_jsonl():
+        for product in ProductExportService.iter_products():
+            yield json.dumps(product, cls=DjangoJSONEncoder) + '\n'
+
+
+class StockAdjustmentError(Exception):
+    """Raised when a stock adjustment can't be applied, errors lists the failing products"""
+    def __init__(self, errors):
+        super().__init__('Stock adjustment failed')
+        self.errors = errors
+
+
+class StockShortageError(Exception):
+    """
+    Raised by StockService.reserve when the guarded UPDATE missed a product, nothing is taken
+    - short / levels come from a re-read after the rollback and only serve the message,
+      short can be empty when stock was refilled in between
+    """
+    def __init__(self, short, levels):
+        super().__init__('Insufficient stock')
+        self.short = short
+        self.levels = levels
+
+
+class GuardedUpdateMissed(Exception):
+    """Leaves the savepoint of a guarded UPDATE so the rows that did match are rolled back"""
+
+
+class StockService:
+    @staticmethod
+    def reserve(quantities, sales=None):
+        """
+        Take stock for several products with one conditional UPDATE
+        - quantities: {product id: units to take}, sales: {product id: units sold}
+        - Raises StockShortageError unless every product had enough; in that case nothing is taken
+        """
+        if not quantities:
+            return
+        sales = sales or {}
+        
+        taken = Case(
+            *[When(pk=product_id, then=Value(units)) for product_id, units in quantities.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+        sold = Case(
+            *[When(pk=product_id, then=Value(sales.get(product_id, 0))) for product_id in quantities],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+        
+        try:
+            with transaction.atomic():
+                updated = Product.objects.filter(pk__in=quantities).filter(
+                    GreaterThanOrEqual(F('stock_quantity') - taken, 0)
+                ).update(
+                    stock_quantity=F('stock_quantity') - taken,
+                    sales_count=F('sales_count') + sold,
+                    updated_at=timezone.now()
+                )
+                if updated != len(quantities):
+                    # Undo the rows that did fit, the order can't be placed partially
+                    raise GuardedUpdateMissed()
+        except GuardedUpdateMissed:
+            levels = dict(Product.objects.filter(pk__in=quantities).values_list('id', 'stock_quantity'))
+            short = [
+                product_id for product_id, units in quantities.items()
+                if levels.get(product_id, 0) < units
+            ]
+            raise StockShortageError(short, levels) from None
+        
+        # Catalog responses and the static menu carry stock_quantity
+        notify_catalog_changed()
+    
+    @staticmethod
+    def apply_adjustments(adjustments, user=None, ip_address=None):
+        """
+        Apply many stock deltas at once
+        - adjustments: dicts with product (id), delta (signed int) and optional reason
+        - One UPDATE with database-side arithmetic, guarded so no product goes below zero
+        - All or nothing: any missing product or insufficient stock raises StockAdjustmentError
+        - Returns {product id: new stock level}
+        """
+        totals = {}
+        for adjustment in adjustments:
+            product_id = adjustment['product']
+            totals[product_id] = totals.get(product_id, 0) + adjustment['delta']
+        
+        delta = Case(
+            *[When(pk=product_id, then=Value(total)) for product_id, total in totals.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+        
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    updated = Product.objects.filter(pk__in=totals).filter(
+                        GreaterThanOrEqual(F('stock_quantity') + delta, 0)
+                    ).update(stock_quantity=F('stock_quantity') + delta, updated_at=timezone.now())
+                    if updated != len(totals):
+                        raise GuardedUpdateMissed()
+            except GuardedUpdateMissed:
+                # The guard skipped some rows, the savepoint is rolled back so the
+                # levels read now are the ones the guard saw
+                raise StockAdjustmentError(StockService.adjustment_errors(totals)) from None
+            
+            products = {
+                product['id']: product
+                for product in Product.objects.filter(pk__in=totals).values('id', 'name', 'stock_quantity')
+            }
+            
+            # Rebuild each row's before/after levels from the final levels
+            levels = {
+                product_id: products[product_id]['stock_quantity'] - total
+                for product_id, total in totals.items()
+            }
+            logs = []
+            for adjustment in adjustments:
+                product = products[adjustment['product']]
+                old_stock = levels[product['id']]
+                levels[product['id']] = old_stock + adjustment['delta']
+                
+                if adjustment['delta'] > 0:
+                    action, action_description = 'stock_add', 'added to'
+                else:
+                    action, action_description = 'stock_reduce', 'reduced from'
+                description = f"Stock {action_description} {product['name']}"
+                if adjustment.get('reason'):
+                    description += f" - Reason: {adjustment['reason']}"
+                
+                logs.append(ActivityLog(
+                    user=user,
+                    action=action,
+                    model_name='Product',
+                    object_id=str(product['id']),
+                    description=description,
+                    old_value=str(old_stock),
+                    new_value=str(levels[product['id']]),
+                    ip_address=ip_address
+                ))
+            ActivityLog.objects.bulk_create(logs)
+            notify_catalog_changed()
+        
+        return {product_id: products[product_id]['stock_quantity'] for product_id in totals}
+    
+    @staticmethod
+    def adjustment_errors(totals):
+        """The products of a failed adjustment that are missing or would go below zero"""
+        levels = dict(Product.objects.filter(pk__in=totals).values_list('id', 'stock_quantity'))
+        errors = []
+        for product_id, total in totals.items():
+            if product_id not in levels:
+                errors.append({'product': product_id, 'error': 'Product not found'})
+            elif levels[product_id] + total < 0:
+                errors.append({
+                    'product': product_id,
+                    'error': 'Insufficient stock',
+                    'stock_quantity': levels[product_id],
+                    'requested': total,
+                })
+        if not errors:
+            # Stock moved between the UPDATE and the re-read
+            errors.append({'error': 'Stock changed during the adjustment, please retry'})
+        return errors
+
+
+
+class OrderStatusError(Exception):
+    """Raised when an order can't move to the requested status, e.g. another update won the race"""
+    def __init__(self, message, current_status, requested_status):
+        super().__init__(message)
+        self.current_status = current_status
+        self.requested_status = requested_status
+    
+    @property
+    def allowed(self):
+        return list(Order.STATUS_TRANSITIONS.get(self.current_status, ()))
+
+
+class OrderStatusService:
+    @staticmethod
+    def transition(order, changes, user=None):
+        """
+        Apply an admin update to an order as one compare-and-set UPDATE
+        - changes: validated OrderSerializer data, status must follow Order.STATUS_TRANSITIONS
+        - The row is only written if its status (and payment_verified, when that changes)
+          still match what `order` was loaded with, otherwise OrderStatusError is raised
+        - ready_at and payment_verified_by/_at are stamped in the same statement
+        - Returns the refreshed order
+        """
+        old_status = order.status
+        new_status = changes.get('status', old_status)
+        if not order.can_transition_to(new_status):
+            raise OrderStatusError(
+                f"Order can't move from {old_status} to {new_status}", old_status, new_status
+            )
+        
+        now = timezone.now()
+        old_stats = order_stats_state(order, lines={})
+        conditions = {'pk': order.pk, 'status': old_status}
+        values = {}
+        
+        payment_verified = changes.get('payment_verified')
+        if payment_verified is not None and payment_verified != order.payment_verified:
+            conditions['payment_verified'] = order.payment_verified
+            values['payment_verified_by'] = user if payment_verified else None
+            values['payment_verified_at'] = now if payment_verified else None
+        
+        if new_status == Order.READY and new_status != old_status and not order.ready_at:
+            values['ready_at'] = now
+        
+        for name, value in changes.items():
+            field = Order._meta.get_field(name)
+            setattr(order, field.attname, value)
+            # pre_save commits uploaded files to storage before the UPDATE references them
+            values[name] = field.pre_save(order, False)
+        if 'fulfillment_method' in changes:
+            values['delivery_fee'] = order.calculate_delivery_fee()
+        values['updated_at'] = now
+        
+        if not Order.objects.filter(**conditions).update(**values):
+            current_status = Order.objects.filter(pk=order.pk).values_list('status', flat=True).first()
+            raise OrderStatusError(
+                'Order was changed by another update, reload it and try again',
+                current_status, new_status
+            )
+        
+        order.refresh_from_db()
+        new_stats = order_stats_state(order, lines={})
+        if new_stats != old_stats:
+            # Items don't change here, they only have to be looked up once
+            lines = order_sales_lines(order.pk)
+            apply_order_stats(with_sales_lines(old_stats, lines), with_sales_lines(new_stats, lines))
+        return order
@@ -0,0 +1,41 @@
+# apps/products/signals.py
+"""
+Receivers for deletes that don't go through Model.delete()
+- Cascades (category -> products -> order items, order -> items) and queryset.delete()
+  still send pre/post_delete per row, so sync tombstones are written, the
+  sales rollups adjusted and product ratings refreshed for every path
+"""
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import rollups
+from .models import Order, OrderItem, Product, Review, Tombstone
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderItem)
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.record(sender.__name__, [instance.pk])
+
+
+@receiver(pre_delete, sender=Order)
+def read_order_stats(sender, instance, **kwargs):
+    # Every pre_delete of a cascade runs before any row is gone, the items are still there
+    instance._deleted_stats = rollups.order_stats_state(instance)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_stats(sender, instance, **kwargs):
+    # After the delete, so the customer's stats are recomputed without this order
+    rollups.apply_order_stats(instance._deleted_stats, None)
+
+
+@receiver(pre_delete, sender=Product)
+def remove_product_stats(sender, instance, **kwargs):
+    rollups.remove_product_items(instance.pk)
+
+
+@receiver(post_delete, sender=Review)
+def refresh_product_rating(sender, instance, **kwargs):
+    Product.refresh_rating_aggregates(instance.product_id)
@@ -0,0 +1,103 @@
+# apps/products/sync.py
+"""
+"Changes since" sync for POS tablets and dashboards
+- Clients send the watermark of their last sync and get the rows whose updated_at
+  is past it, plus tombstones for deleted rows, and a new watermark
+- The window stops SYNC_SETTLE_SECONDS short of now so rows written by a transaction
+  that hasn't committed yet aren't skipped
+- Without a watermark the current rows are returned (initial sync), paged the same way
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Tombstone
+
+
+class SyncWatermarkExpired(Exception):
+    """The watermark is older than the kept tombstones, the client has to sync from scratch"""
+
+
+class SyncSection:
+    def __init__(self, key, queryset, serializer_class, model_name):
+        self.key = key
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self.model_name = model_name
+
+
+def parse_watermark(value):
+    """Aware datetime from an ISO watermark, None when empty; raises ValueError"""
+    if not value:
+        return None
+    watermark = parse_datetime(value.replace(' ', '+'))
+    if watermark is None:
+        raise ValueError(value)
+    if timezone.is_naive(watermark):
+        watermark = timezone.make_aware(watermark, timezone.utc)
+    return watermark
+
+
+def in_window(queryset, field, since, upto):
+    queryset = queryset.filter(**{f'{field}__lte': upto})
+    if since is not None:
+        queryset = queryset.filter(**{f'{field}__gt': since})
+    return queryset
+
+
+def collect_changes(sections, since=None, limit=None, context=None):
+    """
+    {<section key>: [rows], 'deleted': {<section key>: [ids]}, 'watermark', 'has_more'}
+    - At most about `limit` rows per section, rows sharing the boundary timestamp all
+      go in the same page so the next page can start strictly after it
+    """
+    now = timezone.now()
+    limit = limit or getattr(settings, 'SYNC_PAGE_SIZE', 500)
+    ttl = timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_TTL_DAYS', 30))
+    if since is not None and since < now - ttl:
+        raise SyncWatermarkExpired()
+
+    upto = now - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 2))
+    if since is not None and since >= upto:
+        upto = since
+
+    tombstones = Tombstone.objects.filter(model_name__in=[section.model_name for section in sections])
+    candidates = [(section.queryset, 'updated_at') for section in sections]
+    if since is not None:
+        candidates.append((tombstones, 'deleted_at'))
+
+    # Pull the window end back to the last row inside the limit when there are more
+    has_more = False
+    for queryset, field in candidates:
+        boundary = list(
+            in_window(queryset, field, since, upto).order_by(field).values_list(field, flat=True)[limit - 1:limit + 1]
+        )
+        if len(boundary) == 2:
+            upto = boundary[0]
+            has_more = True
+
+    data = {}
+    for section in sections:
+        rows = in_window(section.queryset, 'updated_at', since, upto).order_by('updated_at', 'pk')
+        data[section.key] = section.serializer_class(rows, many=True, context=context).data
+
+    deleted = {section.key: [] for section in sections}
+    if since is not None:
+        keys = {section.model_name: section.key for section in sections}
+        for model_name, object_id in in_window(tombstones, 'deleted_at', since, upto).values_list(
+            'model_name', 'object_id'
+        ):
+            deleted[keys[model_name]].append(object_id)
+    data['deleted'] = deleted
+
+    data['watermark'] = upto.isoformat()
+    data['has_more'] = has_more
+    return data
+
+
+def purge_tombstones():
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_TTL_DAYS', 30))
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
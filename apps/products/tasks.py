@@ -0,0 +1,45 @@
+# apps/products/tasks.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_TASK_WORKERS', 2),
+                thread_name_prefix='wangari-task'
+            )
+    return _executor
+
+
+def _run_task(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', getattr(func, '__name__', func))
+    finally:
+        # Worker threads get their own connections, don't leak them
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Run func on the background worker pool (inline when BACKGROUND_TASKS_EAGER is set)"""
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        return func(*args, **kwargs)
+    return get_executor().submit(_run_task, func, args, kwargs)
+
+
+def run_after_commit(func, *args, **kwargs):
+    """Queue func for the background pool once the current transaction commits"""
+    transaction.on_commit(lambda: run_in_background(func, *args, **kwargs))
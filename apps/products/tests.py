@@ -1,3 +1,1272 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from django.contrib.auth.models import Group
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.user_management.models import User
+from . import cart_store, outbox
+from .analytics_cache import get_analytics_cache, section_key
+from .analytics_views import OwnerAnalyticsView
+from .authentication import issue_order_feed_token
+from .cache import bump_catalog_version, get_catalog_version
+from .pagination import KeysetPagination
+from .sequences import SequenceAllocator
+from . import menu
+from .search import get_search_backend
+from .serializers import ProductListSerializer
+from . import rollups
+from .models import (
+    ActivityLog, CartItem, Category, CustomerStats, IdempotencyKey, Order, OrderDailyStats, OrderItem,
+    OutboxEvent, Product, ProductDailySales, Review, SequenceCounter, Tombstone
+)
+from .services import (
+    LoyaltyService, OrderStatusError, OrderStatusService, StockAdjustmentError, StockService,
+    StockShortageError
+)
+
+
+class StockAdjustmentTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.a = Product.objects.create(name='A', price=10, stock_quantity=10, category=category)
+        self.b = Product.objects.create(name='B', price=10, stock_quantity=0, category=category)
+
+    def test_applies_deltas(self):
+        levels = StockService.apply_adjustments([
+            {'product': self.a.pk, 'delta': -3},
+            {'product': self.a.pk, 'delta': 5, 'reason': 'delivery'},
+        ])
+        self.assertEqual(levels, {self.a.pk: 12})
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.stock_quantity, 12)
+
+    def test_only_the_short_product_is_reported(self):
+        with self.assertRaises(StockAdjustmentError) as ctx:
+            StockService.apply_adjustments([
+                {'product': self.a.pk, 'delta': -8},
+                {'product': self.b.pk, 'delta': -1},
+            ])
+        self.assertEqual(ctx.exception.errors, [{
+            'product': self.b.pk,
+            'error': 'Insufficient stock',
+            'stock_quantity': 0,
+            'requested': -1,
+        }])
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.stock_quantity, 10)
+
+    def test_missing_product(self):
+        with self.assertRaises(StockAdjustmentError) as ctx:
+            StockService.apply_adjustments([{'product': 999, 'delta': 1}])
+        self.assertEqual(ctx.exception.errors, [{'product': 999, 'error': 'Product not found'}])
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.a = Product.objects.create(name='A', price=10, stock_quantity=10, category=category)
+        self.b = Product.objects.create(name='B', price=10, stock_quantity=1, category=category)
+
+    def levels(self):
+        return dict(Product.objects.values_list('name', 'stock_quantity'))
+
+    def test_takes_stock_and_counts_sales(self):
+        StockService.reserve({self.a.pk: 4, self.b.pk: 1}, sales={self.a.pk: 2, self.b.pk: 1})
+        self.assertEqual(self.levels(), {'A': 6, 'B': 0})
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.sales_count, 2)
+
+    def test_shortage_takes_nothing(self):
+        with self.assertRaises(StockShortageError) as ctx:
+            StockService.reserve({self.a.pk: 4, self.b.pk: 2})
+        self.assertEqual(ctx.exception.short, [self.b.pk])
+        self.assertEqual(self.levels(), {'A': 10, 'B': 1})
+
+    def test_order_is_not_created_when_the_reread_finds_no_shortage(self):
+        # Stock refilled between the failed UPDATE and the re-read
+        client = APIClient()
+        body = {
+            'customer_name': 'A', 'customer_phone': '1', 'customer_email': 'a@b.com',
+            'items': [{'product': self.a.pk, 'quantity': 1}],
+        }
+        with mock.patch.object(StockService, 'reserve', side_effect=StockShortageError([], {})):
+            response = client.post('/products/orders/create/', body, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderProductLookupTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.products = Product.objects.bulk_create([
+            Product(name=f'P{i}', price=10, stock_quantity=10, category=category) for i in range(6)
+        ])
+        self.client = APIClient()
+
+    def product_selects(self, products, extra=()):
+        body = {
+            'customer_name': 'A', 'customer_phone': '1', 'customer_email': 'a@b.com',
+            'items': [{'product': product.pk, 'quantity': 1} for product in products] + list(extra),
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/products/orders/create/', body, format='json')
+        selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "products_product"' in query['sql']
+        ]
+        return response, selects
+
+    def test_one_product_query_whatever_the_line_count(self):
+        response, selects = self.product_selects(self.products[:1])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(selects), 1)
+
+        response, selects = self.product_selects(self.products)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(selects), 1)
+        self.assertEqual(OrderItem.objects.count(), 7)
+
+    def test_unknown_product_is_rejected_from_the_same_lookup(self):
+        response, selects = self.product_selects(self.products[:2], extra=[{'product': 999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(selects), 1)
+        self.assertFalse(Order.objects.exists())
+
+
+class SyncTombstoneTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Mains')
+        self.product = Product.objects.create(name='A', price=10, stock_quantity=10, category=self.category)
+        self.order = Order.objects.create(customer_name='A', customer_phone='1', customer_email='a@b.com')
+        self.item = OrderItem.objects.create(order=self.order, product=self.product, quantity=1, unit_price=10)
+
+    def tombstones(self):
+        return set(Tombstone.objects.values_list('model_name', 'object_id'))
+
+    def test_category_delete_cascades_tombstones(self):
+        self.category.delete()
+        self.assertEqual(self.tombstones(), {('Product', self.product.pk), ('OrderItem', self.item.pk)})
+
+    def test_queryset_delete(self):
+        Order.objects.filter(pk=self.order.pk).delete()
+        self.assertEqual(self.tombstones(), {('Order', self.order.pk), ('OrderItem', self.item.pk)})
+
+    def test_category_rename_touches_products(self):
+        before = self.product.updated_at
+        self.category.name = 'Grill'
+        self.category.save()
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, before)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='sy@x.com', password='p', first_name='S', last_name='S', phone_number='+251900000060'
+        )
+        self.user.groups.add(Group.objects.get_or_create(name='Owner')[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Mains')
+        self.products = [
+            Product.objects.create(name=name, price=10, stock_quantity=5, category=self.category)
+            for name in ('A', 'B', 'C')
+        ]
+
+    def sync(self, url='/products/admin/sync/products/', **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_changes_and_tombstones_since_the_watermark(self):
+        initial = self.sync()
+        self.assertEqual([row['name'] for row in initial['products']], ['A', 'B', 'C'])
+        self.assertFalse(initial['has_more'])
+
+        self.products[0].price = 12
+        self.products[0].save()
+        deleted = self.products[1].pk
+        self.products[1].delete()
+        data = self.sync(since=initial['watermark'])
+        self.assertEqual([row['name'] for row in data['products']], ['A'])
+        self.assertEqual(data['deleted'], {'products': [deleted]})
+
+        self.assertEqual(self.sync(since=data['watermark'])['products'], [])
+
+    def test_order_feed_carries_items_and_their_tombstones(self):
+        order = Order.objects.create(customer_name='A', customer_phone='1', customer_email='a@b.com')
+        item = OrderItem.objects.create(order=order, product=self.products[0], quantity=1, unit_price=10)
+        initial = self.sync('/products/admin/sync/orders/')
+        self.assertEqual([row['id'] for row in initial['orders']], [order.pk])
+        self.assertEqual([row['id'] for row in initial['order_items']], [item.pk])
+
+        order_id = order.pk
+        order.delete()
+        data = self.sync('/products/admin/sync/orders/', since=initial['watermark'])
+        self.assertEqual(data['deleted'], {'orders': [order_id], 'order_items': [item.pk]})
+
+    def test_pages_follow_the_watermark(self):
+        base = timezone.now() - timedelta(minutes=5)
+        for offset, product in enumerate(self.products):
+            Product.objects.filter(pk=product.pk).update(updated_at=base + timedelta(seconds=offset))
+
+        names, params = [], {'limit': 2}
+        while True:
+            data = self.sync(**params)
+            names += [row['name'] for row in data['products']]
+            if not data['has_more']:
+                break
+            params = {'limit': 2, 'since': data['watermark']}
+        self.assertEqual(names, ['A', 'B', 'C'])
+
+    def test_expired_and_malformed_watermarks(self):
+        expired = (timezone.now() - timedelta(days=31)).isoformat()
+        response = self.client.get('/products/admin/sync/products/', {'since': expired})
+        self.assertEqual(response.status_code, 410)
+        response = self.client.get('/products/admin/sync/products/', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ORDER_FEED_WSGI_STREAM_TIMEOUT=0)
+class OrderFeedTokenTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='w@x.com', password='p', first_name='W', last_name='W',
+            phone_number='+251900000001'
+        )
+        self.user.groups.add(Group.objects.get_or_create(name='Chef')[0])
+        self.client = APIClient()
+
+    def test_stream_accepts_feed_token(self):
+        self.client.force_authenticate(self.user)
+        token = self.client.post('/products/admin/orders/events/token/').data['token']
+        self.client.force_authenticate(None)
+        response = self.client.get('/products/admin/orders/events/', {'token': token})
+        self.assertEqual(response.status_code, 200)
+
+    def test_stream_starts_with_the_cursor_as_last_event_id(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/products/admin/orders/events/', {'after': 7})
+        self.assertEqual(b''.join(response.streaming_content), b'retry: 2000\nid: 7\n\n')
+
+    def test_expired_token_is_rejected_on_reconnect(self):
+        self.client.force_authenticate(self.user)
+        token = self.client.post('/products/admin/orders/events/token/').data['token']
+        self.client.force_authenticate(None)
+        url = '/products/admin/orders/events/'
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 301):
+            self.assertEqual(self.client.get(url, {'token': token}).status_code, 401)
+            response = self.client.get(url, {'token': token}, HTTP_LAST_EVENT_ID='5')
+            self.assertEqual(response.status_code, 401)
+
+    def test_stream_rejects_access_jwt_in_query(self):
+        access = str(AccessToken.for_user(self.user))
+        response = self.client.get('/products/admin/orders/events/', {'token': access})
+        self.assertEqual(response.status_code, 401)
+
+    def test_poll_ignores_query_token(self):
+        response = self.client.get('/products/admin/orders/events/poll/', {'token': issue_order_feed_token(self.user)})
+        self.assertEqual(response.status_code, 401)
+
+
+class CartQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='c@x.com', password='p', first_name='C', last_name='C', phone_number='+251900000002'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Mains')
+        self.products = [
+            Product.objects.create(name=f'P{i}', price=10, stock_quantity=100, category=category)
+            for i in range(6)
+        ]
+
+    def fill(self, count):
+        for product in self.products[:count]:
+            self.client.post('/products/cart/add/', {'product_id': product.pk, 'quantity': 1}, format='json')
+        return list(CartItem.objects.filter(cart__user=self.user).values_list('pk', flat=True))
+
+    def mutation_queries(self, count):
+        CartItem.objects.filter(cart__user=self.user).delete()
+        first, *_ = self.fill(count)
+        with CaptureQueriesContext(connection) as update:
+            response = self.client.patch(f'/products/cart/items/{first}/', {'quantity': 2}, format='json')
+        self.assertEqual(response.data['total_quantity'], count + 1)
+        with CaptureQueriesContext(connection) as remove:
+            response = self.client.delete(f'/products/cart/items/{first}/remove/')
+        self.assertEqual(len(response.data['items']), count - 1)
+        with CaptureQueriesContext(connection) as clear:
+            response = self.client.post('/products/cart/clear/')
+        self.assertEqual(response.data['cart']['items'], [])
+        return len(update), len(remove), len(clear)
+
+    def test_mutation_views_use_a_fixed_number_of_queries(self):
+        self.assertEqual(self.mutation_queries(2), self.mutation_queries(6))
+
+
+@override_settings(CART_STORE='cache')
+class CacheCartStoreTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='c@x.com', password='p', first_name='C', last_name='C', phone_number='+251900000003'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Mains')
+        self.product = Product.objects.create(name='P', price=10, stock_quantity=100, category=category)
+        cart_store.discard(self.user.id)
+
+    def test_item_ids_are_cart_item_pks_and_survive_a_reload(self):
+        response = self.client.post('/products/cart/add/', {'product_id': self.product.pk, 'quantity': 1}, format='json')
+        item_id = response.data['items'][0]['id']
+        self.assertTrue(CartItem.objects.filter(pk=item_id, cart__user=self.user).exists())
+
+        response = self.client.patch(f'/products/cart/items/{item_id}/', {'quantity': 3}, format='json')
+        self.assertEqual(response.data['items'][0]['quantity'], 3)
+        self.assertTrue(cart_store.flush(self.user.id))
+        self.assertEqual(CartItem.objects.get(pk=item_id).quantity, 3)
+
+        # Evicted, the next read reloads from the tables with the same ids
+        cart_store.discard(self.user.id)
+        response = self.client.get('/products/cart/')
+        self.assertEqual([item['id'] for item in response.data['items']], [item_id])
+        response = self.client.delete(f'/products/cart/items/{item_id}/remove/')
+        self.assertEqual(response.data['items'], [])
+        cart_store.flush(self.user.id)
+        self.assertFalse(CartItem.objects.exists())
+
+
+    def test_readding_a_removed_weight_line_before_the_flush(self):
+        kitfo = Product.objects.create(
+            name='Kitfo', price=100, stock_quantity=10, category=self.product.category,
+            pricing_type='per_kg', product_type=Product.FOOD
+        )
+        body = {'product_id': kitfo.pk, 'quantity': 1, 'weight_kg': '0.5'}
+        item_id = self.client.post('/products/cart/add/', body, format='json').data['items'][0]['id']
+        cart_store.flush(self.user.id)
+
+        self.client.delete(f'/products/cart/items/{item_id}/remove/')
+        response = self.client.post('/products/cart/add/', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['items']], [item_id])
+        cart_store.flush(self.user.id)
+        self.assertEqual(CartItem.objects.get().pk, item_id)
+
+    def test_busy_cart_is_a_conflict_and_keeps_the_holders_lock(self):
+        response = self.client.post('/products/cart/add/', {'product_id': self.product.pk, 'quantity': 1}, format='json')
+        item_id = response.data['items'][0]['id']
+        key = f'{cart_store.cart_key(self.user.id)}:lock'
+        cache = cart_store.get_cart_cache()
+        cache.set(key, 'other', 5)
+        self.addCleanup(cache.delete, key)
+
+        with mock.patch.object(cart_store.time, 'monotonic', side_effect=[0, 10]):
+            response = self.client.patch(f'/products/cart/items/{item_id}/', {'quantity': 3}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(cache.get(key), 'other')
+        self.assertEqual(cart_store.load(self.user.id)['items'][0]['quantity'], 1)
+
+
+@override_settings(PRODUCT_SEARCH_LIMIT=5)
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        Product.objects.bulk_create([
+            Product(name=f'Hidden tibs {i}', price=10, stock_quantity=5, category=category, show=False)
+            for i in range(10)
+        ])
+        self.visible = [
+            Product.objects.create(name='Tibs', price=10, stock_quantity=5, category=category),
+            Product.objects.create(name='Doro', description='with tibs', price=12, stock_quantity=5, category=category),
+        ]
+        get_search_backend().rebuild()
+        self.client = APIClient()
+
+    def list_ids(self, **params):
+        response = self.client.get('/products/products/', {'search': 'tibs', **params})
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        return [row['id'] for row in rows]
+
+    def test_hidden_matches_do_not_use_up_the_limit(self):
+        self.assertEqual(self.list_ids(), [product.pk for product in self.visible])
+
+    def test_invalid_ordering_keeps_the_rank(self):
+        self.assertEqual(self.list_ids(ordering='bogus'), [product.pk for product in self.visible])
+
+    def test_valid_ordering_applies(self):
+        self.assertEqual(self.list_ids(ordering='-price'), [self.visible[1].pk, self.visible[0].pk])
+
+    def test_search_view_clamps_limit(self):
+        response = self.client.get('/products/products/search/', {'q': 'tibs', 'limit': -5})
+        self.assertEqual(response.data['results'], [self.visible[0].pk])
+
+
+# Commit hooks run here, keep them from publishing the menu into STATIC_ROOT
+@override_settings(MENU_PUBLISH_ENABLED=False)
+class CatalogVersionTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.product = Product.objects.create(name='A', price=10, stock_quantity=3, category=category)
+
+    def version_after(self, func):
+        before = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+        return get_catalog_version() != before
+
+    def test_stock_decrement_bumps_the_version(self):
+        self.assertTrue(self.version_after(lambda: StockService.reserve({self.product.pk: 1})))
+
+    def test_every_adjustment_bumps_the_version(self):
+        self.assertTrue(self.version_after(
+            lambda: StockService.apply_adjustments([{'product': self.product.pk, 'delta': 2}])
+        ))
+        self.assertTrue(self.version_after(
+            lambda: StockService.apply_adjustments([{'product': self.product.pk, 'delta': -1}])
+        ))
+
+    def test_cached_detail_never_pairs_a_new_etag_with_old_stock(self):
+        client = APIClient()
+        url = f'/products/products/{self.product.pk}/'
+        first = client.get(url)
+        self.assertEqual(first.data['stock_quantity'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService.reserve({self.product.pk: 1})
+        second = client.get(url)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['stock_quantity'], 2)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=second['ETag']).status_code, 304)
+
+
+@override_settings(MENU_PUBLISH_ENABLED=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Mains')
+        self.product = Product.objects.create(name='A', price=10, stock_quantity=3, category=self.category)
+        self.client = APIClient()
+
+    def test_matching_etag_is_answered_before_serializing(self):
+        first = self.client.get('/products/products/')
+        self.assertEqual(first.status_code, 200)
+        with mock.patch.object(ProductListSerializer, 'to_representation') as serialize:
+            response = self.client.get('/products/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        serialize.assert_not_called()
+
+    def test_if_modified_since(self):
+        first = self.client.get('/products/categories/')
+        response = self.client.get('/products/categories/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_and_category_edits_change_the_etag(self):
+        url = f'/products/products/{self.product.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.product.name = 'B'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'B')
+
+        etag = response['ETag']
+        self.category.name = 'Grill'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['category_name'], 'Grill')
+
+    def test_new_review_changes_the_review_list_etag(self):
+        url = f'/products/products/{self.product.pk}/reviews/'
+        etag = self.client.get(url)['ETag']
+        user = User.objects.create_user(
+            email='e@x.com', password='p', first_name='E', last_name='E', phone_number='+251900000050'
+        )
+        Review.objects.create(product=self.product, user=user, rating=4)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_renaming_the_product_or_a_reviewer_changes_the_review_list_etag(self):
+        url = f'/products/products/{self.product.pk}/reviews/'
+        user = User.objects.create_user(
+            email='r@x.com', password='p', first_name='R', last_name='R', phone_number='+251900000051'
+        )
+        Review.objects.create(product=self.product, user=user, rating=4)
+        etag = self.client.get(url)['ETag']
+
+        self.product.name = 'B'
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['product_name'], 'B')
+
+        etag = response['ETag']
+        user.first_name = 'Rahel'
+        user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['user_name'], 'Rahel R')
+
+
+@override_settings(MENU_PUBLISH_ENABLED=False)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        settings = override_settings(
+            MEDIA_ROOT=self.root, BACKGROUND_TASKS_EAGER=True,
+            IMAGE_VARIANT_WIDTHS={'thumbnail': 160, 'card': 480}
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.category = Category.objects.create(name='Mains')
+
+    def upload(self, size=(800, 400), mode='RGBA'):
+        buffer = BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(buffer, format='PNG')
+        return SimpleUploadedFile('tibs.png', buffer.getvalue(), content_type='image/png')
+
+    def create_product(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name='Tibs', price=10, stock_quantity=5, category=self.category, image=self.upload(**kwargs)
+            )
+        product.refresh_from_db()
+        return product
+
+    def test_upload_generates_resized_variants_after_commit(self):
+        product = self.create_product()
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        self.assertEqual(
+            {name: (files['width'], files['height']) for name, files in variants['sizes'].items()},
+            {'thumbnail': (160, 80), 'card': (480, 240)}
+        )
+        for files in variants['sizes'].values():
+            with Image.open(os.path.join(self.root, files['webp'])) as image:
+                self.assertEqual((image.format, image.width), ('WEBP', files['width']))
+            with Image.open(os.path.join(self.root, files['jpeg'])) as image:
+                self.assertEqual((image.format, image.mode), ('JPEG', 'RGB'))
+
+    def test_small_images_are_not_upscaled(self):
+        product = self.create_product(size=(300, 100), mode='RGB')
+        self.assertEqual(product.image_variants['sizes']['card']['width'], 300)
+
+    def test_serializer_exposes_the_srcset(self):
+        product = self.create_product()
+        response = APIClient().get('/products/products/')
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        srcset = rows[0]['image_srcset']
+        self.assertIn('thumbnail.webp 160w', srcset['webp'])
+        self.assertIn('card.jpeg 480w', srcset['jpeg'])
+
+    def test_same_upload_reuses_the_stored_files(self):
+        first = self.create_product()
+        second = self.create_product()
+        self.assertEqual(first.image_variants['sizes'], second.image_variants['sizes'])
+
+    def test_command_backfills_missing_variants(self):
+        product = self.create_product()
+        Product.objects.filter(pk=product.pk).update(image_variants={})
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['source'], product.image.name)
+        self.assertIn('Products: 1 image(s) processed', out.getvalue())
+
+
+class MenuPublishTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.product = Product.objects.create(name='A', price=10, stock_quantity=3, category=category)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        # A publish queued by an earlier test would swallow this one
+        queued = mock.patch.object(menu, '_publish_queued', False)
+        queued.start()
+        self.addCleanup(queued.stop)
+        settings = override_settings(
+            MENU_PUBLISH_ROOT=self.root, MENU_PUBLISH_DELAY=0, BACKGROUND_TASKS_EAGER=True
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def published_stock(self):
+        with open(os.path.join(self.root, menu.MANIFEST_NAME)) as handle:
+            name = json.load(handle)['file']
+        with open(os.path.join(self.root, name)) as handle:
+            return {row['id']: row['stock_quantity'] for row in json.load(handle)['products']}
+
+    def test_stock_moves_republish_the_menu(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService.reserve({self.product.pk: 1})
+        self.assertEqual(self.published_stock(), {self.product.pk: 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService.apply_adjustments([{'product': self.product.pk, 'delta': 4}])
+        self.assertEqual(self.published_stock(), {self.product.pk: 6})
+
+    def test_publish_writes_gzip_and_brotli_copies(self):
+        call_command('publish_menu', stdout=StringIO())
+        with open(os.path.join(self.root, menu.MANIFEST_NAME)) as handle:
+            manifest = json.load(handle)
+        self.assertEqual(manifest['encodings'], ['gzip', 'br'])
+        path = os.path.join(self.root, manifest['file'])
+        with open(path, 'rb') as handle:
+            body = handle.read()
+        with open(f'{path}.gz', 'rb') as handle:
+            self.assertEqual(gzip.decompress(handle.read()), body)
+        with open(f'{path}.br', 'rb') as handle:
+            self.assertEqual(brotli.decompress(handle.read()), body)
+        self.assertEqual(json.loads(body)['products'][0]['id'], self.product.pk)
+
+
+class OrderNumberTests(TestCase):
+    def create_order(self):
+        return Order.objects.create(customer_name='A', customer_phone='1', customer_email='a@b.com')
+
+    def counter(self, order):
+        return int(order.order_number[len('ORD') + 14:])
+
+    def test_numbers_keep_the_format_and_increase(self):
+        first, second = self.create_order(), self.create_order()
+        self.assertRegex(first.order_number, r'^ORD\d{14}\d+$')
+        self.assertEqual(self.counter(second), self.counter(first) + 1)
+
+    def test_rolled_back_order_returns_its_number(self):
+        first = self.create_order()
+        try:
+            with transaction.atomic():
+                self.create_order()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self.counter(self.create_order()), self.counter(first) + 1)
+
+    def test_outside_a_transaction_numbers_come_from_a_reserved_block(self):
+        allocator = SequenceAllocator('test', block_size=5)
+        # TestCase runs everything in a transaction, pretend we are outside one
+        with mock.patch.object(allocator, 'in_transaction', return_value=False):
+            with CaptureQueriesContext(connection) as first:
+                numbers = [allocator.allocate()]
+            with CaptureQueriesContext(connection) as rest:
+                numbers += [allocator.allocate() for _ in range(4)]
+            numbers.append(allocator.allocate())
+        self.assertEqual(numbers, [1, 2, 3, 4, 5, 6])
+        self.assertTrue(first.captured_queries)
+        self.assertEqual(rest.captured_queries, [])
+        self.assertEqual(SequenceCounter.objects.get(name='test').value, 10)
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='i@x.com', password='p', first_name='I', last_name='I', phone_number='+251900000004'
+        )
+        self.user.groups.add(Group.objects.get_or_create(name='Owner')[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Mains')
+
+    def upload(self, content):
+        upload = SimpleUploadedFile('products.csv', content, content_type='text/csv')
+        return self.client.post('/products/admin/products/import/', {'file': upload}, format='multipart')
+
+    def test_non_utf8_file_is_rejected(self):
+        response = self.upload('name,price,category\nKitfo,10,{}\nT\xe9j,5,{}\n'.format(
+            self.category.pk, self.category.pk
+        ).encode('latin-1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][-1]['row'], 3)
+        self.assertFalse(Product.objects.exists())
+
+    def test_logs_only_a_committed_import(self):
+        response = self.upload(f'name,price,category\nKitfo,10,{self.category.pk}\nBad,x,{self.category.pk}\n'.encode())
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ActivityLog.objects.filter(action='bulk_import').exists())
+
+        response = self.upload(f'name,price,category\nKitfo,10,{self.category.pk}\n'.encode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertTrue(ActivityLog.objects.filter(action='bulk_import').exists())
+
+
+class AnalyticsCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='o@x.com', password='p', first_name='O', last_name='O', phone_number='+251900000005'
+        )
+        self.user.groups.add(Group.objects.get_or_create(name='Owner')[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        get_analytics_cache().clear()
+
+    def test_failed_section_is_served_but_not_cached(self):
+        with mock.patch.object(OwnerAnalyticsView, 'get_period_totals', side_effect=RuntimeError):
+            response = self.client.get('/products/admin/analytics/', {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['summary']['total_orders'], 0)
+        cache = get_analytics_cache()
+        self.assertIsNone(cache.get(section_key(7, 'summary')))
+        self.assertIsNone(cache.get(section_key(7, 'revenue_analytics')))
+        self.assertIsNotNone(cache.get(section_key(7, 'order_analytics')))
+
+    def test_days_is_clamped(self):
+        response = self.client.get('/products/admin/analytics/', {'days': 100000})
+        self.assertEqual(response.data['time_period'], 'last_365_days')
+        response = self.client.get('/products/admin/analytics/', {'days': -3})
+        self.assertEqual(response.data['time_period'], 'last_1_days')
+
+    def test_non_integer_days_is_a_bad_request(self):
+        for url in ('/products/admin/analytics/', '/products/admin/analytics/export/'):
+            response = self.client.get(url, {'days': 'week'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('days', response.data)
+
+
+class RollupConsistencyTests(TestCase):
+    """The incrementally kept rollups match what the rebuild_* functions compute"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='r@x.com', password='p', first_name='R', last_name='R', phone_number='+251900000006'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Mains')
+        self.a = Product.objects.create(name='A', price=10, stock_quantity=100, category=self.category)
+        self.b = Product.objects.create(name='B', price=25, stock_quantity=100, category=self.category)
+
+    def place_order(self, *lines):
+        for product, quantity in lines:
+            self.client.post('/products/cart/add/', {'product_id': product.pk, 'quantity': quantity}, format='json')
+        response = self.client.post('/products/orders/create/', {}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Order.objects.get(order_number=response.data['order_number'])
+
+    def rollup_rows(self):
+        return (
+            set(OrderDailyStats.objects.values_list(
+                'date', 'order_type', 'fulfillment_method', 'status', 'order_count', 'item_count',
+                'revenue', 'delivery_fees'
+            )),
+            set(ProductDailySales.objects.values_list(
+                'date', 'product_id', 'status', 'order_count', 'units', 'weight_kg', 'revenue'
+            )),
+            set(CustomerStats.objects.values_list(
+                'user_id', 'order_count', 'completed_order_count', 'completed_spend', 'qualifying_order_count'
+            )),
+        )
+
+    def assertMatchesRebuild(self):
+        kept = self.rollup_rows()
+        rollups.rebuild_order_daily_stats()
+        rollups.rebuild_product_daily_sales()
+        rollups.rebuild_customer_stats()
+        self.assertEqual(kept, self.rollup_rows())
+
+    def test_orders_placed(self):
+        self.place_order((self.a, 2), (self.b, 1))
+        self.place_order((self.a, 1))
+        self.assertEqual(CustomerStats.objects.get(user=self.user).order_count, 2)
+        self.assertMatchesRebuild()
+
+    def test_status_changes(self):
+        order = self.place_order((self.a, 2), (self.b, 1))
+        self.place_order((self.a, 1))
+        for new_status in (Order.CONFIRMED, Order.PREPARING, Order.READY, Order.COMPLETED):
+            order = OrderStatusService.transition(order, {'status': new_status})
+        self.assertEqual(CustomerStats.objects.get(user=self.user).completed_order_count, 1)
+        self.assertMatchesRebuild()
+
+    def test_queryset_order_delete(self):
+        first = self.place_order((self.a, 2), (self.b, 1))
+        self.place_order((self.a, 1))
+        Order.objects.filter(pk=first.pk).delete()
+        self.assertMatchesRebuild()
+
+    def test_last_order_delete_leaves_no_zero_rows(self):
+        order = self.place_order((self.a, 2))
+        order.delete()
+        self.assertEqual(self.rollup_rows(), (set(), set(), set()))
+
+    def test_product_delete_cascading_items(self):
+        self.place_order((self.a, 2), (self.b, 3))
+        self.b.delete()
+        self.assertEqual(OrderDailyStats.objects.get().item_count, 2)
+        self.assertMatchesRebuild()
+
+    def test_category_delete(self):
+        self.place_order((self.a, 2), (self.b, 3))
+        self.category.delete()
+        self.assertMatchesRebuild()
+
+
+class SalesAnalyticsTests(TestCase):
+    """Owner analytics figures read from the rollups"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='so@x.com', password='p', first_name='O', last_name='O', phone_number='+251900000030'
+        )
+        self.owner.groups.add(Group.objects.get_or_create(name='Owner')[0])
+        self.customer = User.objects.create_user(
+            email='sc@x.com', password='p', first_name='C', last_name='C', phone_number='+251900000031'
+        )
+        self.client = APIClient()
+        category = Category.objects.create(name='Mains')
+        self.a = Product.objects.create(name='A', price=10, stock_quantity=100, category=category)
+        self.b = Product.objects.create(name='B', price=25, stock_quantity=100, category=category)
+
+        self.completed = self.place_order((self.a, 2), (self.b, 1))
+        for new_status in (Order.CONFIRMED, Order.PREPARING, Order.READY, Order.COMPLETED):
+            self.completed = OrderStatusService.transition(self.completed, {'status': new_status})
+        self.pending = self.place_order((self.a, 1))
+        get_analytics_cache().clear()
+
+    def place_order(self, *lines):
+        self.client.force_authenticate(self.customer)
+        for product, quantity in lines:
+            self.client.post('/products/cart/add/', {'product_id': product.pk, 'quantity': quantity}, format='json')
+        response = self.client.post('/products/orders/create/', {}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Order.objects.get(order_number=response.data['order_number'])
+
+    def analytics(self, days=7):
+        self.client.force_authenticate(self.owner)
+        response = self.client.get('/products/admin/analytics/', {'days': days})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_daily_series_counts_completed_orders(self):
+        data = self.analytics()['time_based_analytics']
+        self.assertEqual(data['period'], 'daily')
+        self.assertEqual(data['data'], [{
+            'date': timezone.localdate().strftime('%Y-%m-%d'),
+            'revenue': float(self.completed.final_total),
+            'orders': 1,
+            'avg_order_value': float(self.completed.final_total),
+        }])
+
+    def test_summary_and_revenue_share_one_aggregate_query(self):
+        view = OwnerAnalyticsView()
+        with CaptureQueriesContext(connection) as queries:
+            sections = view.compute_sections(7, ['summary', 'revenue_analytics'])
+        order_queries = [q['sql'] for q in queries.captured_queries if 'FROM "products_order"' in q['sql']]
+        self.assertEqual(len(order_queries), 1)
+
+        revenue = float(self.completed.final_total)
+        summary = sections['summary']
+        self.assertEqual(
+            (summary['total_orders'], summary['completed_orders'], summary['online_orders'], summary['offline_orders']),
+            (2, 1, 2, 0)
+        )
+        self.assertEqual(summary['total_revenue'], revenue)
+        self.assertEqual(summary['average_order_value'], float(self.completed.total_amount))
+        self.assertEqual(sections['revenue_analytics'], {
+            'by_order_type': {'online': revenue, 'offline': 0.0},
+            'by_fulfillment': {'pickup': revenue, 'delivery': 0.0},
+            'total_revenue': revenue,
+        })
+        self.assertEqual(view.failed_sections, set())
+
+    def test_product_analytics_reads_completed_sales(self):
+        data = self.analytics()['product_analytics']
+        self.assertEqual(data['top_products'], [
+            {'product__name': 'A', 'product__category__name': 'Mains',
+             'total_quantity': 2, 'total_weight_kg': 0.0, 'total_revenue': 20.0},
+            {'product__name': 'B', 'product__category__name': 'Mains',
+             'total_quantity': 1, 'total_weight_kg': 0.0, 'total_revenue': 25.0},
+        ])
+        self.assertEqual(data['category_performance'], [{
+            'product__category__name': 'Mains', 'total_orders': 2, 'total_quantity': 3, 'total_revenue': 45.0,
+        }])
+        self.assertEqual(data['total_products_sold'], 3)
+
+    def test_weight_based_lines_count_their_weighed_revenue(self):
+        meat = Product.objects.create(
+            name='Kitfo', price=100, stock_quantity=100, category=self.a.category,
+            pricing_type='per_kg', product_type=Product.FOOD
+        )
+        self.client.force_authenticate(self.customer)
+        self.client.post(
+            '/products/cart/add/', {'product_id': meat.pk, 'quantity': 1, 'weight_kg': '1.5'}, format='json'
+        )
+        response = self.client.post('/products/orders/create/', {}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        order = Order.objects.get(order_number=response.data['order_number'])
+        for new_status in (Order.CONFIRMED, Order.PREPARING, Order.READY, Order.COMPLETED):
+            order = OrderStatusService.transition(order, {'status': new_status})
+        get_analytics_cache().clear()
+
+        top = self.analytics()['product_analytics']['top_products']
+        kitfo = next(row for row in top if row['product__name'] == 'Kitfo')
+        self.assertEqual((kitfo['total_weight_kg'], kitfo['total_revenue']), (1.5, 150.0))
+
+        live = set(ProductDailySales.objects.values_list('product_id', 'status', 'units', 'revenue'))
+        rollups.rebuild_product_daily_sales()
+        self.assertEqual(set(ProductDailySales.objects.values_list('product_id', 'status', 'units', 'revenue')), live)
+
+    def test_customer_analytics_are_period_figures(self):
+        # A completed order from before the window makes the customer returning but isn't counted
+        earlier = self.place_order((self.b, 2))
+        for new_status in (Order.CONFIRMED, Order.PREPARING, Order.READY, Order.COMPLETED):
+            earlier = OrderStatusService.transition(earlier, {'status': new_status})
+        Order.objects.filter(pk=earlier.pk).update(created_at=timezone.now() - timedelta(days=30))
+        rollups.rebuild_customer_stats()
+        # Customers without a completed order in the period are left out
+        other = User.objects.create_user(
+            email='so2@x.com', password='p', first_name='D', last_name='D', phone_number='+251900000032'
+        )
+        Order.objects.create(user=other, customer_name='D', customer_phone='1', customer_email='so2@x.com')
+        get_analytics_cache().clear()
+
+        data = self.analytics()['customer_analytics']
+        spent = float(self.completed.final_total)
+        self.assertEqual(data['top_customers'], [{
+            'name': 'C C', 'email': 'sc@x.com', 'order_count': 1, 'total_spent': spent, 'loyalty_points': 0,
+        }])
+        self.assertEqual(
+            data['customer_breakdown'], {'new_customers': 0, 'returning_customers': 1, 'total_customers': 1}
+        )
+        self.assertEqual(data['average_customer_value'], spent)
+
+    def test_loyalty_summary_counts_qualifying_orders_from_customer_stats(self):
+        feast = Product.objects.create(name='Feast', price=700, stock_quantity=5, category=self.a.category)
+        order = self.place_order((feast, 1))
+        for new_status in (Order.CONFIRMED, Order.PREPARING, Order.READY, Order.COMPLETED):
+            order = OrderStatusService.transition(order, {'status': new_status})
+        self.assertEqual(CustomerStats.objects.get(user=self.customer).qualifying_order_count, 1)
+
+        self.customer.refresh_from_db()
+        with CaptureQueriesContext(connection) as queries:
+            summary = LoyaltyService.get_user_loyalty_summary(self.customer)
+        self.assertEqual(summary['qualifying_orders_count'], 1)
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "products_order"' in q['sql']])
+
+
+class ReviewAggregateTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.a = Product.objects.create(name='A', price=10, stock_quantity=1, category=category)
+        self.b = Product.objects.create(name='B', price=10, stock_quantity=1, category=category)
+        self.users = [
+            User.objects.create_user(
+                email=f'v{i}@x.com', password='p', first_name='V', last_name='V',
+                phone_number=f'+25190000001{i}'
+            )
+            for i in range(2)
+        ]
+        self.review = Review.objects.create(product=self.a, user=self.users[0], rating=5)
+        Review.objects.create(product=self.a, user=self.users[1], rating=3)
+
+    def ratings(self):
+        return dict(Product.objects.values_list('name', 'rating_count'))
+
+    def test_moving_a_review_refreshes_both_products(self):
+        self.review.product = self.b
+        self.review.save()
+        self.assertEqual(self.ratings(), {'A': 1, 'B': 1})
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.rating_average, 3)
+
+    def test_queryset_delete_refreshes(self):
+        Review.objects.filter(product=self.a).delete()
+        self.assertEqual(self.ratings(), {'A': 0, 'B': 0})
+
+    def test_user_delete_cascades(self):
+        self.users[0].delete()
+        self.a.refresh_from_db()
+        self.assertEqual((self.a.rating_count, self.a.rating_average), (1, 3))
+
+
+@override_settings(MENU_PUBLISH_ENABLED=False)
+class CatalogOrderingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.products = Product.objects.bulk_create([
+            Product(name='A', price=10, stock_quantity=5, category=category,
+                    rating_average=4, rating_count=2, sales_count=5),
+            Product(name='B', price=10, stock_quantity=5, category=category,
+                    rating_average=4, rating_count=9, sales_count=1),
+            Product(name='C', price=10, stock_quantity=5, category=category,
+                    rating_average=5, rating_count=1, sales_count=3),
+        ])
+        # bulk_create skips the signals, keep earlier tests' cached lists out
+        bump_catalog_version()
+        self.client = APIClient()
+
+    def names(self, ordering):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/products/', {'ordering': ordering})
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        return [row['name'] for row in rows], queries
+
+    def test_average_rating_breaks_ties_on_review_count(self):
+        names, queries = self.names('-average_rating')
+        self.assertEqual(names, ['C', 'B', 'A'])
+        select = next(q['sql'] for q in queries.captured_queries if 'ORDER BY' in q['sql'])
+        self.assertIn('"rating_average" DESC', select)
+        self.assertIn('"rating_count" DESC', select)
+
+    def test_review_count_and_popularity(self):
+        self.assertEqual(self.names('-review_count')[0], ['B', 'A', 'C'])
+        self.assertEqual(self.names('-popularity')[0], ['A', 'C', 'B'])
+        self.assertEqual(self.names('popularity')[0], ['B', 'C', 'A'])
+
+    def test_order_creation_counts_sales(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService.reserve({self.products[1].pk: 1}, sales={self.products[1].pk: 6})
+        self.assertEqual(self.names('-popularity')[0], ['B', 'A', 'C'])
+
+    def test_ordering_indexes_exist(self):
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, Product._meta.db_table)
+        for name in ('product_rating_idx', 'product_category_rating_idx', 'product_sales_count_idx'):
+            self.assertTrue(indexes[name]['index'], name)
+
+
+class OrderStatusTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='s@x.com', password='p', first_name='S', last_name='S', phone_number='+251900000020'
+        )
+        self.user.groups.add(Group.objects.get_or_create(name='Worker')[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.order = Order.objects.create(customer_name='A', customer_phone='1', customer_email='a@b.com')
+
+    def set_status(self, new_status):
+        return self.client.patch(f'/products/admin/orders/{self.order.pk}/', {'status': new_status}, format='json')
+
+    def test_allowed_transition(self):
+        response = self.set_status(Order.CONFIRMED)
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.CONFIRMED)
+
+    def test_skipped_transition_is_a_conflict(self):
+        response = self.set_status(Order.COMPLETED)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['current_status'], Order.PENDING)
+        self.assertEqual(response.data['allowed_statuses'], [Order.CONFIRMED, Order.CANCELLED])
+
+    def test_ready_stamps_ready_at_in_the_same_update(self):
+        for new_status in (Order.CONFIRMED, Order.PREPARING, Order.READY):
+            self.order = OrderStatusService.transition(self.order, {'status': new_status})
+        self.assertIsNotNone(self.order.ready_at)
+        self.assertEqual(Order.objects.filter(pk=self.order.pk, status=Order.READY).count(), 1)
+
+    def test_stale_order_loses_the_race(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        OrderStatusService.transition(Order.objects.get(pk=self.order.pk), {'status': Order.CANCELLED})
+        with self.assertRaises(OrderStatusError) as ctx:
+            OrderStatusService.transition(stale, {'status': Order.CONFIRMED})
+        self.assertEqual(ctx.exception.current_status, Order.CANCELLED)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.CANCELLED)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.product = Product.objects.create(name='A', price=10, stock_quantity=10, category=category)
+        self.client = APIClient()
+
+    def create_order(self, key, quantity=1):
+        body = {
+            'customer_name': 'A', 'customer_phone': '1', 'customer_email': 'a@b.com',
+            'items': [{'product': self.product.pk, 'quantity': quantity}],
+        }
+        return self.client.post('/products/orders/create/', body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.create_order('k1')
+        retry = self.create_order('k1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 9)
+
+    def test_key_reused_for_another_payload(self):
+        self.create_order('k1')
+        response = self.create_order('k1', quantity=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_in_flight_is_a_conflict(self):
+        self.create_order('k1')
+        IdempotencyKey.objects.update(status_code=None, locked_until=timezone.now() + timedelta(seconds=30))
+        response = self.create_order('k1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_lapsed_key_is_taken_over_by_a_retry(self):
+        # The first request died before storing its response
+        self.create_order('k1')
+        Order.objects.all().delete()
+        IdempotencyKey.objects.update(status_code=None, locked_until=timezone.now() - timedelta(seconds=1))
+        response = self.create_order('k1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.create_order('k1')['Idempotent-Replayed'], 'true')
+
+    def test_client_errors_are_not_replayed(self):
+        response = self.create_order('k1', quantity=20)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.product.stock_quantity = 30
+        self.product.save()
+        response = self.create_order('k1', quantity=20)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Mains')
+        self.product = Product.objects.create(name='A', price=10, stock_quantity=10, category=category)
+
+    def create_order(self):
+        body = {
+            'customer_name': 'A', 'customer_phone': '1', 'customer_email': 'a@b.com',
+            'items': [{'product': self.product.pk, 'quantity': 1}],
+        }
+        response = APIClient().post('/products/orders/create/', body, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_worker_writes_the_activity_log(self):
+        self.create_order()
+        self.assertFalse(ActivityLog.objects.filter(action='create', model_name='Order').exists())
+        call_command('process_outbox', '--once', stdout=StringIO())
+        self.assertTrue(ActivityLog.objects.filter(action='create', model_name='Order').exists())
+        self.assertEqual(OutboxEvent.objects.get().status, OutboxEvent.DONE)
+
+    def test_reclaimed_event_is_left_to_the_new_worker(self):
+        self.create_order()
+        event, = outbox.claim_batch(10)
+        # The lock went stale and another worker claimed the event
+        OutboxEvent.objects.filter(pk=event.pk).update(locked_by='other')
+        self.assertFalse(outbox.process_event(event))
+        self.assertFalse(ActivityLog.objects.filter(action='create', model_name='Order').exists())
+        self.assertEqual(
+            OutboxEvent.objects.values_list('status', 'locked_by').get(),
+            (OutboxEvent.PROCESSING, 'other')
+        )
+
+    def test_failed_handler_is_retried_later(self):
+        self.create_order()
+        with mock.patch.dict(outbox.HANDLERS, {outbox.ORDER_CREATED: mock.Mock(side_effect=RuntimeError('boom'))}):
+            self.assertEqual(outbox.process_batch(), (0, 1))
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.status, event.attempts, event.locked_by), (OutboxEvent.PENDING, 1, ''))
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertEqual(outbox.process_batch(), (0, 0))
+
+    def test_purge_drops_only_old_done_events(self):
+        old = timezone.now() - timedelta(days=8)
+        kept = [
+            OutboxEvent.objects.create(event_type='x', status=OutboxEvent.DONE, processed_at=timezone.now()),
+            OutboxEvent.objects.create(event_type='x', status=OutboxEvent.FAILED, processed_at=old),
+        ]
+        OutboxEvent.objects.create(event_type='x', status=OutboxEvent.DONE, processed_at=old)
+        self.assertEqual(outbox.purge_done_events(), 1)
+        self.assertEqual(set(OutboxEvent.objects.values_list('pk', flat=True)), {event.pk for event in kept})
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='k@x.com', password='p', first_name='K', last_name='K', phone_number='+251900000040'
+        )
+        self.user.groups.add(Group.objects.get_or_create(name='Owner')[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        self.orders = []
+        for index, ready_at in enumerate([None, now, None, now - timedelta(hours=1), now]):
+            order = Order.objects.create(
+                customer_name='A', customer_phone='1', customer_email='a@b.com', total_amount=index % 2
+            )
+            Order.objects.filter(pk=order.pk).update(ready_at=ready_at)
+            self.orders.append(order.pk)
+
+    def walk(self, url, params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200, response.data)
+            ids += [row['id'] for row in response.data['results']]
+            pages += 1
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_row_once(self):
+        ids, pages = self.walk('/products/admin/orders/', {'page_size': 2})
+        self.assertEqual(ids, self.orders[::-1])
+        self.assertEqual(pages, 3)
+
+    def test_rows_added_between_pages_do_not_shift_the_next_page(self):
+        first = self.client.get('/products/admin/orders/', {'page_size': 2})
+        Order.objects.create(customer_name='B', customer_phone='2', customer_email='b@b.com')
+        second = self.client.get(first.data['next'])
+        self.assertEqual([row['id'] for row in second.data['results']], self.orders[2:0:-1])
+
+    def test_ties_on_the_ordering_field_are_broken_by_pk(self):
+        ids, _ = self.walk('/products/admin/orders/', {'page_size': 1, 'ordering': 'total_amount'})
+        self.assertEqual(ids, [self.orders[i] for i in (0, 2, 4, 1, 3)])
+
+    def paginate_all(self, ordering):
+        """Every page of Order.objects.order_by(ordering), one row per page"""
+        paginator = KeysetPagination()
+        ids, cursor = [], None
+        while True:
+            params = {'page_size': 1, **({'cursor': cursor} if cursor else {})}
+            request = Request(APIRequestFactory().get('/orders/', params))
+            ids += [order.pk for order in paginator.paginate_queryset(Order.objects.order_by(ordering), request)]
+            next_link = paginator.get_next_link()
+            if next_link is None:
+                return ids
+            cursor = parse_qs(urlparse(next_link).query)['cursor'][0]
+
+    def test_null_ordering_values_sort_last_ascending(self):
+        self.assertEqual(self.paginate_all('ready_at'), [self.orders[i] for i in (3, 1, 4, 0, 2)])
+
+    def test_null_ordering_values_sort_first_descending(self):
+        self.assertEqual(self.paginate_all('-ready_at'), [self.orders[i] for i in (2, 0, 4, 1, 3)])
+
+    def test_cursor_of_another_ordering_is_rejected(self):
+        response = self.client.get('/products/admin/orders/', {'page_size': 2})
+        cursor = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+        response = self.client.get('/products/admin/orders/', {'cursor': cursor, 'ordering': 'status'})
+        self.assertEqual(response.status_code, 404)
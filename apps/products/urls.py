@@ -8,6 +8,7 @@ urlpatterns = [
     # Public routes (No authentication required)
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('products/', views.ProductListView.as_view(), name='product-list'),
+    path('products/search/', views.ProductSearchView.as_view(), name='product-search'),
     path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
     path('products/<int:pk>/reviews/', views.ProductReviewsView.as_view(), name='product-reviews'),
     
@@ -30,6 +31,9 @@ urlpatterns = [
     path('admin/categories/', views.AdminCategoryListCreateView.as_view(), name='admin-category-list'),
     path('admin/categories/<int:pk>/', views.AdminCategoryDetailView.as_view(), name='admin-category-detail'),
     path('admin/products/', views.AdminProductListCreateView.as_view(), name='admin-product-list'),
+    path('admin/products/import/', views.AdminProductImportView.as_view(), name='admin-product-import'),
+    path('admin/products/export/', views.AdminProductExportView.as_view(), name='admin-product-export'),
+    path('admin/products/stock/', views.BulkStockUpdateView.as_view(), name='bulk-stock-update'),
     path('admin/products/<int:pk>/', views.AdminProductDetailView.as_view(), name='admin-product-detail'),
     path('admin/products/<int:pk>/update-stock/', views.UpdateProductStockView.as_view(), name='update-product-stock'),
     path('admin/orders/', views.AdminOrderListView.as_view(), name='admin-order-list'),
@@ -53,6 +57,15 @@ urlpatterns = [
     # For role specific dashboard view
     path('admin/role-dashboard-data/', views.RoleSpecificDashboardData.as_view(), name='role-dashboard-data'),
 
+    # Live order board feed (SSE, long-poll fallback)
+    path('admin/orders/events/', views.OrderEventStreamView.as_view(), name='order-event-stream'),
+    path('admin/orders/events/poll/', views.OrderEventPollView.as_view(), name='order-event-poll'),
+    path('admin/orders/events/token/', views.OrderFeedTokenView.as_view(), name='order-feed-token'),
+
+    # Incremental sync for POS tablets and dashboards
+    path('admin/sync/orders/', views.OrderSyncView.as_view(), name='order-sync'),
+    path('admin/sync/products/', views.ProductSyncView.as_view(), name='product-sync'),
+
     # Analytics URLs
     path('admin/analytics/', OwnerAnalyticsView.as_view(), name='owner-analytics'),
     path('admin/analytics/export/', ExportAnalyticsView.as_view(), name='export-analytics'),
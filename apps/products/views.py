@@ -3,12 +3,17 @@ from rest_framework import serializers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.decorators import action
 from rest_framework.viewsets import ModelViewSet
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
+from django.db import transaction
 from django.db.models import Q, Count, Avg
 from django.utils import timezone
-from datetime import date, timedelta
 from django.contrib.auth import get_user_model
 
 
@@ -18,7 +23,8 @@ from .serializers import (
     ReviewSerializer, CartSerializer, CartItemSerializer,
     AddToCartSerializer, UpdateCartItemSerializer,
     OrderSerializer, OrderCreateSerializer, StockUpdateSerializer,
-    ActivityLogSerializer
+    BulkStockUpdateSerializer, ActivityLogSerializer,
+    OrderSyncSerializer, OrderItemSyncSerializer
 )
 
 # from .permissions import IsOwnerOrWorker, IsOwner, IsWorker, IsOrderOwnerOrStaff
@@ -26,9 +32,26 @@ from .serializers import (
 from .permissions import (IsStaff, IsOwner, IsChef, IsWaiter, 
                         IsCashier, IsButcher, CanManageProducts, 
                         CanManageOrders, CanProcessPhysicalSales, 
-                        IsOwnerOrWorker, IsOrderOwnerOrStaff)
+                        IsOwnerOrWorker, IsOrderOwnerOrStaff, get_user_role)
 
-from .services import LoyaltyService
+from .services import (
+    ProductImportService, ProductExportService,
+    StockService, StockAdjustmentError, OrderStatusService, OrderStatusError
+)
+from .cache import CatalogCacheMixin
+from .conditional import ConditionalGetMixin
+from .pagination import KeysetPagination
+from .search import ProductSearchFilter, get_search_backend
+from .filters import CatalogOrderingFilter
+from .resolvers import ProductResolver
+from . import cart_store
+from .idempotency import IdempotentCreateMixin
+from . import outbox
+from . import order_feed
+from . import sync
+from . import rollups
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import OrderFeedTokenAuthentication, issue_order_feed_token
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -57,26 +80,38 @@ def log_activity(user, action, model_name, object_id='', description='', old_val
 ################## Public Views (No authentication required) ######################
 
 
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(ConditionalGetMixin, CatalogCacheMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = CategorySerializer
+    catalog_cache_name = 'categories'
     
     def get_queryset(self):
         return Category.objects.filter(is_active=True).annotate(
             product_count=Count('products')
         ).order_by('name')
+    
+    def get_validator_querysets(self):
+        # product_count depends on every product, not only the listed categories
+        return [
+            (Category.objects.filter(is_active=True), ('updated_at',)),
+            (Product.objects.all(), ('updated_at',)),
+        ]
 
 
-class ProductListView(generics.ListAPIView):
+class ProductListView(ConditionalGetMixin, CatalogCacheMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = ProductListSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'description', 'category__name']
-    ordering_fields = ['price', 'name', 'created_at', 'average_rating']
+    catalog_cache_name = 'products'
+    catalog_cache_params = ('category', 'type', 'spicy', 'search', 'ordering')
+    # ProductSearchFilter goes last so search ranking wins when no ordering is requested
+    filter_backends = [CatalogOrderingFilter, ProductSearchFilter]
+    ordering_fields = ['price', 'name', 'created_at', 'average_rating', 'review_count', 'popularity']
     ordering = ['name']
     
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True, show=True, stock_quantity__gt=0)
+        queryset = Product.objects.filter(
+            is_active=True, show=True, stock_quantity__gt=0
+        ).select_related('category')
         
         # Filter by category
         category_id = self.request.query_params.get('category')
@@ -93,15 +128,40 @@ class ProductListView(generics.ListAPIView):
             queryset = queryset.filter(is_spicy=True)
         
         return queryset
+    
+    def get_validator_querysets(self):
+        # category_name is part of every row
+        return [(self.filter_queryset(self.get_queryset()), ('updated_at', 'category__updated_at'))]
+
+
+class ProductSearchView(APIView):
+    """Ranked IDs of visible products matching ?q="""
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 50)), 200))
+        except ValueError:
+            limit = 50
+        
+        visible = Product.objects.filter(is_active=True, show=True, stock_quantity__gt=0)
+        ranked_ids = get_search_backend().search(query, limit=limit, queryset=visible) if query else []
+        
+        return Response({'query': query, 'results': ranked_ids})
 
 
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductDetailView(ConditionalGetMixin, CatalogCacheMixin, generics.RetrieveAPIView):
     permission_classes = [AllowAny]
     serializer_class = ProductSerializer
-    queryset = Product.objects.filter(is_active=True, show=True)
+    catalog_cache_name = 'product-detail'
+    queryset = Product.objects.filter(is_active=True, show=True).select_related('category')
+    
+    def get_validator_querysets(self):
+        return [(self.get_queryset().filter(pk=self.kwargs['pk']), ('updated_at', 'category__updated_at'))]
 
 
-class ProductReviewsView(generics.ListAPIView):
+class ProductReviewsView(ConditionalGetMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = ReviewSerializer
     
@@ -112,6 +172,13 @@ class ProductReviewsView(generics.ListAPIView):
         
         product_id = self.kwargs['pk']
         return Review.objects.filter(product_id=product_id, is_active=True).select_related('user')
+    
+    def get_validator_querysets(self):
+        # product_name and user_name are part of every row
+        return [
+            (self.filter_queryset(self.get_queryset()), ('updated_at', 'user__updated_at')),
+            (Product.objects.filter(pk=self.kwargs['pk']), ('updated_at',)),
+        ]
 
 
 
@@ -147,13 +214,25 @@ class CreateReviewView(generics.CreateAPIView):
 
 ####################### Cart Views ########################
 
+def render_cart(user):
+    """Full cart response of the cart views, a fixed number of queries in both cart stores"""
+    if cart_store.is_cart_store_enabled():
+        return CartSerializer(cart_store.snapshot(user)).data
+    cart, created = Cart.objects.with_contents().get_or_create(user=user)
+    return CartSerializer(cart).data
+
 class CartView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = CartSerializer
     
     def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
+        cart, created = Cart.objects.with_contents().get_or_create(user=self.request.user)
         return cart
+    
+    def retrieve(self, request, *args, **kwargs):
+        if cart_store.is_cart_store_enabled():
+            return Response(CartSerializer(cart_store.snapshot(request.user)).data)
+        return super().retrieve(request, *args, **kwargs)
 
 
 
@@ -161,14 +240,16 @@ class AddToCartView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
-        serializer = AddToCartSerializer(data=request.data)
+        serializer = AddToCartSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            product_id = serializer.validated_data['product_id']
             quantity = serializer.validated_data['quantity']
             weight_kg = serializer.validated_data.get('weight_kg')
             special_instructions = serializer.validated_data.get('special_instructions', '')
             
-            product = get_object_or_404(Product, id=product_id, is_active=True, show=True)
+            # Loaded once during validation
+            product = serializer.validated_data['product']
+            if not (product.is_active and product.show):
+                raise Http404('No Product matches the given query.')
             
             # FIXED: Check stock for BOTH product types
             if product.is_weight_based:
@@ -186,6 +267,10 @@ class AddToCartView(APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
             
+            if cart_store.is_cart_store_enabled():
+                cart_store.add_item(request.user.id, product, quantity, weight_kg, special_instructions)
+                return Response(render_cart(request.user), status=status.HTTP_200_OK)
+            
             cart, created = Cart.objects.get_or_create(user=request.user)
             
             # For weight-based products, use weight_kg in the lookup
@@ -217,7 +302,7 @@ class AddToCartView(APIView):
                     cart_item.special_instructions = special_instructions
                 cart_item.save()
             
-            return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+            return Response(render_cart(request.user), status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -231,7 +316,34 @@ class UpdateCartItemView(generics.UpdateAPIView):
 
         if getattr(self, 'swagger_fake_view', False):
             return CartItem.objects.none()
-        return CartItem.objects.filter(cart__user=self.request.user)
+        return CartItem.objects.filter(cart__user=self.request.user).select_related('product')
+    
+    def update(self, request, *args, **kwargs):
+        if not cart_store.is_cart_store_enabled():
+            super().update(request, *args, **kwargs)
+            return Response(render_cart(request.user))
+        
+        item = cart_store.find_item(cart_store.load(request.user.id), kwargs['pk'])
+        if item is None:
+            raise Http404('No CartItem matches the given query.')
+        
+        serializer = self.get_serializer(data=request.data, partial=kwargs.get('partial', False))
+        serializer.is_valid(raise_exception=True)
+        
+        # Check stock availability
+        quantity = serializer.validated_data.get('quantity', item['quantity'])
+        stock_quantity = Product.objects.filter(pk=item['product']).values_list(
+            'stock_quantity', flat=True
+        ).first() or 0
+        if quantity > stock_quantity:
+            raise serializers.ValidationError({
+                'quantity': f'Only {stock_quantity} available in stock.'
+            })
+        
+        item = cart_store.update_item(request.user.id, item['id'], **serializer.validated_data)
+        if item is None:
+            raise Http404('No CartItem matches the given query.')
+        return Response(render_cart(request.user))
     
     def perform_update(self, serializer):
         cart_item = self.get_object()
@@ -265,7 +377,26 @@ class RemoveFromCartView(generics.DestroyAPIView):
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return CartItem.objects.none()
-        return CartItem.objects.filter(cart__user=self.request.user)
+        return CartItem.objects.filter(cart__user=self.request.user).select_related('product')
+    
+    def destroy(self, request, *args, **kwargs):
+        if not cart_store.is_cart_store_enabled():
+            super().destroy(request, *args, **kwargs)
+            return Response(render_cart(request.user), status=status.HTTP_200_OK)
+        
+        item = cart_store.remove_item(request.user.id, kwargs['pk'])
+        if item is None:
+            raise Http404('No CartItem matches the given query.')
+        log_activity(
+            user=request.user,
+            action='delete',
+            model_name='CartItem',
+            object_id=str(item['id']),
+            description=f"Item removed from cart: {item['product_name']}",
+            old_value=f"Quantity: {item['quantity']}",
+            request=request
+        )
+        return Response(render_cart(request.user), status=status.HTTP_200_OK)
     
     def perform_destroy(self, instance):
         log_activity(
@@ -285,6 +416,13 @@ class ClearCartView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
+        if cart_store.is_cart_store_enabled():
+            cart_store.clear(request.user.id)
+            return Response(
+                {'detail': 'Cart cleared successfully.', 'cart': render_cart(request.user)},
+                status=status.HTTP_200_OK
+            )
+        
         cart = get_object_or_404(Cart, user=request.user)
         items_count = cart.items.count()
         
@@ -299,16 +437,20 @@ class ClearCartView(APIView):
         # )
         
         cart.items.all().delete()
-        return Response({'detail': 'Cart cleared successfully.'}, status=status.HTTP_200_OK)
+        return Response(
+            {'detail': 'Cart cleared successfully.', 'cart': render_cart(request.user)},
+            status=status.HTTP_200_OK
+        )
 
 
 
 
 ##################### Order Views #####################
 
-class CreateOrderView(generics.CreateAPIView):
+class CreateOrderView(IdempotentCreateMixin, generics.CreateAPIView):
     permission_classes = [AllowAny]
     serializer_class = OrderCreateSerializer
+    idempotency_scope = 'order-create'
     
     def create(self, request, *args, **kwargs):
         # If user is authenticated, we can use their cart
@@ -318,8 +460,13 @@ class CreateOrderView(generics.CreateAPIView):
             return super().create(request, *args, **kwargs)
         
     def create_from_cart(self, request):
+        # The working cart may still be ahead of the tables, write it through first
+        if cart_store.is_cart_store_enabled():
+            cart_store.flush(request.user.id)
+        
         cart = get_object_or_404(Cart, user=request.user)
-        if cart.items.count() == 0:
+        cart_items = list(cart.items.select_related('product'))
+        if not cart_items:
             return Response(
                 {'error': 'Cart is empty.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -341,7 +488,7 @@ class CreateOrderView(generics.CreateAPIView):
         }
         
         # FIXED: Prepare items from cart with weight_kg
-        for cart_item in cart.items.all():
+        for cart_item in cart_items:
             item_data = {
                 'product': cart_item.product.id,
                 'quantity': cart_item.quantity,
@@ -354,24 +501,21 @@ class CreateOrderView(generics.CreateAPIView):
             
             order_data['items'].append(item_data)
         
-        serializer = self.get_serializer(data=order_data, context={'request': request})
+        # The cart already loaded the products, validation and create() reuse them
+        resolver = ProductResolver()
+        resolver.add(cart_item.product for cart_item in cart_items)
+        serializer = self.get_serializer(
+            data=order_data,
+            context={'request': request, ProductResolver.context_key: resolver}
+        )
         serializer.is_valid(raise_exception=True)
+        # The creation is logged from the order.created outbox event
         order = serializer.save()
         
-        # Log the order creation activity
-        user_for_log = request.user if request.user.is_authenticated else None
-        log_activity(
-            user=user_for_log,
-            action='create',
-            model_name='Order',
-            object_id=str(order.id),
-            description=f'Online order created: {order.order_number}',
-            new_value=f"Status: {order.status}, Total: ${order.final_total}, Type: {order.order_type}, Method: {order.fulfillment_method}",
-            request=request
-        )
-        
         # Clear the cart after successful order
         cart.items.all().delete()
+        if cart_store.is_cart_store_enabled():
+            cart_store.discard(request.user.id)
         
         headers = self.get_success_headers(serializer.data)
         return Response(
@@ -384,10 +528,13 @@ class CreateOrderView(generics.CreateAPIView):
 class UserOrderListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = OrderSerializer
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         return Order.objects.filter(
             Q(user=self.request.user) | Q(customer_email=self.request.user.email)
+        ).select_related('user', 'payment_verified_by').prefetch_related(
+            'items__product'
         ).order_by('-created_at')
 
 
@@ -474,6 +621,74 @@ class AdminProductListCreateView(generics.ListCreateAPIView):
         )
 
 
+class AdminProductImportView(APIView):
+    """Bulk create/update products from an uploaded CSV or JSONL file"""
+    permission_classes = [IsAuthenticated, CanManageProducts]
+    parser_classes = [MultiPartParser]
+    
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response(
+                {'error': 'Upload a CSV or JSONL file in the "file" field'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        file_type = ProductImportService.detect_file_type(upload, request.data.get('file_type'))
+        if file_type is None:
+            return Response(
+                {'error': 'Unsupported file type, use csv or jsonl'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        dry_run = str(request.data.get('dry_run', '')).lower() == 'true'
+        # The log is written in the import's transaction, a failed import leaves no entry
+        with transaction.atomic():
+            result = ProductImportService.import_rows(
+                ProductImportService.iter_rows(upload, file_type), dry_run=dry_run
+            )
+            if not result['error_count'] and not dry_run:
+                log_activity(
+                    user=request.user,
+                    action='bulk_import',
+                    model_name='Product',
+                    description=(
+                        f"Bulk product import ({file_type}): "
+                        f"{result['created']} created, {result['updated']} updated"
+                    ),
+                    new_value=f"{upload.name} ({result['rows']} rows)",
+                    request=request
+                )
+        
+        result['dry_run'] = dry_run
+        if result['error_count']:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+
+class AdminProductExportView(APIView):
+    """Stream every product as CSV or JSONL (?file_type=), in the import format"""
+    permission_classes = [IsAuthenticated, CanManageProducts]
+    
+    def get(self, request):
+        file_type = request.query_params.get('file_type', 'csv').lower()
+        if file_type == 'jsonl':
+            response = StreamingHttpResponse(
+                ProductExportService.stream_jsonl(), content_type='application/x-ndjson'
+            )
+        elif file_type == 'csv':
+            response = StreamingHttpResponse(
+                ProductExportService.stream_csv(), content_type='text/csv'
+            )
+        else:
+            return Response(
+                {'error': 'Unsupported file type, use csv or jsonl'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        response['Content-Disposition'] = f'attachment; filename="products.{file_type}"'
+        return response
+
+
 class AdminProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     # permission_classes = [IsAuthenticated, IsOwnerOrWorker]
     permission_classes = [IsAuthenticated, CanManageProducts]
@@ -530,65 +745,75 @@ class UpdateProductStockView(APIView):
     permission_classes = [IsAuthenticated, IsOwnerOrWorker]
     
     def post(self, request, pk):
-        product = get_object_or_404(Product, pk=pk)
         serializer = StockUpdateSerializer(data=request.data)
         
         if serializer.is_valid():
             quantity = serializer.validated_data['quantity']
-            action = serializer.validated_data['action']
-            reason = serializer.validated_data.get('reason', '')
+            if serializer.validated_data['action'] == 'reduce':
+                quantity = -quantity
             
-            old_stock = product.stock_quantity
-            
-            if action == 'add':
-                product.stock_quantity += quantity
-                log_action = 'stock_add'
-                action_description = 'added to'
-            else:  # reduce
-                if product.stock_quantity < quantity:
-                    return Response(
-                        {'error': 'Insufficient stock'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                product.stock_quantity -= quantity
-                log_action = 'stock_reduce'
-                action_description = 'reduced from'
-            
-            product.save()
-            
-            # Log the activity
-            description = f"Stock {action_description} {product.name}"
-            if reason:
-                description += f" - Reason: {reason}"
-                
-            log_activity(
-                user=request.user,
-                action=log_action,
-                model_name='Product',
-                object_id=str(product.id),
-                description=description,
-                old_value=str(old_stock),
-                new_value=str(product.stock_quantity),
-                request=request
-            )
+            try:
+                StockService.apply_adjustments(
+                    [{
+                        'product': pk,
+                        'delta': quantity,
+                        'reason': serializer.validated_data.get('reason', ''),
+                    }],
+                    user=request.user,
+                    ip_address=request.META.get('REMOTE_ADDR')
+                )
+            except StockAdjustmentError as exc:
+                if exc.errors and exc.errors[0]['error'] == 'Product not found':
+                    return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+                return Response({'error': 'Insufficient stock'}, status=status.HTTP_400_BAD_REQUEST)
             
+            product = get_object_or_404(Product, pk=pk)
             return Response(ProductSerializer(product).data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkStockUpdateView(APIView):
+    """Apply many (product, delta, reason) stock adjustments in one transaction"""
+    permission_classes = [IsAuthenticated, IsOwnerOrWorker]
+    
+    def post(self, request):
+        serializer = BulkStockUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            levels = StockService.apply_adjustments(
+                serializer.validated_data['adjustments'],
+                user=request.user,
+                ip_address=request.META.get('REMOTE_ADDR')
+            )
+        except StockAdjustmentError as exc:
+            return Response(
+                {'error': 'Stock adjustment failed', 'details': exc.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'results': [
+                {'product': product_id, 'stock_quantity': stock_quantity}
+                for product_id, stock_quantity in levels.items()
+            ]
+        })
+
+
 
 class AdminOrderListView(generics.ListAPIView):
     # permission_classes = [IsAuthenticated, IsOwnerOrWorker]
     permission_classes = [IsAuthenticated, CanManageOrders]
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
+    pagination_class = KeysetPagination
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at', 'total_amount', 'status']
     ordering = ['-created_at']
     
     def get_queryset(self):
-        queryset = Order.objects.all()
+        queryset = Order.objects.select_related('user', 'payment_verified_by').prefetch_related('items__product')
         
         # Filter by status
         status_filter = self.request.query_params.get('status')
@@ -614,84 +839,50 @@ class AdminOrderDetailView(generics.RetrieveUpdateAPIView):
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
     
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except OrderStatusError as exc:
+            return Response(
+                {'error': str(exc), 'current_status': exc.current_status, 'allowed_statuses': exc.allowed},
+                status=status.HTTP_409_CONFLICT
+            )
+    
     def perform_update(self, serializer):
-        order = self.get_object()
+        order = serializer.instance
         old_status = order.status
+        payment_verified = serializer.validated_data.get('payment_verified')
         
-        # Handle payment verification separately if it's in the request
-        request_data = self.request.data.copy()
-        payment_verified = request_data.pop('payment_verified', None)
-        
-        updated_order = serializer.save()
-        
-        # Handle payment verification
-        if payment_verified is not None:
-            if payment_verified and not updated_order.payment_verified:
-                # Verify payment
-                updated_order.payment_verified = True
-                updated_order.payment_verified_by = self.request.user
-                updated_order.payment_verified_at = timezone.now()
-            elif not payment_verified and updated_order.payment_verified:
-                # Unverify payment
-                updated_order.payment_verified = False
-                updated_order.payment_verified_by = None
-                updated_order.payment_verified_at = None
-            updated_order.save()
-        
-        # Update ready_at time if status changed to ready
-        if updated_order.status == 'ready' and not updated_order.ready_at:
-            updated_order.ready_at = timezone.now()
-            updated_order.save()
-        
-        # Process loyalty points when order status changes to completed
-        if (old_status != 'completed' and 
-            updated_order.status == 'completed'):
-            
-            print(f" Order {updated_order.order_number} status changed to completed")
-            print(f"   Processing loyalty points...")
+        # One conditional UPDATE; logging and loyalty points are handled by process_outbox
+        with transaction.atomic():
+            updated_order = OrderStatusService.transition(order, serializer.validated_data, self.request.user)
+            actor = outbox.request_actor(self.request)
             
-            # Process loyalty points
-            points_awarded = LoyaltyService.process_order_loyalty_points(updated_order)
+            if old_status != updated_order.status:
+                outbox.emit(outbox.ORDER_STATUS_CHANGED, {
+                    'order_id': updated_order.id,
+                    'order_number': updated_order.order_number,
+                    'old_status': old_status,
+                    'new_status': updated_order.status,
+                    **actor,
+                })
             
-            if points_awarded:
-                print(f" Loyalty points awarded successfully!")
-            else:
-                print(f" No loyalty points awarded")
-        
-        # Log status change
-        if old_status != updated_order.status:
-            log_activity(
-                user=self.request.user,
-                action='order_status',
-                model_name='Order',
-                object_id=str(updated_order.id),
-                description=f'Order status changed: {updated_order.order_number}',
-                old_value=old_status,
-                new_value=updated_order.status,
-                request=self.request
-            )
-        
-        # Log payment verification if changed
-        if payment_verified is not None:
-            action = 'verified' if payment_verified else 'unverified'
-            log_activity(
-                user=self.request.user,
-                action='update',
-                model_name='Order',
-                object_id=str(updated_order.id),
-                description=f'Payment {action} for order: {updated_order.order_number}',
-                old_value=str(not payment_verified),
-                new_value=str(payment_verified),
-                request=self.request
-            )
+            if payment_verified is not None:
+                outbox.emit(outbox.ORDER_PAYMENT_VERIFICATION_CHANGED, {
+                    'order_id': updated_order.id,
+                    'order_number': updated_order.order_number,
+                    'verified': payment_verified,
+                    **actor,
+                })
 
 
 #################### Additional Admin Actions ####################
 
-class CreatePhysicalSaleView(generics.CreateAPIView):
+class CreatePhysicalSaleView(IdempotentCreateMixin, generics.CreateAPIView):
     # permission_classes = [IsAuthenticated, IsOwnerOrWorker]
     permission_classes = [IsAuthenticated, CanProcessPhysicalSales]
     serializer_class = OrderCreateSerializer
+    idempotency_scope = 'physical-sale'
     
     def create(self, request, *args, **kwargs):
         # Force order type to offline for physical sales
@@ -705,21 +896,8 @@ class CreatePhysicalSaleView(generics.CreateAPIView):
         if not request.data.get('customer_phone'):
             request.data['customer_phone'] = 'N/A'
         
+        # The physical sale is logged from the order.created outbox event
         return super().create(request, *args, **kwargs)
-    
-    def perform_create(self, serializer):
-        order = serializer.save()
-        
-        # Log the physical sale creation activity
-        log_activity(
-            user=self.request.user,
-            action='physical_sale',
-            model_name='Order',
-            object_id=str(order.id),
-            description=f'Physical sale created: {order.order_number} for Table {order.table_number}',
-            new_value=f"Status: {order.status}, Total: ${order.final_total}, Table: {order.table_number}, Worker: {self.request.user.get_full_name()}",
-            request=self.request
-        )
 
 
 
@@ -728,12 +906,13 @@ class ActivityLogListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated, IsOwnerOrWorker]
     serializer_class = ActivityLogSerializer
     queryset = ActivityLog.objects.all()
+    pagination_class = KeysetPagination
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['timestamp']
     ordering = ['-timestamp']
     
     def get_queryset(self):
-        queryset = ActivityLog.objects.all()
+        queryset = ActivityLog.objects.select_related('user')
         
         # Filter by action
         action = self.request.query_params.get('action')
@@ -784,24 +963,20 @@ class OrderStatsView(APIView):
     permission_classes = [IsAuthenticated, IsOwnerOrWorker]
     
     def get(self, request):
-        today = date.today()
-        yesterday = today - timedelta(days=1)
-        
-        # Today's stats
-        today_orders = Order.objects.filter(created_at__date=today)
-        yesterday_orders = Order.objects.filter(created_at__date=yesterday)
+        # Order figures come from the daily rollup, not the order history
+        totals = rollups.order_dashboard_totals()
         
         stats = {
             # Today's orders
-            'total_orders_today': today_orders.count(),
-            'pending_orders': Order.objects.filter(status='pending').count(),
-            'completed_orders_today': today_orders.filter(status='completed').count(),
-            'pickup_orders_today': today_orders.filter(fulfillment_method='pickup').count(),
-            'delivery_orders_today': today_orders.filter(fulfillment_method='delivery').count(),
+            'total_orders_today': totals['orders_today'],
+            'pending_orders': totals['by_status'][Order.PENDING],
+            'completed_orders_today': totals['completed_today'],
+            'pickup_orders_today': totals['pickup_today'],
+            'delivery_orders_today': totals['delivery_today'],
             
             # Revenue
-            'revenue_today': sum(order.final_total for order in today_orders),
-            'revenue_yesterday': sum(order.final_total for order in yesterday_orders),
+            'revenue_today': totals['revenue_today'],
+            'revenue_yesterday': totals['revenue_yesterday'],
             
             # Products
             'low_stock_products': Product.objects.filter(stock_quantity__lte=5, is_active=True).count(),
@@ -810,8 +985,8 @@ class OrderStatsView(APIView):
             
             # Order status breakdown
             'orders_by_status': {
-                status[1]: Order.objects.filter(status=status[0]).count()
-                for status in Order.STATUS_CHOICES
+                label: totals['by_status'][value]
+                for value, label in Order.STATUS_CHOICES
             }
         }
         
@@ -825,6 +1000,7 @@ class ReviewManagementView(generics.ListAPIView):
     permission_classes = [IsAuthenticated, IsOwnerOrWorker]
     serializer_class = ReviewSerializer
     queryset = Review.objects.all()
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         queryset = Review.objects.select_related('user', 'product').order_by('-created_at')
@@ -877,18 +1053,12 @@ class EnhancedOrderStatsView(APIView):
     permission_classes = [IsAuthenticated, IsOwnerOrWorker]
     
     def get(self, request):
-        today = date.today()
-        yesterday = today - timedelta(days=1)
-        last_month = today - timedelta(days=30)
-        
-        # Today's stats
-        today_orders = Order.objects.filter(created_at__date=today)
-        yesterday_orders = Order.objects.filter(created_at__date=yesterday)
-        last_month_orders = Order.objects.filter(created_at__date__gte=last_month)
+        # Order figures come from the daily rollup, not the order history
+        totals = rollups.order_dashboard_totals()
         
         # Calculate growth
-        revenue_today = sum(order.final_total for order in today_orders)
-        revenue_yesterday = sum(order.final_total for order in yesterday_orders)
+        revenue_today = totals['revenue_today']
+        revenue_yesterday = totals['revenue_yesterday']
         
         monthly_growth = 0
         if revenue_yesterday > 0:
@@ -901,9 +1071,9 @@ class EnhancedOrderStatsView(APIView):
             'monthly_growth': round(monthly_growth, 1),
             
             # Orders
-            'total_orders_today': today_orders.count(),
-            'pending_orders': Order.objects.filter(status='pending').count(),
-            'completed_orders_today': today_orders.filter(status='completed').count(),
+            'total_orders_today': totals['orders_today'],
+            'pending_orders': totals['by_status'][Order.PENDING],
+            'completed_orders_today': totals['completed_today'],
             
             # Products
             'low_stock_products': Product.objects.filter(stock_quantity__lte=5, is_active=True).count(),
@@ -913,8 +1083,8 @@ class EnhancedOrderStatsView(APIView):
             
             # Order status breakdown
             'orders_by_status': {
-                status[1]: Order.objects.filter(status=status[0]).count()
-                for status in Order.STATUS_CHOICES
+                label: totals['by_status'][value]
+                for value, label in Order.STATUS_CHOICES
             }
         }
         
@@ -948,56 +1118,46 @@ class RoleSpecificDashboardData(APIView):
     
     def get_user_role(self, user):
         """Determine user's specific role"""
-        if user.is_superuser or user.groups.filter(name='Owner').exists():
-            return 'owner'
-        elif user.groups.filter(name='Chef').exists():
-            return 'chef'
-        elif user.groups.filter(name='Waiter').exists():
-            return 'waiter'
-        elif user.groups.filter(name='Cashier').exists():
-            return 'cashier'
-        elif user.groups.filter(name='Butcher').exists():
-            return 'butcher'
-        elif user.groups.filter(name='Worker').exists():
-            return 'worker'
-        return 'customer'
+        return get_user_role(user)
     
     def get_role_stats(self, role, today):
         """Get statistics specific to each role"""
-        today_orders = Order.objects.filter(created_at__date=today)
+        if role == 'butcher':
+            totals = None
+        else:
+            # Order figures come from the daily rollup, not the order history
+            totals = rollups.order_dashboard_totals(today)
+            by_status = totals['by_status']
         
         if role == 'owner':
             return {
-                'totalRevenue': float(sum(order.final_total for order in today_orders)),
-                'totalOrders': today_orders.count(),
-                'pendingOrders': Order.objects.filter(status='pending').count(),
-                'completedOrders': today_orders.filter(status='completed').count(),
+                'totalRevenue': float(totals['revenue_today']),
+                'totalOrders': totals['orders_today'],
+                'pendingOrders': by_status['pending'],
+                'completedOrders': totals['completed_today'],
                 'lowStockProducts': Product.objects.filter(stock_quantity__lte=5, is_active=True).count(),
             }
         
         elif role == 'chef':
             return {
-                'pendingOrders': Order.objects.filter(status='pending').count(),
-                'preparingOrders': Order.objects.filter(status='preparing').count(),
-                'readyOrders': Order.objects.filter(status='ready').count(),
-                'totalOrders': Order.objects.filter(status__in=['pending', 'preparing']).count(),
+                'pendingOrders': by_status['pending'],
+                'preparingOrders': by_status['preparing'],
+                'readyOrders': by_status['ready'],
+                'totalOrders': by_status['pending'] + by_status['preparing'],
             }
         
         elif role == 'waiter':
             return {
-                'activeOrders': Order.objects.filter(status__in=['pending', 'preparing', 'ready']).count(),
-                'readyOrders': Order.objects.filter(status='ready').count(),
-                'physicalSalesToday': Order.objects.filter(
-                    order_type='offline', 
-                    created_at__date=today
-                ).count(),
+                'activeOrders': by_status['pending'] + by_status['preparing'] + by_status['ready'],
+                'readyOrders': by_status['ready'],
+                'physicalSalesToday': totals['offline_today'],
             }
         
         elif role == 'cashier':
             return {
-                'totalRevenue': float(sum(order.final_total for order in today_orders)),
+                'totalRevenue': float(totals['revenue_today']),
                 'pendingPayments': Order.objects.filter(status='pending', payment_verified=False).count(),
-                'completedTransactions': today_orders.filter(status='completed').count(),
+                'completedTransactions': totals['completed_today'],
             }
         
         elif role == 'butcher':
@@ -1015,10 +1175,169 @@ class RoleSpecificDashboardData(APIView):
         
         else:  # worker or fallback
             return {
-                'pendingOrders': Order.objects.filter(status='pending').count(),
+                'pendingOrders': by_status['pending'],
                 'activeTasks': 5,
             }
 
 
 
+class OrderFeedMixin:
+    """Shared cursor / station handling of the live order board endpoints"""
+    permission_classes = [IsAuthenticated, IsStaff]
+    
+    def get_feed_params(self, request):
+        """(cursor, station, error response)"""
+        allowed = order_feed.ROLE_STATIONS.get(get_user_role(request.user), ())
+        station = request.query_params.get('station') or (allowed[0] if allowed else None)
+        if station not in order_feed.STATIONS:
+            return None, None, Response(
+                {'error': f'Unknown station. Choose from: {", ".join(order_feed.STATIONS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if station not in allowed:
+            return None, None, Response(
+                {'error': 'Your role cannot watch this station.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        # EventSource resends the last id it saw as Last-Event-ID on reconnect
+        cursor = request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('after')
+        if cursor in (None, ''):
+            return order_feed.latest_event_id(), station, None
+        try:
+            return max(int(cursor), 0), station, None
+        except ValueError:
+            return None, None, Response(
+                {'error': 'after must be an event id.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    def is_asgi(self, request):
+        return isinstance(request._request, ASGIRequest)
+
+
+class OrderFeedTokenView(APIView):
+    """Feed token for ?token= on OrderEventStreamView, fetch a new one when the stream gets a 401"""
+    permission_classes = [IsAuthenticated, IsStaff]
+    
+    def post(self, request):
+        return Response({
+            'token': issue_order_feed_token(request.user),
+            'expires_in': getattr(settings, 'ORDER_FEED_TOKEN_TTL', 300),
+        })
+
+
+class OrderEventStreamView(OrderFeedMixin, APIView):
+    """Server-sent events of order create / status / payment changes for the order boards"""
+    authentication_classes = [JWTAuthentication, OrderFeedTokenAuthentication]
+    renderer_classes = [JSONRenderer, order_feed.EventStreamRenderer]
+    
+    def get(self, request):
+        cursor, station, error = self.get_feed_params(request)
+        if error:
+            return error
+        
+        if self.is_asgi(request):
+            stream = order_feed.sse_stream_async(cursor, station)
+        else:
+            stream = order_feed.sse_stream(cursor, station)
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class OrderEventPollView(OrderFeedMixin, APIView):
+    """Long-poll fallback of OrderEventStreamView, returns as soon as there are new events"""
+    
+    def get(self, request):
+        cursor, station, error = self.get_feed_params(request)
+        if error:
+            return error
+        
+        max_timeout = getattr(settings, 'ORDER_FEED_LONG_POLL_TIMEOUT', 25)
+        try:
+            timeout = min(float(request.query_params.get('timeout', max_timeout)), max_timeout)
+        except ValueError:
+            timeout = max_timeout
+        
+        if self.is_asgi(request):
+            response = StreamingHttpResponse(
+                order_feed.long_poll_async(cursor, station, timeout),
+                content_type='application/json'
+            )
+            response['Cache-Control'] = 'no-cache'
+            return response
+        
+        events = order_feed.broker.wait(cursor, timeout)
+        return Response(order_feed.poll_body(cursor, station, events))
+
+
+class SyncView(APIView):
+    """
+    Base of the "changes since" endpoints
+    - ?since=<watermark from the last response>, omit it for the initial sync
+    - Repeat with the returned watermark while has_more is true
+    """
+    permission_classes = [IsAuthenticated, IsStaff]
+    
+    def get_sync_sections(self):
+        raise NotImplementedError
+    
+    def get(self, request):
+        try:
+            since = sync.parse_watermark(request.query_params.get('since'))
+        except ValueError:
+            return Response(
+                {'error': 'since must be a watermark returned by this endpoint.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        max_limit = getattr(settings, 'SYNC_PAGE_SIZE', 500)
+        try:
+            limit = min(int(request.query_params.get('limit', max_limit)), max_limit)
+        except ValueError:
+            limit = max_limit
+        
+        try:
+            data = sync.collect_changes(
+                self.get_sync_sections(), since, max(limit, 1), {'request': request}
+            )
+        except sync.SyncWatermarkExpired:
+            return Response(
+                {'error': 'Watermark is too old, sync again without since.'},
+                status=status.HTTP_410_GONE
+            )
+        return Response(data)
+
+
+class OrderSyncView(SyncView):
+    """Orders and order items created, changed or deleted since the watermark"""
+    
+    def get_sync_sections(self):
+        return [
+            sync.SyncSection(
+                'orders',
+                Order.objects.select_related('user', 'payment_verified_by'),
+                OrderSyncSerializer,
+                'Order'
+            ),
+            sync.SyncSection(
+                'order_items',
+                OrderItem.objects.select_related('product'),
+                OrderItemSyncSerializer,
+                'OrderItem'
+            ),
+        ]
+
+
+class ProductSyncView(SyncView):
+    """Products created, changed or deleted since the watermark"""
+    
+    def get_sync_sections(self):
+        return [
+            sync.SyncSection('products', Product.objects.select_related('category'), ProductSerializer, 'Product'),
+        ]
+
+
 ########################################################################
\ No newline at end of file
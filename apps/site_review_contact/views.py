@@ -16,6 +16,7 @@ from .serializers import (
 )
 from apps.products.permissions import IsOwnerOrWorker, IsOwner, IsWorker
 from apps.products.models import ActivityLog
+from apps.products.conditional import ConditionalGetMixin
 
 
 def log_activity(user, action, model_name, object_id='', description='', old_value='', new_value='', request=None):
@@ -34,7 +35,7 @@ def log_activity(user, action, model_name, object_id='', description='', old_val
 
 
 # Public Views (No authentication required)
-class SiteReviewListView(generics.ListAPIView):
+class SiteReviewListView(ConditionalGetMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = SiteReviewSerializer
     
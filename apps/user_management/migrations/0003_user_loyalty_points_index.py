@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user_management', '0002_user_loyalty_points'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-loyalty_points', '-id'], name='user_loyalty_points_id_idx'),
+        ),
+    ]
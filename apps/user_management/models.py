@@ -65,6 +65,7 @@ class User(AbstractUser):
     email_verification_otp = models.CharField(max_length=6, blank=True, null=True)
     otp_created_at = models.DateTimeField(blank=True, null=True)
     loyalty_points = models.IntegerField(default=0, help_text="Loyalty points earned from orders")
+    updated_at = models.DateTimeField(auto_now=True)
 
     # Set email as the USERNAME_FIELD
     USERNAME_FIELD = 'email'
@@ -77,6 +78,9 @@ class User(AbstractUser):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            models.Index(fields=['-loyalty_points', '-id'], name='user_loyalty_points_id_idx'),
+        ]
 
     # Add these properties to resolve the reverse accessor conflicts
     groups = models.ManyToManyField(
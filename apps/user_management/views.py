@@ -19,6 +19,7 @@ from apps.products.models import Order
 
 from apps.products.views import log_activity
 from apps.products.permissions import IsOwnerOrWorker
+from apps.products.pagination import KeysetPagination
 # from .permissions import IsOwnerOrWorker
 
 import logging
@@ -133,7 +134,7 @@ class LoyaltyProfileView(APIView):
         response_data = {
             'user': UserSerializer(user).data,
             'loyalty_summary': loyalty_summary,
-            'qualifying_orders_count': qualifying_orders.count(),
+            'qualifying_orders_count': loyalty_summary['qualifying_orders_count'],
             'recent_qualifying_orders': [
                 {
                     'order_number': order.order_number,
@@ -151,9 +152,10 @@ class LoyaltyProfileView(APIView):
 class AdminLoyaltyUsersView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrWorker]
     serializer_class = UserSerializer
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        queryset = User.objects.all().order_by('-loyalty_points')
+        queryset = User.objects.prefetch_related('groups').order_by('-loyalty_points')
         
         # Filters
         tier = self.request.query_params.get('tier')
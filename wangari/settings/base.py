@@ -144,6 +144,93 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
 }
 
+# Keyset pagination for the large admin/history list endpoints
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 200))
+
+# Cache
+# Local memory by default; prod.py switches to a file cache shared by all workers
+# Working carts get their own alias so catalog entries can't evict them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'wangari-default',
+    },
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'wangari-carts',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Public catalog response cache (invalidated through a catalog version counter)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# Owner analytics snapshots, served stale past the TTL while a background refresh runs
+ANALYTICS_CACHE_ALIAS = 'default'
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 60))
+ANALYTICS_CACHE_MAX_AGE = 60 * 60  # older snapshots are recomputed inline
+ANALYTICS_REFRESH_LOCK_TIMEOUT = 300
+
+# Product search index (SQLite FTS5 shadow table, icontains fallback elsewhere)
+PRODUCT_SEARCH_BACKEND = 'apps.products.search.SQLiteFTSSearchBackend'
+PRODUCT_SEARCH_LIMIT = 200
+
+# Working cart store: 'database' (Cart/CartItem on every change) or 'cache'
+# (kept in CART_CACHE_ALIAS, written behind to the tables, flushed at checkout)
+CART_STORE = os.getenv('CART_STORE', 'database')
+CART_CACHE_ALIAS = os.getenv('CART_CACHE_ALIAS', 'carts')
+CART_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Idempotency-Key replay window for order creation (seconds)
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 60  # seconds before a key left in flight can be claimed again
+
+# Numbers each process reserves at once from a SequenceCounter (order numbers)
+SEQUENCE_BLOCK_SIZE = 20
+
+# Order outbox processed by `manage.py process_outbox`
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_LOCK_TIMEOUT = 300  # seconds before a claimed event is retried
+OUTBOX_RETENTION_DAYS = 7  # done events are deleted by `manage.py purge_outbox_events`
+
+# Live order board feed (products/admin/orders/events/), stream it from the ASGI app
+ORDER_FEED_POLL_INTERVAL = 0.5  # seconds between outbox polls while screens are connected
+ORDER_FEED_BUFFER = 1000
+ORDER_FEED_BATCH_SIZE = 200
+ORDER_FEED_HEARTBEAT = 15
+ORDER_FEED_STREAM_TIMEOUT = 300  # ASGI, the browser reconnects with Last-Event-ID
+ORDER_FEED_WSGI_STREAM_TIMEOUT = 25  # WSGI (passenger) streams hold a worker thread
+ORDER_FEED_TOKEN_TTL = 300  # ?token= feed tokens from products/admin/orders/events/token/
+ORDER_FEED_RETRY_MS = 2000
+ORDER_FEED_LONG_POLL_TIMEOUT = 25
+
+# "Changes since" sync endpoints (products/admin/sync/...)
+SYNC_PAGE_SIZE = 500
+SYNC_SETTLE_SECONDS = 2  # rows this recent wait for the next sync, in case their transaction is still open
+SYNC_TOMBSTONE_TTL_DAYS = 30  # older watermarks get 410 and resync from scratch
+
+# In-process background worker pool (image variants, etc.)
+BACKGROUND_TASK_WORKERS = int(os.getenv('BACKGROUND_TASK_WORKERS', 2))
+BACKGROUND_TASKS_EAGER = os.getenv('BACKGROUND_TASKS_EAGER', 'False') == 'True'
+
+# Static menu artifact, re-published under STATIC_ROOT/menu on catalog changes
+MENU_PUBLISH_ENABLED = os.getenv('MENU_PUBLISH_ENABLED', 'True') == 'True'
+MENU_PUBLISH_ROOT = os.getenv('MENU_PUBLISH_ROOT')
+MENU_MEDIA_BASE_URL = os.getenv('MENU_MEDIA_BASE_URL', '')
+MENU_KEEP_VERSIONS = 3
+MENU_PUBLISH_DELAY = 10  # seconds, catalog changes inside the window share one publish
+
+# Widths of the resized product/category images
+IMAGE_VARIANT_WIDTHS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
@@ -31,6 +31,21 @@ DATABASES = {
 
 
 
+# Cache - file based so every passenger worker sees the same catalog version
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'django_cache')),
+    },
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CART_CACHE_DIR', os.path.join(BASE_DIR, 'django_cache_carts')),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+
 # Correct Static Files Configuration
 STATIC_URL = '/static/'
 STATIC_ROOT = '/home/pldassociationor/public_html/static_3'  # Changed to public_html